@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.schemas import NewsItem
+from app.utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "gen_cache"
+# Sorted set "ключ -> время последнего обращения" для ограничения размера кэша (LRU)
+CACHE_INDEX_KEY = "gen_cache:index"
+CACHE_STATS_KEY = "gen_cache:stats"
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def build_generation_key(news: NewsItem, system_message: str, prompt_version: str, provider: str, model: str) -> str:
+    """
+    Ключ кэша: хеш от (id новости + дайджест заголовка/описания, системный промпт,
+    версия шаблона промпта, провайдер, модель). Любое изменение входа даёт новый ключ.
+    """
+    content_digest = _sha256(f"{news.title}\n{news.summary}")
+    payload = json.dumps(
+        [news.id, content_digest, _sha256(system_message), prompt_version, provider, model],
+        ensure_ascii=False,
+    )
+    return _sha256(payload)
+
+
+def get_cached_generation(key: str) -> str | None:
+    """
+    Возвращает сохранённый результат генерации и обновляет счётчики попаданий/промахов.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        text = client.get(f"{CACHE_KEY_PREFIX}:{key}")
+        pipe = client.pipeline()
+        if text is not None:
+            pipe.zadd(CACHE_INDEX_KEY, {key: time.time()})
+            pipe.hincrby(CACHE_STATS_KEY, "hits", 1)
+        else:
+            pipe.hincrby(CACHE_STATS_KEY, "misses", 1)
+        pipe.execute()
+        return text
+    except RedisError as e:
+        logger.error(f"Redis error in get_cached_generation: {e}")
+        return None
+
+
+def save_cached_generation(key: str, text: str) -> None:
+    """
+    Сохраняет результат генерации с TTL и вытесняет самые давно использованные записи
+    при превышении GENERATION_CACHE_MAX_ITEMS.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    now = time.time()
+    try:
+        pipe = client.pipeline()
+        pipe.set(f"{CACHE_KEY_PREFIX}:{key}", text, ex=settings.generation_cache_ttl)
+        pipe.zadd(CACHE_INDEX_KEY, {key: now})
+        # Записи старше TTL уже удалены Redis — убираем их и из индекса
+        pipe.zremrangebyscore(CACHE_INDEX_KEY, 0, now - settings.generation_cache_ttl)
+        pipe.zcard(CACHE_INDEX_KEY)
+        size = pipe.execute()[-1]
+
+        overflow = size - settings.generation_cache_max_items
+        if overflow > 0:
+            evicted = [member for member, _ in client.zpopmin(CACHE_INDEX_KEY, overflow)]
+            client.delete(*[f"{CACHE_KEY_PREFIX}:{member}" for member in evicted])
+            client.hincrby(CACHE_STATS_KEY, "evictions", len(evicted))
+    except RedisError as e:
+        logger.error(f"Redis error in save_cached_generation: {e}")
+
+
+def get_generation_cache_stats() -> dict:
+    """
+    Возвращает статистику кэша генераций: попадания, промахи, доля попаданий и размер.
+    """
+    client = get_redis_client()
+    if client is None:
+        return {}
+    try:
+        stats = client.hgetall(CACHE_STATS_KEY)
+        size = client.zcard(CACHE_INDEX_KEY)
+    except RedisError as e:
+        logger.error(f"Redis error in get_generation_cache_stats: {e}")
+        return {}
+
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "evictions": int(stats.get("evictions", 0)),
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "size": size,
+        "max_items": settings.generation_cache_max_items,
+        "ttl": settings.generation_cache_ttl,
+    }
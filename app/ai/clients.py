@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+import httpx
+from groq import AsyncGroq
+from openai import AsyncOpenAI
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Реестр долгоживущих клиентов: один клиент на провайдера в каждом event loop.
+# httpx-пул соединений привязан к циклу, в котором создан, поэтому ключ — сам цикл.
+_clients: dict[asyncio.AbstractEventLoop, dict[str, AsyncOpenAI | AsyncGroq]] = {}
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """
+    Создаёт httpx-клиент с keep-alive пулом соединений и таймаутами из настроек.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.ai_http_max_connections,
+            max_keepalive_connections=settings.ai_http_max_keepalive,
+            keepalive_expiry=settings.ai_http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(settings.ai_http_timeout, connect=settings.ai_http_connect_timeout),
+        follow_redirects=True,
+    )
+
+
+def _create_client(provider: str) -> AsyncOpenAI | AsyncGroq:
+    if provider == "groq":
+        return AsyncGroq(
+            api_key=settings.groq_api_key,
+            base_url=settings.groq_base_url,
+            http_client=_build_http_client(),
+        )
+    if provider == "deepseek":
+        return AsyncOpenAI(
+            api_key=settings.deepseek_api_key,
+            base_url=settings.deepseek_base_url,
+            http_client=_build_http_client(),
+        )
+    if provider == "openai":
+        return AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            http_client=_build_http_client(),
+        )
+    raise ValueError(f"Unknown AI provider '{provider}'")
+
+
+def build_messages(system_message: str, prompt: str, history: list[dict] | None = None) -> list[dict]:
+    """
+    Сообщения запроса chat.completions: системный промпт, история диалога (если есть) и запрос.
+    """
+    return [
+        {"role": "system", "content": system_message},
+        *(history or []),
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _prune_closed_loops() -> None:
+    # Циклы, завершённые через asyncio.run(), больше не могут использовать свои соединения
+    for loop in [loop for loop in _clients if loop.is_closed()]:
+        _clients.pop(loop, None)
+
+
+def get_ai_client(provider: str) -> AsyncOpenAI | AsyncGroq:
+    """
+    Возвращает долгоживущий клиент провайдера для текущего event loop (создаёт при первом вызове).
+    """
+    loop = asyncio.get_running_loop()
+    _prune_closed_loops()
+    loop_clients = _clients.setdefault(loop, {})
+    client = loop_clients.get(provider)
+    if client is None:
+        client = _create_client(provider)
+        loop_clients[provider] = client
+        logger.info(f"Created pooled {provider} client (max connections: {settings.ai_http_max_connections})")
+    return client
+
+
+async def close_ai_clients() -> None:
+    """
+    Закрывает клиенты текущего event loop. Вызывается при остановке бота, API и задач Celery.
+    """
+    loop_clients = _clients.pop(asyncio.get_running_loop(), {})
+    for provider, client in loop_clients.items():
+        try:
+            await client.close()
+            logger.info(f"Closed pooled {provider} client")
+        except Exception as e:
+            logger.warning(f"Error while closing {provider} client: {e}")
+
+
+def shutdown_ai_clients() -> None:
+    """
+    Синхронная остановка для сигналов Celery: закрывает клиенты во всех ещё живых циклах.
+    """
+    for loop in list(_clients):
+        if loop.is_closed():
+            _clients.pop(loop, None)
+        elif loop.is_running():
+            # Цикл работает в другом потоке — закрываем клиенты внутри него
+            future = asyncio.run_coroutine_threadsafe(close_ai_clients(), loop)
+            try:
+                future.result(timeout=10)
+            except Exception as e:
+                logger.warning(f"Error while closing AI clients: {e}")
+        else:
+            loop.run_until_complete(close_ai_clients())
+    _clients.clear()
@@ -1,35 +1,87 @@
 import logging
-from openai import AsyncOpenAI
+from typing import AsyncIterator
 from app.config import settings
+from app.ai.clients import get_ai_client, build_messages
+from app.ai.ratelimit import provider_slot, note_rate_limit_headers, note_rate_limit_error, note_token_usage
+from app.ai.tokens import estimate_messages_tokens, fit_output_tokens, reserved_tokens
 
 logger = logging.getLogger(__name__)
 
-async def generate_text_deepseek(prompt: str, system_message: str = "You are a helpful assistant.") -> str | None:
+async def generate_text_deepseek(prompt: str, system_message: str = "You are a helpful assistant.", max_tokens: int | None = None, history: list[dict] | None = None) -> str | None:
     """
     Генерация текста с использованием DeepSeek API.
+    max_tokens ограничивает длину ответа (по умолчанию — бюджет ответа провайдера),
+    history — предыдущие сообщения диалога (между системным промптом и запросом).
     """
     if not settings.deepseek_api_key:
         logger.error("DeepSeek API key is not configured. Skipping.")
         return None
 
     try:
-        async with AsyncOpenAI(
-            api_key=settings.deepseek_api_key,
-            base_url=settings.deepseek_base_url
-        ) as client:
-            response = await client.chat.completions.create(
+        # Долгоживущий клиент с пулом соединений (без нового TLS-рукопожатия на каждый запрос)
+        client = get_ai_client("deepseek")
+        messages = build_messages(system_message, prompt, history)
+        prompt_tokens = estimate_messages_tokens(messages)
+        max_tokens = fit_output_tokens("deepseek", prompt_tokens, max_tokens)
+        reserved = reserved_tokens(prompt_tokens, max_tokens)
+        # Ждём слот в общей квоте провайдера (запросы/мин, токены/мин, одновременные запросы)
+        async with provider_slot("deepseek", reserved):
+            raw_response = await client.chat.completions.with_raw_response.create(
                 model=settings.deepseek_model,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=messages,
                 temperature=0.7,
+                max_tokens=max_tokens,
             )
-            result = response.choices[0].message.content
-            if result:
-                logger.info(f"Successfully generated text with DeepSeek ({len(result)} chars)")
-            return result
+        note_rate_limit_headers("deepseek", raw_response.headers)
+        response = raw_response.parse()
+        note_token_usage("deepseek", response.usage, reserved)
+        result = response.choices[0].message.content
+        if result:
+            logger.info(f"Successfully generated text with DeepSeek ({len(result)} chars)")
+        return result
 
     except Exception as e:
+        note_rate_limit_error("deepseek", e)
         logger.error(f"Error during DeepSeek AI text generation: {str(e)}")
         return None
+
+
+async def stream_text_deepseek(prompt: str, system_message: str = "You are a helpful assistant.", max_tokens: int | None = None, history: list[dict] | None = None) -> AsyncIterator[str]:
+    """
+    Генерирует текст с помощью DeepSeek в режиме стриминга: отдаёт части ответа по мере генерации.
+    При ошибке завершает поток (уже отданные части остаются у вызывающего).
+    """
+    if not settings.deepseek_api_key:
+        logger.error("DeepSeek API key is not configured. Skipping.")
+        return
+
+    try:
+        client = get_ai_client("deepseek")
+        messages = build_messages(system_message, prompt, history)
+        prompt_tokens = estimate_messages_tokens(messages)
+        max_tokens = fit_output_tokens("deepseek", prompt_tokens, max_tokens)
+        reserved = reserved_tokens(prompt_tokens, max_tokens)
+        # Слот провайдера занят, пока читается стрим
+        async with provider_slot("deepseek", reserved):
+            raw_response = await client.chat.completions.with_raw_response.create(
+                model=settings.deepseek_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                stream=True,
+                # Последний чанк стрима содержит usage (без choices)
+                stream_options={"include_usage": True},
+            )
+            note_rate_limit_headers("deepseek", raw_response.headers)
+            stream = raw_response.parse()
+            async for chunk in stream:
+                if chunk.usage:
+                    note_token_usage("deepseek", chunk.usage, reserved)
+                if chunk.choices:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        yield content
+
+    except Exception as e:
+        note_rate_limit_error("deepseek", e)
+        logger.error(f"Error during DeepSeek text streaming: {str(e)}")
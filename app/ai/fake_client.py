@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+import httpx
+
+from app.config import settings
+from app.ai.clients import build_messages
+from app.ai.ratelimit import provider_slot, note_rate_limit_error, note_token_usage
+from app.ai.tokens import CHARS_PER_TOKEN, estimate_tokens, estimate_messages_tokens, fit_output_tokens, reserved_tokens
+
+logger = logging.getLogger(__name__)
+
+# Фейковый провайдер для нагрузочных тестов и замеров без сети: одинаковый запрос всегда даёт
+# одинаковый ответ, а задержки и ошибки берутся из генератора с фиксированным seed,
+# поэтому последовательность прогонов воспроизводима.
+_rng = random.Random(settings.fake_ai_seed)
+
+_FILLER_WORDS = (
+    "технологии", "разработчики", "релиз", "обновление", "производительность", "безопасность",
+    "инфраструктура", "сообщество", "open-source", "нейросети", "облако", "данные",
+)
+
+
+class FakeProviderError(Exception):
+    """
+    Ошибка фейкового провайдера в том же виде, что и ошибки SDK (status_code, response.headers),
+    чтобы её обрабатывали те же ветки ограничителя и маршрутизатора.
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after: float | None = None):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+        headers = {"retry-after": f"{retry_after:g}"} if retry_after else {}
+        self.response = httpx.Response(status_code, headers=headers)
+
+
+def reset_fake_rng(seed: int | None = None) -> None:
+    """
+    Перезапускает генератор задержек и ошибок (для повторяемых замеров).
+    """
+    _rng.seed(settings.fake_ai_seed if seed is None else seed)
+
+
+def sample_latency() -> float:
+    """
+    Полное время ответа в секундах по распределению FAKE_AI_LATENCY_DISTRIBUTION:
+    fixed — всегда FAKE_AI_LATENCY_MS; uniform — равномерно в ±FAKE_AI_LATENCY_SIGMA долях;
+    lognormal — логнормальное с медианой FAKE_AI_LATENCY_MS (длинный хвост, как у реальных API).
+    """
+    base = settings.fake_ai_latency_ms / 1000
+    sigma = settings.fake_ai_latency_sigma
+    distribution = settings.fake_ai_latency_distribution.lower()
+    if distribution == "fixed":
+        return base
+    if distribution == "uniform":
+        return max(0.0, _rng.uniform(base * (1 - sigma), base * (1 + sigma)))
+    return base * math.exp(_rng.gauss(0, sigma))
+
+
+def sample_failure() -> FakeProviderError | None:
+    """
+    Случайная ошибка с вероятностями FAKE_AI_RATE_LIMIT_RATE (429) и FAKE_AI_ERROR_RATE (500).
+    """
+    roll = _rng.random()
+    if roll < settings.fake_ai_rate_limit_rate:
+        return FakeProviderError(429, "Rate limit reached (fake provider)", settings.fake_ai_retry_after)
+    if roll < settings.fake_ai_rate_limit_rate + settings.fake_ai_error_rate:
+        return FakeProviderError(500, "Internal server error (fake provider)")
+    return None
+
+
+def _fake_text(seed: str, subject: str, chars: int) -> str:
+    words_rng = random.Random(seed)
+    words = [words_rng.choice(_FILLER_WORDS) for _ in range(chars // 8)]
+    text = f"🧪 {subject}\n\nТестовый ответ #{seed[:8]}: " + " ".join(words)
+    return text[:chars].rstrip()
+
+
+def build_fake_completion(messages: list[dict], max_tokens: int | None = None) -> str:
+    """
+    Детерминированный ответ на список сообщений. Для пакетного промпта постов
+    возвращает JSON {"posts": [...]} с теми же id, чтобы проходил разбор пакета.
+    """
+    digest = hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    prompt = messages[-1]["content"] if messages else ""
+    limit_chars = int((max_tokens or 2048) * CHARS_PER_TOKEN)
+
+    batch_ids = re.findall(r"\[id: (\w+)\]", prompt)
+    if batch_ids and '"posts"' in prompt:
+        per_post = max(40, limit_chars // len(batch_ids) - 40)
+        posts = [
+            {"id": batch_id, "text": _fake_text(f"{digest}{batch_id}", f"Новость {batch_id}", min(per_post, 400))}
+            for batch_id in batch_ids
+        ]
+        return json.dumps({"posts": posts}, ensure_ascii=False)
+
+    title = re.search(r"Заголовок: (.+)", prompt)
+    lines = prompt.strip().splitlines()
+    subject = title.group(1) if title else (lines[0][:80] if lines else "")
+    return _fake_text(digest, subject, min(limit_chars, 400))
+
+
+def split_into_chunks(text: str, chunk_chars: int) -> list[str]:
+    chunk_chars = max(1, chunk_chars)
+    return [text[index:index + chunk_chars] for index in range(0, len(text), chunk_chars)]
+
+
+def _usage(prompt_tokens: int, text: str) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(text))
+
+
+async def generate_text_fake(prompt: str, system_message: str = "You are a helpful assistant.", max_tokens: int | None = None, history: list[dict] | None = None) -> str | None:
+    """
+    Генерирует текст фейковым провайдером (без сети): задержка и ошибки по настройкам FAKE_AI_*.
+    """
+    try:
+        messages = build_messages(system_message, prompt, history)
+        prompt_tokens = estimate_messages_tokens(messages)
+        max_tokens = fit_output_tokens("fake", prompt_tokens, max_tokens)
+        reserved = reserved_tokens(prompt_tokens, max_tokens)
+        async with provider_slot("fake", reserved):
+            await asyncio.sleep(sample_latency())
+            failure = sample_failure()
+            if failure:
+                raise failure
+        result = build_fake_completion(messages, max_tokens)
+        note_token_usage("fake", _usage(prompt_tokens, result), reserved)
+        logger.info(f"Successfully generated text with Fake provider ({len(result)} chars)")
+        return result
+
+    except Exception as e:
+        note_rate_limit_error("fake", e)
+        logger.error(f"Error during Fake AI text generation: {str(e)}")
+        return None
+
+
+async def stream_text_fake(prompt: str, system_message: str = "You are a helpful assistant.", max_tokens: int | None = None, history: list[dict] | None = None) -> AsyncIterator[str]:
+    """
+    Стриминг фейкового провайдера: первая часть через FAKE_AI_TTFT_MS, остальные
+    кусками по FAKE_AI_CHUNK_CHARS символов равномерно до конца выбранной задержки.
+    """
+    try:
+        messages = build_messages(system_message, prompt, history)
+        prompt_tokens = estimate_messages_tokens(messages)
+        max_tokens = fit_output_tokens("fake", prompt_tokens, max_tokens)
+        reserved = reserved_tokens(prompt_tokens, max_tokens)
+        async with provider_slot("fake", reserved):
+            latency = sample_latency()
+            ttft = min(latency, settings.fake_ai_ttft_ms / 1000)
+            await asyncio.sleep(ttft)
+            failure = sample_failure()
+            if failure:
+                raise failure
+
+            result = build_fake_completion(messages, max_tokens)
+            chunks = split_into_chunks(result, settings.fake_ai_chunk_chars)
+            interval = (latency - ttft) / max(1, len(chunks) - 1)
+            for index, chunk in enumerate(chunks):
+                if index:
+                    await asyncio.sleep(interval)
+                yield chunk
+        note_token_usage("fake", _usage(prompt_tokens, result), reserved)
+
+    except Exception as e:
+        note_rate_limit_error("fake", e)
+        logger.error(f"Error during Fake AI streaming: {str(e)}")
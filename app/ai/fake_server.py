@@ -0,0 +1,132 @@
+"""
+Локальный OpenAI-совместимый сервер-заглушка для замеров без сети.
+
+Отвечает на POST /v1/chat/completions (OpenAI, DeepSeek) и /openai/v1/chat/completions (Groq)
+детерминированными ответами с задержками и ошибками по настройкам FAKE_AI_*, поддерживает
+stream=True (SSE) и usage. Настоящие клиенты провайдеров направляются на него через base url:
+
+    python -m app.ai.fake_server --port 8099
+    OPENAI_BASE_URL=http://localhost:8099/v1 OPENAI_API_KEY=fake
+    GROQ_BASE_URL=http://localhost:8099 GROQ_API_KEY=fake
+
+Так измеряются пулы соединений, ограничение частоты, hedging и кэш с реальным HTTP.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.ai.fake_client import (
+    build_fake_completion, sample_failure, sample_latency, split_into_chunks, reset_fake_rng,
+)
+from app.ai.tokens import estimate_tokens, estimate_messages_tokens
+from app.config import settings
+
+app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+
+def _usage(messages: list[dict], text: str) -> dict:
+    prompt_tokens = estimate_messages_tokens(messages)
+    completion_tokens = estimate_tokens(text)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason: str | None = None) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    model = body.get("model", "fake-model")
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    latency = sample_latency()
+    failure = sample_failure()
+    if failure:
+        # Ошибка приходит быстрее обычного ответа, как у настоящих API
+        await asyncio.sleep(min(latency, settings.fake_ai_ttft_ms / 1000))
+        return JSONResponse(
+            status_code=failure.status_code,
+            content={"error": {"message": str(failure), "type": "fake_error", "code": failure.status_code}},
+            headers=dict(failure.response.headers),
+        )
+
+    text = build_fake_completion(messages, max_tokens)
+    usage = _usage(messages, text)
+
+    if not body.get("stream"):
+        await asyncio.sleep(latency)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    async def events():
+        ttft = min(latency, settings.fake_ai_ttft_ms / 1000)
+        await asyncio.sleep(ttft)
+        chunks = split_into_chunks(text, settings.fake_ai_chunk_chars)
+        interval = (latency - ttft) / max(1, len(chunks) - 1)
+        for index, content in enumerate(chunks):
+            if index:
+                await asyncio.sleep(interval)
+            delta = {"role": "assistant", "content": content} if index == 0 else {"content": content}
+            yield f"data: {json.dumps(_chunk(completion_id, model, delta), ensure_ascii=False)}\n\n"
+        final = _chunk(completion_id, model, {}, "stop")
+        # Groq присылает usage в x_groq последнего чанка
+        final["x_groq"] = {"usage": usage}
+        yield f"data: {json.dumps(final)}\n\n"
+        if include_usage:
+            usage_chunk = _chunk(completion_id, model, {})
+            usage_chunk["choices"] = []
+            usage_chunk["usage"] = usage
+            yield f"data: {json.dumps(usage_chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/reset")
+async def reset(seed: int | None = None):
+    """
+    Перезапускает генератор задержек и ошибок, чтобы повторить прогон с той же последовательностью.
+    """
+    reset_fake_rng(seed)
+    return {"status": "ok", "seed": settings.fake_ai_seed if seed is None else seed}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,115 +1,421 @@
+import asyncio
+import hashlib
+import json
 import logging
+from typing import AsyncIterator
 from app.schemas import NewsItem
 from app.config import settings
-from app.ai.openai_client import generate_text_openai
-from app.ai.groqai_client import generate_text_groq
-from app.ai.deepseek_client import generate_text_deepseek
+from app.ai.router import route_generation, route_stream, get_configured_order, get_route_signature, PROVIDER_DISPLAY_NAMES
+from app.ai.cache import build_generation_key, get_cached_generation, save_cached_generation
+from app.ai.tokens import estimate_tokens, output_tokens_for_chars, truncate_to_tokens, get_min_context_tokens, get_token_budget
 
-from app.utils import get_ai_setting
+from uuid import uuid4
+
+from app.utils import get_ai_setting, get_draft_post, claim_news_generation, release_news_generation
 
 logger = logging.getLogger(__name__)
 
+# Версия шаблона промпта поста. Увеличивайте при изменении текста промпта,
+# чтобы кэш генераций не отдавал посты, собранные по старому шаблону.
+POST_PROMPT_VERSION = "2"
+
+POST_SYSTEM_MESSAGE = (
+    "Ты — профессиональный SMM-менеджер новостного IT-канала."
+    "Твоя задача — писать короткие, вовлекающие и информативные посты для Telegram на русском языке. "
+    "Используй подходящие emoji, структурируй текст и добавь призыв к действию (Call to Action)."
+)
+
+# Захват генерации поста новости: пока один воркер генерирует, другие ждут его черновик
+GENERATION_CLAIM_TTL = 300
+GENERATION_WAIT_TIMEOUT = 60.0
+GENERATION_WAIT_POLL = 1.0
+
+# Пометка поста, собранного без ИИ (fallback)
+ORIGINAL_POST_MARKER = "📝 [Original]"
+
+
+def get_generation_fingerprint() -> str:
+    """
+    Отпечаток текущих настроек генерации (ИИ on/off, провайдеры, модели, промпт).
+    Заранее сгенерированные черновики с другим отпечатком считаются устаревшими.
+    """
+    providers, models = get_route_signature()
+    parts = [get_ai_setting(), providers, models, POST_PROMPT_VERSION, POST_SYSTEM_MESSAGE]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
 def is_ai_available() -> bool:
     """
-    Проверяет доступность ИИ провайдера (наличие API ключа).
+    Проверяет доступность ИИ: настроен хотя бы один провайдер из порядка маршрутизации.
     """
-    provider = settings.ai_provider.lower()
-    if provider == "openai":
-        return bool(settings.openai_api_key)
-    elif provider == "deepseek":
-        return bool(settings.deepseek_api_key)
-    elif provider == "groq":
-        return bool(settings.groq_api_key)
-    return False
+    return bool(get_configured_order())
 
-async def generate_text(prompt: str, system_message: str = "You are a helpful assistant.", bypass_news_setting: bool = False) -> str | None:
+async def generate_text_with_provider(prompt: str, system_message: str = "You are a helpful assistant.", bypass_news_setting: bool = False, max_tokens: int | None = None, history: list[dict] | None = None) -> tuple[str | None, str | None]:
     """
-    Диспетчер для выбора AI провайдера на основе настроек.
+    Генерирует текст через маршрутизатор провайдеров (failover + hedging).
+    max_tokens ограничивает длину ответа (None — бюджет ответа провайдера),
+    history — предыдущие сообщения диалога.
+    Возвращает (текст, ответивший провайдер).
     """
     ai_status = get_ai_setting()
 
     # Проверяем настройку из Redis вместо статического .env
     if not bypass_news_setting and ai_status == "off":
         logger.warning(f"AI Agent is disabled (status: {ai_status}). Skipping AI generation.")
-        return None
+        return None, None
 
-    provider = settings.ai_provider.lower()
-    logger.info(f"Generating text using provider: {provider} (AI Status: {ai_status})")
+    logger.info(f"Generating text using providers: {get_configured_order()} (AI Status: {ai_status})")
 
     try:
-        if provider == "openai":
-            return await generate_text_openai(prompt, system_message)
-        elif provider == "deepseek":
-            return await generate_text_deepseek(prompt, system_message)
-        elif provider == "groq":
-            return await generate_text_groq(prompt, system_message)
-        else:
-            logger.warning(f"Unknown AI provider '{provider}'. Falling back to Groq.")
-            return await generate_text_groq(prompt, system_message)
+        return await route_generation(prompt, system_message, max_tokens, history)
     except Exception as e:
         logger.error(f"Critical error in generate_text dispatcher: {e}", exc_info=True)
-        return None
+        return None, None
 
-async def generate_telegram_post(news: NewsItem) -> str:
+async def generate_text(prompt: str, system_message: str = "You are a helpful assistant.", bypass_news_setting: bool = False, max_tokens: int | None = None) -> str | None:
     """
-    Генерирует текст поста для Telegram на основе новости.
-    Использует ИИ, если он включен, иначе возвращает стандартное форматирование.
+    Диспетчер для выбора AI провайдера на основе настроек.
     """
-    system_message = (
-        "Ты — профессиональный SMM-менеджер новостного IT-канала."
-        "Твоя задача — писать короткие, вовлекающие и информативные посты для Telegram на русском языке. "
-        "Используй подходящие emoji, структурируй текст и добавь призыв к действию (Call to Action)."
-    )
-    
-    prompt = (
+    text, _ = await generate_text_with_provider(prompt, system_message, bypass_news_setting, max_tokens)
+    return text
+
+# Длина поста, которую просим у модели; по ней же считается max_tokens ответа
+POST_MAX_CHARS = 500
+
+POST_REQUIREMENTS = (
+    f"1. Краткость (не более {POST_MAX_CHARS} символов).\n"
+    "2. Привлекательный заголовок.\n"
+    "3. Ссылка на оригинал в конце.\n"
+    "4. Несколько подходящих эмодзи.\n"
+    "5. Тон: профессиональный, но дружелюбный."
+)
+
+# Лимит ответа на один пост в токенах (POST_MAX_CHARS с запасом на эмодзи)
+POST_COMPLETION_TOKENS = output_tokens_for_chars(POST_MAX_CHARS)
+# Накладные расходы пакетного ответа на один пост (JSON-обёртка, id, экранирование)
+BATCH_ITEM_OVERHEAD_TOKENS = 30
+# Оценка шаблона промпта без описания новости (заголовок, ссылка, требования)
+POST_TEMPLATE_TOKENS = 250
+
+
+def get_summary_token_budget() -> int:
+    """
+    Бюджет описания новости в промпте: PROMPT_SUMMARY_MAX_TOKENS, но так, чтобы
+    системный промпт, шаблон и ответ поместились в наименьший контекст маршрута.
+    """
+    context_tokens = get_min_context_tokens(get_configured_order())
+    available = context_tokens - estimate_tokens(POST_SYSTEM_MESSAGE) - POST_TEMPLATE_TOKENS - POST_COMPLETION_TOKENS
+    return max(50, min(settings.prompt_summary_max_tokens, available))
+
+
+def build_post_prompt(news: NewsItem) -> str:
+    """
+    Промпт генерации поста для одной новости. Длинное описание (например, полный текст
+    сообщения из Telegram-канала) обрезается по границе предложения.
+    """
+    summary = truncate_to_tokens(news.summary, get_summary_token_budget())
+    return (
         f"Напиши пост для Telegram на основе следующей новости:\n\n"
         f"Заголовок: {news.title}\n"
         f"Источник: {news.source}\n"
-        f"Описание: {news.summary}\n\n"
+        f"Описание: {summary}\n\n"
         f"Ссылка: {news.url}\n\n"
         f"Требования к посту:\n"
-        f"1. Краткость (не более 500 символов).\n"
-        f"2. Привлекательный заголовок.\n"
-        f"3. Ссылка на оригинал в конце.\n"
-        f"4. Несколько подходящих эмодзи.\n"
-        f"5. Тон: профессиональный, но дружелюбный."
+        f"{POST_REQUIREMENTS}"
     )
-    
-    generated_text = await generate_text(prompt, system_message)
-    
-    # Если ИИ вернул текст, используем его и добавляем пометку с указанием провайдера
-    if generated_text:
-        provider_display = {
-            "openai": "OpenAI",
-            "groq": "Groq",
-            "deepseek": "DeepSeek"
-        }.get(settings.ai_provider.lower(), settings.ai_provider.capitalize())
-        
-        return f"🤖 [ИИ] ({provider_display})\n\n{generated_text}"
-        
-    # Fallback механизм: стандартное форматирование с пометкой [Original]
+
+
+def format_ai_post(text: str, provider: str) -> str:
+    """
+    Добавляет к сгенерированному тексту пометку с указанием провайдера.
+    """
+    provider_display = PROVIDER_DISPLAY_NAMES.get(provider, provider.capitalize())
+    return f"🤖 [ИИ] ({provider_display})\n\n{text}"
+
+
+def format_original_post(news: NewsItem) -> str:
+    """
+    Fallback механизм: стандартное форматирование с пометкой [Original].
+    """
     return (
-        f"📝 [Original]\n\n"
+        f"{ORIGINAL_POST_MARKER}\n\n"
         f"📢 {news.title}\n\n"
         f"{news.summary}\n\n"
         f"🔗 Источник: {news.source}\n"
         f"👉 Читать полностью: {news.url}"
     )
 
-async def generate_ai_chat_response(user_message: str) -> str:
+
+def get_post_cache_key(news: NewsItem) -> str:
     """
-    Генерирует ответ ИИ на сообщение пользователя в режиме чата.
+    Ключ кэша генераций поста для текущего маршрута провайдеров и моделей.
+    """
+    providers, models = get_route_signature()
+    return build_generation_key(news, POST_SYSTEM_MESSAGE, POST_PROMPT_VERSION, providers, models)
+
+
+async def generate_telegram_post(news: NewsItem) -> str:
+    """
+    Генерирует текст поста для Telegram на основе новости.
+    Использует ИИ, если он включен, иначе возвращает стандартное форматирование.
     """
-    system_message = (
-        "Ты — опытный IT-специалист и аналитик новостей."
-        "Твоя задача — отвечать на вопросы пользователя профессионально, четко и по делу."
-        "Ты можешь обсуждать технологии, программирование, новости IT и помогать с решением технических вопросов."
-        "Отвечай на русском языке, используй дружелюбный, но деловой тон."
+    # Кэш генераций: повторные попытки, предпросмотр и публикация одной новости
+    # с теми же промптом и моделями не платят за повторный запрос к ИИ.
+    # В кэше лежит готовый пост с пометкой ответившего провайдера.
+    cache_key = None
+    if get_ai_setting() != "off":
+        cache_key = get_post_cache_key(news)
+        cached_post = get_cached_generation(cache_key)
+        if cached_post:
+            logger.info(f"Generation cache hit for news {news.id[:12]}")
+            return cached_post
+    return await _generate_post(news, cache_key)
+
+
+async def _generate_post(news: NewsItem, cache_key: str | None) -> str:
+    # Генерация без обращения к кэшу: вызывающий код уже проверил его, иначе каждый
+    # промах считался бы в статистике кэша дважды
+    generated_text, provider = await generate_text_with_provider(
+        build_post_prompt(news), POST_SYSTEM_MESSAGE, max_tokens=POST_COMPLETION_TOKENS
     )
     
-    response = await generate_text(user_message, system_message, bypass_news_setting=True)
+    # Если ИИ вернул текст, используем его и добавляем пометку с указанием провайдера
+    if generated_text:
+        post_text = format_ai_post(generated_text, provider)
+        if cache_key:
+            save_cached_generation(cache_key, post_text)
+        return post_text
+        
+    return format_original_post(news)
+
+
+# --- Пакетная генерация: несколько новостей в одном запросе к ИИ ---
+
+def _batch_item_id(news: NewsItem) -> str:
+    # Короткий id экономит токены; 12 hex-символов sha256 достаточно внутри одного пакета
+    return news.id[:12]
+
+
+def build_batch_prompt(news_items: list[NewsItem]) -> str:
+    """
+    Промпт генерации постов сразу для нескольких новостей с ответом в JSON.
+    """
+    summary_budget = get_summary_token_budget()
+    blocks = [
+        f"[id: {_batch_item_id(news)}]\n"
+        f"Заголовок: {news.title}\n"
+        f"Источник: {news.source}\n"
+        f"Описание: {truncate_to_tokens(news.summary, summary_budget)}\n"
+        f"Ссылка: {news.url}"
+        for news in news_items
+    ]
+    return (
+        f"Напиши отдельный пост для Telegram для каждой из следующих новостей:\n\n"
+        + "\n\n".join(blocks)
+        + f"\n\nТребования к каждому посту:\n{POST_REQUIREMENTS}\n\n"
+        f"Ответ верни строго в формате JSON без пояснений и без markdown-разметки:\n"
+        f'{{"posts": [{{"id": "<id новости>", "text": "<текст поста>"}}]}}\n'
+        f"Для каждой новости ровно один пост с её id."
+    )
+
+
+def split_into_batches(news_items: list[NewsItem]) -> list[list[NewsItem]]:
+    """
+    Делит новости на пакеты не больше GENERATION_BATCH_SIZE, чтобы оценка токенов пакета
+    (промпт + ожидаемые посты) не превышала GENERATION_BATCH_MAX_TOKENS, а ответ помещался
+    в бюджет ответа провайдеров маршрута. Новость, которая не помещается в бюджет даже одна,
+    идёт отдельным пакетом.
+    """
+    overhead = estimate_tokens(POST_SYSTEM_MESSAGE + build_batch_prompt([]))
+    summary_budget = get_summary_token_budget()
+    max_posts_by_output = min(
+        (get_token_budget(provider)[1] for provider in get_configured_order()),
+        default=get_token_budget("")[1],
+    ) // (POST_COMPLETION_TOKENS + BATCH_ITEM_OVERHEAD_TOKENS)
+    max_posts = max(1, min(settings.generation_batch_size, max_posts_by_output))
+    batches: list[list[NewsItem]] = []
+    current: list[NewsItem] = []
+    current_tokens = overhead
+    for news in news_items:
+        summary_tokens = min(estimate_tokens(news.summary), summary_budget)
+        item_tokens = (
+            estimate_tokens(f"{news.title}{news.source}{news.url}") + summary_tokens
+            + POST_COMPLETION_TOKENS + BATCH_ITEM_OVERHEAD_TOKENS
+        )
+        if current and (
+            len(current) >= max_posts
+            or current_tokens + item_tokens > settings.generation_batch_max_tokens
+        ):
+            batches.append(current)
+            current, current_tokens = [], overhead
+        current.append(news)
+        current_tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(text: str | None, expected_ids: set[str]) -> dict[str, str]:
+    """
+    Разбирает JSON-ответ пакетной генерации в словарь "id -> текст поста".
+    Пропускает записи с неизвестным id, повторы и пустые тексты; при невалидном JSON
+    возвращает пустой словарь.
+    """
+    if not text:
+        return {}
+    # Модели иногда оборачивают JSON в ```json ... ``` или добавляют пояснения
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+
+    posts = data.get("posts") if isinstance(data, dict) else None
+    if not isinstance(posts, list):
+        return {}
+
+    result: dict[str, str] = {}
+    for entry in posts:
+        if not isinstance(entry, dict):
+            continue
+        post_id, post_text = str(entry.get("id", "")).strip(), entry.get("text")
+        if post_id in expected_ids and post_id not in result and isinstance(post_text, str) and post_text.strip():
+            result[post_id] = post_text.strip()
+    return result
+
+
+async def _generate_batch(batch: list[NewsItem]) -> dict[str, str]:
+    # Кэш для новостей пакета уже проверен в generate_telegram_posts_batch
+    if len(batch) == 1:
+        return {batch[0].id: await _generate_post(batch[0], get_post_cache_key(batch[0]))}
+
+    by_batch_id = {_batch_item_id(news): news for news in batch}
+    text, provider = await generate_text_with_provider(
+        build_batch_prompt(batch), POST_SYSTEM_MESSAGE,
+        max_tokens=len(batch) * (POST_COMPLETION_TOKENS + BATCH_ITEM_OVERHEAD_TOKENS),
+    )
+    if not text:
+        # Ни один провайдер не ответил — повторять запросы по одной новости бессмысленно
+        return {news.id: format_original_post(news) for news in batch}
+    parsed = parse_batch_response(text, set(by_batch_id))
+
+    posts: dict[str, str] = {}
+    for batch_id, post_text in parsed.items():
+        news = by_batch_id[batch_id]
+        posts[news.id] = format_ai_post(post_text, provider)
+        save_cached_generation(get_post_cache_key(news), posts[news.id])
+
+    missing = [news for news in batch if news.id not in posts]
+    logger.info(f"Batch generation: {len(parsed)} of {len(batch)} posts in one request via {provider}")
+    if missing:
+        # Ответ не разобрался целиком — недостающие посты генерируем по одному
+        logger.warning(f"Batch response is missing {len(missing)} posts, generating them one by one")
+        for news in missing:
+            posts[news.id] = await _generate_post(news, get_post_cache_key(news))
+    return posts
+
+
+async def generate_telegram_posts_batch(news_items: list[NewsItem], concurrency: int = 1) -> dict[str, str]:
+    """
+    Генерирует посты для нескольких новостей, упаковывая по GENERATION_BATCH_SIZE новостей
+    в один запрос к ИИ (системный промпт и накладные расходы запроса оплачиваются один раз
+    на пакет). Возвращает словарь "id новости -> текст поста"; посты из кэша не генерируются
+    повторно, а для новостей, которых нет в ответе, используется генерация по одной.
+    """
+    if get_ai_setting() == "off":
+        return {news.id: format_original_post(news) for news in news_items}
+
+    posts: dict[str, str] = {}
+    pending: list[NewsItem] = []
+    for news in news_items:
+        cached_post = get_cached_generation(get_post_cache_key(news))
+        if cached_post:
+            posts[news.id] = cached_post
+        else:
+            pending.append(news)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(batch: list[NewsItem]) -> dict[str, str]:
+        async with semaphore:
+            return await _generate_batch(batch)
+
+    for batch_posts in await asyncio.gather(*(run(batch) for batch in split_into_batches(pending))):
+        posts.update(batch_posts)
+    return posts
+
+async def get_post_text(news: NewsItem) -> str:
+    """
+    Возвращает текст поста для публикации: заранее сгенерированный черновик,
+    если он актуален для текущих настроек, иначе генерирует пост сразу.
+    """
+    fingerprint = get_generation_fingerprint()
+    draft = get_draft_post(news.id, fingerprint)
+    if draft:
+        logger.info(f"Using pre-generated post for news {news.id[:12]}")
+        return draft.generated_text
+
+    owner = uuid4().hex
+    if not claim_news_generation(news.id, owner, GENERATION_CLAIM_TTL):
+        # Пост этой новости сейчас генерирует предгенерация — ждём её черновик вместо второго запроса к ИИ.
+        # Если захват освобождён без черновика (генерация упала), берём его сами, не дожидаясь таймаута
+        logger.info(f"News {news.id[:12]} is being generated elsewhere, waiting for the draft")
+        waited = 0.0
+        while True:
+            await asyncio.sleep(GENERATION_WAIT_POLL)
+            waited += GENERATION_WAIT_POLL
+            draft = get_draft_post(news.id, fingerprint)
+            if draft:
+                return draft.generated_text
+            if claim_news_generation(news.id, owner, GENERATION_CLAIM_TTL):
+                break
+            if waited >= GENERATION_WAIT_TIMEOUT:
+                # Владелец завис — перехватываем захват, чтобы следующий ожидающий не сгенерировал пост в третий раз
+                logger.warning(f"Draft for news {news.id[:12]} did not appear in {GENERATION_WAIT_TIMEOUT:.0f} s, taking over")
+                claim_news_generation(news.id, owner, GENERATION_CLAIM_TTL, force=True)
+                break
+        # Черновик мог быть сохранён между последней проверкой и освобождением захвата
+        draft = get_draft_post(news.id, fingerprint)
+        if draft:
+            release_news_generation(news.id, owner)
+            return draft.generated_text
+    try:
+        return await generate_telegram_post(news)
+    finally:
+        release_news_generation(news.id, owner)
+
+CHAT_SYSTEM_MESSAGE = (
+    "Ты — опытный IT-специалист и аналитик новостей."
+    "Твоя задача — отвечать на вопросы пользователя профессионально, четко и по делу."
+    "Ты можешь обсуждать технологии, программирование, новости IT и помогать с решением технических вопросов."
+    "Отвечай на русском языке, используй дружелюбный, но деловой тон."
+)
+
+CHAT_UNAVAILABLE_MESSAGE = "⚠️ Извините, я сейчас не могу ответить. Попробуйте позже или проверьте настройки ИИ."
+
+
+async def generate_ai_chat_response(user_message: str, history: list[dict] | None = None) -> str:
+    """
+    Генерирует ответ ИИ на сообщение пользователя в режиме чата.
+    history — память диалога пользователя (см. app.ai.memory).
+    """
+    text, _ = await generate_text_with_provider(user_message, CHAT_SYSTEM_MESSAGE, bypass_news_setting=True, history=history)
+    response = text
     
     if not response:
-        return "⚠️ Извините, я сейчас не могу ответить. Попробуйте позже или проверьте настройки ИИ."
+        return CHAT_UNAVAILABLE_MESSAGE
         
     return response
+
+async def stream_ai_chat_response(user_message: str, history: list[dict] | None = None) -> AsyncIterator[str]:
+    """
+    Генерирует ответ ИИ в режиме чата по частям (стриминг), чтобы бот показывал текст
+    по мере генерации. Если ни один провайдер не ответил, поток будет пустым.
+    """
+    try:
+        async for content, _ in route_stream(user_message, CHAT_SYSTEM_MESSAGE, history=history):
+            yield content
+    except Exception as e:
+        logger.error(f"Critical error in chat streaming: {e}", exc_info=True)
@@ -1,66 +1,97 @@
 import logging
-from groq import AsyncGroq
+from typing import AsyncIterator
 from app.config import settings
+from app.ai.clients import get_ai_client, build_messages
+from app.ai.ratelimit import provider_slot, note_rate_limit_headers, note_rate_limit_error, note_token_usage
+from app.ai.tokens import estimate_messages_tokens, fit_output_tokens, reserved_tokens
 
 logger = logging.getLogger(__name__)
 
-async def generate_text_groq(prompt: str, system_message: str = "You are a helpful assistant.") -> str | None:
+# Reasoning-модели тратят часть max_completion_tokens на рассуждения до ответа
+REASONING_TOKENS_RESERVE = {"low": 1024, "medium": 2048, "high": 4096}
+
+
+def _is_reasoning_model() -> bool:
+    return "gpt-oss" in settings.groq_model or "o1" in settings.groq_model
+
+
+def _build_groq_params(messages: list[dict], max_tokens: int) -> dict:
+    # Формируем параметры запроса согласно примеру
+    params = {
+        "model": settings.groq_model,
+        "messages": messages,
+        "temperature": 0.7, # Температура для контроля случайности (1 это максимальная случайность, 0.5 - средняя, по умолчанию 0.7)
+        "top_p": 1,
+        "stream": True,
+    }
+
+    # Добавляем параметры размышления только если модель их поддерживает
+    if _is_reasoning_model():
+        params["reasoning_effort"] = settings.groq_reasoning_effort
+        params["max_completion_tokens"] = max_tokens
+    else:
+        params["max_tokens"] = max_tokens
+        # Убираем stream: True если он вызывает проблемы с прокси/сетью (опционально)
+        # params["stream"] = False 
+    return params
+
+
+async def stream_text_groq(prompt: str, system_message: str = "You are a helpful assistant.", max_tokens: int | None = None, history: list[dict] | None = None) -> AsyncIterator[str]:
     """
-    Генерирует текст с помощью Groq AI, используя параметры из примера (reasoning_effort, streaming).
+    Генерирует текст с помощью Groq AI в режиме стриминга: отдаёт части ответа по мере генерации.
+    При ошибке завершает поток (уже отданные части остаются у вызывающего).
+    max_tokens ограничивает длину ответа (по умолчанию — бюджет ответа провайдера),
+    history — предыдущие сообщения диалога (между системным промптом и запросом).
     """
     if not settings.groq_api_key or "your_groq_key_here" in settings.groq_api_key:
         logger.error("Groq AI is not configured (missing API key). Skipping.")
-        return None
-    
+        return
+
     try:
-        async with AsyncGroq(
-            api_key=settings.groq_api_key,
-            base_url=settings.groq_base_url
-        ) as client:
-            # Формируем параметры запроса согласно примеру
-            params = {
-                "model": settings.groq_model,
-                "messages": [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt},
-                ],
-                "temperature": 0.7, # Температура для контроля случайности (1 это максимальная случайность, 0.5 - средняя, по умолчанию 0.7)
-                "top_p": 1,
-                "stream": True,
-            }
-
-            # Добавляем параметры размышления только если модель их поддерживает
-            if "gpt-oss" in settings.groq_model or "o1" in settings.groq_model:
-                params["reasoning_effort"] = settings.groq_reasoning_effort
-                params["max_completion_tokens"] = 8192
-            else:
-                params["max_tokens"] = 4096
-                # Убираем stream: True если он вызывает проблемы с прокси/сетью (опционально)
-                # params["stream"] = False 
-
-            completion = await client.chat.completions.create(**params)
-            
-            full_response = []
-            try:
-                async for chunk in completion:
-                    if hasattr(chunk, 'choices') and chunk.choices:
-                        content = chunk.choices[0].delta.content
-                        if content:
-                            full_response.append(content)
-            except Exception as stream_err:
-                logger.error(f"Error during Groq streaming: {stream_err}")
-                # Если стриминг прервался, но мы уже что-то получили, попробуем вернуть это
-                if not full_response:
-                    return None
-
-            result = "".join(full_response).strip()
-            if not result:
-                logger.warning("Groq returned an empty response.")
-                return None
-
-            logger.info(f"Successfully generated text with Groq ({len(result)} chars)")
-            return result
-        
+        # Долгоживущий клиент с пулом соединений (без нового TLS-рукопожатия на каждый запрос)
+        client = get_ai_client("groq")
+        messages = build_messages(system_message, prompt, history)
+        prompt_tokens = estimate_messages_tokens(messages)
+        max_tokens = fit_output_tokens("groq", prompt_tokens, max_tokens)
+        if _is_reasoning_model():
+            # Резерв на рассуждения добавляется сверх бюджета ответа, в пределах контекста
+            reserve = REASONING_TOKENS_RESERVE.get(settings.groq_reasoning_effort, 2048)
+            max_tokens = min(max_tokens + reserve, max(max_tokens, settings.groq_context_tokens - prompt_tokens))
+        reserved = reserved_tokens(prompt_tokens, max_tokens)
+        # Ждём слот в общей квоте провайдера; слот занят, пока читается стрим
+        async with provider_slot("groq", reserved):
+            raw_response = await client.chat.completions.with_raw_response.create(
+                **_build_groq_params(messages, max_tokens)
+            )
+            note_rate_limit_headers("groq", raw_response.headers)
+            completion = await raw_response.parse()
+
+            async for chunk in completion:
+                # Groq присылает usage в последнем чанке стрима (x_groq.usage)
+                usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage:
+                    note_token_usage("groq", usage, reserved)
+                if hasattr(chunk, 'choices') and chunk.choices:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        yield content
+
     except Exception as e:
-        logger.error(f"Error during Groq AI text generation: {str(e)}")
+        note_rate_limit_error("groq", e)
+        logger.error(f"Error during Groq streaming: {str(e)}")
+
+
+async def generate_text_groq(prompt: str, system_message: str = "You are a helpful assistant.", max_tokens: int | None = None, history: list[dict] | None = None) -> str | None:
+    """
+    Генерирует текст с помощью Groq AI, используя параметры из примера (reasoning_effort, streaming).
+    """
+    # Если стриминг прервался, но мы уже что-то получили, возвращаем полученное
+    full_response = [content async for content in stream_text_groq(prompt, system_message, max_tokens, history)]
+
+    result = "".join(full_response).strip()
+    if not result:
+        logger.warning("Groq returned an empty response.")
         return None
+
+    logger.info(f"Successfully generated text with Groq ({len(result)} chars)")
+    return result
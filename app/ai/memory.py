@@ -0,0 +1,96 @@
+import logging
+
+from app.config import settings
+from app.ai.router import route_generation
+from app.ai.tokens import estimate_tokens, estimate_messages_tokens, truncate_to_tokens
+from app.utils import get_chat_history, save_chat_history
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_MESSAGE = (
+    "Ты ведёшь краткую сводку диалога пользователя с IT-ассистентом. "
+    "Сохраняй факты о пользователе, его задачи, принятые решения и открытые вопросы. "
+    "Пиши сжато, на русском языке, без вступлений."
+)
+
+
+def build_chat_history(user_id: int) -> list[dict]:
+    """
+    Контекст диалога для запроса к ИИ: сводка ранних сообщений (если есть) и последние сообщения.
+    """
+    summary, messages = get_chat_history(user_id)
+    history = []
+    if summary:
+        history.append({"role": "system", "content": f"Краткое содержание предыдущей части разговора: {summary}"})
+    return history + messages
+
+
+def _history_tokens(summary: str, messages: list[dict]) -> int:
+    return estimate_tokens(summary) + estimate_messages_tokens(messages)
+
+
+async def remember_chat_exchange(user_id: int, user_message: str, answer: str) -> None:
+    """
+    Добавляет вопрос и ответ в историю пользователя. Если история превысила
+    CHAT_HISTORY_MAX_TOKENS или CHAT_HISTORY_MAX_MESSAGES, ранние сообщения сжимаются в сводку.
+    """
+    summary, messages = get_chat_history(user_id)
+    messages += [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": answer},
+    ]
+    if (
+        _history_tokens(summary, messages) > settings.chat_history_max_tokens
+        or len(messages) > settings.chat_history_max_messages
+    ):
+        before = _history_tokens(summary, messages)
+        summary, messages = await compact_chat_history(summary, messages)
+        logger.info(
+            f"Compacted chat history of user {user_id}: ~{before} -> ~{_history_tokens(summary, messages)} tokens, "
+            f"{len(messages)} recent messages kept"
+        )
+    save_chat_history(user_id, summary, messages)
+
+
+async def compact_chat_history(summary: str, messages: list[dict]) -> tuple[str, list[dict]]:
+    """
+    Оставляет дословно последние сообщения (до половины бюджета токенов и сообщений),
+    а более ранние вместе с прежней сводкой сжимает в новую сводку.
+    """
+    token_target = settings.chat_history_max_tokens // 2
+    message_target = max(2, settings.chat_history_max_messages // 2)
+
+    split = len(messages)
+    kept_tokens = 0
+    for index in range(len(messages) - 1, -1, -1):
+        tokens = estimate_messages_tokens([messages[index]])
+        if kept_tokens + tokens > token_target or len(messages) - index > message_target:
+            break
+        kept_tokens += tokens
+        split = index
+    # Не разрываем пару "вопрос — ответ": сохранённая часть начинается с сообщения пользователя
+    while split < len(messages) and messages[split]["role"] != "user":
+        split += 1
+
+    return await _summarize(summary, messages[:split]), messages[split:]
+
+
+async def _summarize(summary: str, messages: list[dict]) -> str:
+    if not messages:
+        return summary
+
+    transcript = "\n".join(
+        f"{'Пользователь' if message['role'] == 'user' else 'Ассистент'}: {message['content']}"
+        for message in messages
+    )
+    prompt = (
+        f"Текущая сводка: {summary or '—'}\n\n"
+        f"Новые сообщения:\n{truncate_to_tokens(transcript, settings.chat_history_max_tokens * 2)}\n\n"
+        f"Обнови сводку с учётом новых сообщений (не более {settings.chat_summary_max_tokens * 2} символов)."
+    )
+    text, _ = await route_generation(prompt, SUMMARY_SYSTEM_MESSAGE, max_tokens=settings.chat_summary_max_tokens)
+    if not text:
+        # ИИ недоступен — ранние сообщения отбрасываются, прежняя сводка сохраняется
+        logger.warning("Could not summarize chat history, dropping old messages")
+        return summary
+    return truncate_to_tokens(text.strip(), settings.chat_summary_max_tokens)
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Mapping
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Атомарная проверка двух token bucket (запросы/мин и токены/мин) и блокировки по Retry-After.
+# Возвращает строку с временем ожидания в секундах ("0" — слот выдан).
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local blocked_until = tonumber(redis.call('GET', KEYS[2]) or '0')
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+
+local state = redis.call('HMGET', KEYS[1], 'req', 'tok', 'ts')
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+local req = 0
+local tok = 0
+if rpm > 0 then req = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60) end
+if tpm > 0 then
+    tok = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60)
+    cost = math.min(cost, tpm)
+end
+
+local wait = 0
+if rpm > 0 and req < 1 then wait = math.max(wait, (1 - req) * 60 / rpm) end
+if tpm > 0 and tok < cost then wait = math.max(wait, (cost - tok) * 60 / tpm) end
+if wait == 0 then
+    if rpm > 0 then req = req - 1 end
+    if tpm > 0 then tok = tok - cost end
+end
+
+redis.call('HSET', KEYS[1], 'req', tostring(req), 'tok', tostring(tok), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+# Один интервал ожидания не длиннее этого, чтобы вовремя замечать освободившиеся слоты
+MAX_SLEEP = 5.0
+# Пауза по умолчанию при 429 без заголовков Retry-After / x-ratelimit-reset-*
+DEFAULT_RATE_LIMIT_BACKOFF = 5.0
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class _LocalLimiter:
+    """
+    Локальные ограничения процесса: семафор одновременных запросов и FIFO-очередь
+    ожидания квоты, чтобы вызывающие получали слоты в порядке прихода.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.queue_lock = asyncio.Lock()
+
+
+_local_limiters: dict[tuple[asyncio.AbstractEventLoop, str], _LocalLimiter] = {}
+
+
+def get_provider_limits(provider: str) -> tuple[int, int, int]:
+    """
+    Возвращает лимиты провайдера: (запросов в минуту, токенов в минуту, одновременных запросов).
+    0 означает "без ограничения".
+    """
+    return {
+        "groq": (settings.groq_rpm, settings.groq_tpm, settings.groq_max_concurrency),
+        "openai": (settings.openai_rpm, settings.openai_tpm, settings.openai_max_concurrency),
+        "deepseek": (settings.deepseek_rpm, settings.deepseek_tpm, settings.deepseek_max_concurrency),
+        "fake": (settings.fake_ai_rpm, settings.fake_ai_tpm, settings.fake_ai_max_concurrency),
+    }.get(provider, (0, 0, 0))
+
+
+def _get_local_limiter(provider: str) -> _LocalLimiter:
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _local_limiters if key[0].is_closed()]:
+        _local_limiters.pop(key, None)
+    limiter = _local_limiters.get((loop, provider))
+    if limiter is None:
+        limiter = _LocalLimiter(get_provider_limits(provider)[2])
+        _local_limiters[(loop, provider)] = limiter
+    return limiter
+
+
+def _try_acquire(provider: str, tokens: int) -> float:
+    """
+    Пытается списать 1 запрос и tokens токенов из общих (Redis) бакетов провайдера.
+    Возвращает 0, если слот получен, иначе сколько секунд подождать.
+    """
+    rpm, tpm, _ = get_provider_limits(provider)
+    client = get_redis_client()
+    if client is None:
+        # Без Redis не блокируем генерацию — остаётся только локальный семафор
+        return 0.0
+    try:
+        wait = client.eval(
+            _ACQUIRE_SCRIPT, 2,
+            f"ai:ratelimit:{provider}:bucket", f"ai:ratelimit:{provider}:blocked_until",
+            time.time(), rpm, tpm, tokens,
+        )
+        return float(wait)
+    except RedisError as e:
+        logger.error(f"Redis error in rate limiter for {provider}: {e}")
+        return 0.0
+
+
+def _record(provider: str, field: str, amount: float = 1) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.hincrbyfloat(f"ai:ratelimit:{provider}:stats", field, amount)
+    except RedisError:
+        pass
+
+
+@asynccontextmanager
+async def provider_slot(provider: str, estimated_tokens: int):
+    """
+    Ожидает свободный слот провайдера: сначала локальный семафор одновременных запросов,
+    затем (в порядке очереди) квоту запросов/токенов в минуту из Redis.
+    """
+    limiter = _get_local_limiter(provider)
+    started = time.perf_counter()
+
+    if limiter.semaphore is not None:
+        await limiter.semaphore.acquire()
+    try:
+        async with limiter.queue_lock:
+            while True:
+                wait = _try_acquire(provider, estimated_tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(min(wait, MAX_SLEEP))
+
+        waited = time.perf_counter() - started
+        if waited > 0.05:
+            logger.info(f"Waited {waited:.2f}s for {provider} rate limit slot")
+            _record(provider, "waits")
+            _record(provider, "wait_seconds", round(waited, 3))
+        yield
+    finally:
+        if limiter.semaphore is not None:
+            limiter.semaphore.release()
+
+
+def block_provider(provider: str, seconds: float, reason: str) -> None:
+    """
+    Приостанавливает выдачу слотов провайдера на seconds секунд для всех процессов.
+    """
+    client = get_redis_client()
+    if client is None or seconds <= 0:
+        return
+    until = time.time() + seconds
+    try:
+        current = float(client.get(f"ai:ratelimit:{provider}:blocked_until") or 0)
+        if until > current:
+            client.set(f"ai:ratelimit:{provider}:blocked_until", until, ex=int(seconds) + 1)
+            logger.warning(f"Provider {provider} paused for {seconds:.1f}s ({reason})")
+    except RedisError as e:
+        logger.error(f"Redis error in block_provider: {e}")
+
+
+def parse_duration(value: str | None) -> float | None:
+    """
+    Разбирает длительность из заголовков: "12", "7.66s", "2m59.56s", "150ms".
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    multipliers = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * multipliers[unit] for number, unit in parts)
+
+
+def note_rate_limit_headers(provider: str, headers: Mapping[str, str]) -> None:
+    """
+    Учитывает заголовки x-ratelimit-* успешного ответа: если квота провайдера
+    исчерпана, новые запросы ждут её сброса вместо того, чтобы получить 429.
+    """
+    for kind in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if remaining is not None and remaining.strip() in ("0", "0.0"):
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset:
+                block_provider(provider, reset, f"{kind} quota exhausted")
+
+
+def note_rate_limit_error(provider: str, error: Any) -> None:
+    """
+    Обрабатывает ошибку провайдера: при 429 ставит паузу по Retry-After / x-ratelimit-reset-*.
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status_code != 429:
+        return
+
+    _record(provider, "throttled")
+    headers = getattr(response, "headers", None) or {}
+    delay = (
+        parse_duration(headers.get("retry-after"))
+        or parse_duration(headers.get("x-ratelimit-reset-requests"))
+        or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        or DEFAULT_RATE_LIMIT_BACKOFF
+    )
+    block_provider(provider, delay, "HTTP 429")
+
+
+def note_token_usage(provider: str, usage: Any, reserved: int) -> None:
+    """
+    Учитывает фактический расход токенов из usage ответа: пишет его в лог и статистику
+    и возвращает в бакет токенов разницу с зарезервированной оценкой (или списывает перерасход).
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is None or completion_tokens is None:
+        return
+
+    total = prompt_tokens + completion_tokens
+    logger.info(f"{provider} token usage: prompt {prompt_tokens}, completion {completion_tokens} (reserved {reserved})")
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.hincrby(f"ai:ratelimit:{provider}:stats", "calls", 1)
+        pipe.hincrby(f"ai:ratelimit:{provider}:stats", "prompt_tokens", prompt_tokens)
+        pipe.hincrby(f"ai:ratelimit:{provider}:stats", "completion_tokens", completion_tokens)
+        if get_provider_limits(provider)[1] > 0 and client.exists(f"ai:ratelimit:{provider}:bucket"):
+            # Переполнение сверх TPM обрежет следующий вызов скрипта выдачи слотов
+            pipe.hincrbyfloat(f"ai:ratelimit:{provider}:bucket", "tok", reserved - total)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in note_token_usage: {e}")
+
+
+def get_rate_limit_stats(provider: str) -> dict:
+    """
+    Счётчики ограничителя: сколько раз ждали слот, суммарное ожидание, полученные 429
+    и фактический расход токенов.
+    """
+    client = get_redis_client()
+    if client is None:
+        return {}
+    try:
+        stats = client.hgetall(f"ai:ratelimit:{provider}:stats")
+        blocked_until = float(client.get(f"ai:ratelimit:{provider}:blocked_until") or 0)
+    except RedisError:
+        return {}
+    rpm, tpm, max_concurrency = get_provider_limits(provider)
+    return {
+        "rpm": rpm,
+        "tpm": tpm,
+        "max_concurrency": max_concurrency,
+        "waits": int(float(stats.get("waits", 0))),
+        "wait_seconds": round(float(stats.get("wait_seconds", 0)), 2),
+        "throttled": int(float(stats.get("throttled", 0))),
+        "calls": int(stats.get("calls", 0)),
+        "prompt_tokens": int(stats.get("prompt_tokens", 0)),
+        "completion_tokens": int(stats.get("completion_tokens", 0)),
+        "blocked_for": round(max(0.0, blocked_until - time.time()), 1),
+    }
@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.ai.openai_client import generate_text_openai, stream_text_openai
+from app.ai.groqai_client import generate_text_groq, stream_text_groq
+from app.ai.deepseek_client import generate_text_deepseek, stream_text_deepseek
+from app.ai.fake_client import generate_text_fake, stream_text_fake
+from app.ai.ratelimit import get_rate_limit_stats
+from app.utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_FUNCTIONS = {
+    "groq": generate_text_groq,
+    "openai": generate_text_openai,
+    "deepseek": generate_text_deepseek,
+    "fake": generate_text_fake,
+}
+
+STREAM_FUNCTIONS = {
+    "groq": stream_text_groq,
+    "openai": stream_text_openai,
+    "deepseek": stream_text_deepseek,
+    "fake": stream_text_fake,
+}
+
+PROVIDER_DISPLAY_NAMES = {
+    "openai": "OpenAI",
+    "groq": "Groq",
+    "deepseek": "DeepSeek",
+    "fake": "Fake",
+}
+
+
+def is_provider_configured(provider: str) -> bool:
+    """
+    Проверяет, задан ли API ключ провайдера.
+    """
+    if provider == "openai":
+        return bool(settings.openai_api_key)
+    elif provider == "deepseek":
+        return bool(settings.deepseek_api_key)
+    elif provider == "groq":
+        return bool(settings.groq_api_key)
+    elif provider == "fake":
+        # Фейковый провайдер участвует в маршруте, только если выбран явно
+        return settings.ai_provider.lower() == "fake" or "fake" in settings.ai_provider_order_list
+    return False
+
+
+def get_configured_order() -> list[str]:
+    """
+    Порядок провайдеров из AI_PROVIDER_ORDER. По умолчанию первым идёт AI_PROVIDER,
+    за ним остальные известные провайдеры. Провайдеры без ключа пропускаются.
+    """
+    order = settings.ai_provider_order_list or [settings.ai_provider.lower(), *PROVIDER_FUNCTIONS]
+    result: list[str] = []
+    for provider in order:
+        if provider not in PROVIDER_FUNCTIONS:
+            logger.warning(f"Unknown AI provider '{provider}' in routing order. Skipping.")
+            continue
+        if provider not in result and is_provider_configured(provider):
+            result.append(provider)
+    return result
+
+
+def get_route_signature() -> tuple[str, str]:
+    """
+    Строки "провайдеры" и "модели" текущего маршрута (для ключей кэша и отпечатков черновиков).
+    """
+    order = get_configured_order()
+    return ",".join(order), ",".join(get_provider_model(provider) for provider in order)
+
+
+def get_provider_model(provider: str) -> str:
+    """
+    Возвращает модель, настроенную для провайдера.
+    """
+    return {
+        "openai": settings.openai_model,
+        "deepseek": settings.deepseek_model,
+        "groq": settings.groq_model,
+        "fake": "fake-model",
+    }.get(provider, settings.groq_model)
+
+
+# --- Скользящая статистика провайдеров (в Redis, общая для бота, API и воркеров) ---
+
+def record_provider_result(provider: str, ok: bool, latency_ms: float) -> None:
+    """
+    Записывает результат запроса в скользящее окно AI_STATS_WINDOW последних вызовов.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.lpush(f"ai:stats:{provider}:window", f"{'ok' if ok else 'err'}:{latency_ms:.0f}")
+        pipe.ltrim(f"ai:stats:{provider}:window", 0, settings.ai_stats_window - 1)
+        pipe.hincrby(f"ai:stats:{provider}", "requests", 1)
+        if not ok:
+            pipe.hincrby(f"ai:stats:{provider}", "errors", 1)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in record_provider_result: {e}")
+
+
+def record_provider_ttft(provider: str, ttft_ms: float) -> None:
+    """
+    Записывает время до первого токена (TTFT) стримингового ответа в скользящее окно.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.lpush(f"ai:stats:{provider}:ttft", f"{ttft_ms:.0f}")
+        pipe.ltrim(f"ai:stats:{provider}:ttft", 0, settings.ai_stats_window - 1)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in record_provider_ttft: {e}")
+
+
+def record_provider_event(provider: str, event: str) -> None:
+    """
+    Увеличивает счётчик события провайдера (hedged — запущен как резервный, cancelled — отменён).
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.hincrby(f"ai:stats:{provider}", event, 1)
+    except RedisError:
+        pass
+
+
+def _window_stats(window: list[str]) -> dict:
+    # Доля ошибок и перцентили задержки успешных ответов по скользящему окну провайдера
+    latencies = sorted(float(entry.split(":", 1)[1]) for entry in window if entry.startswith("ok:"))
+    errors = sum(1 for entry in window if entry.startswith("err:"))
+    return {
+        "samples": len(window),
+        "p50_ms": _percentile(latencies, 0.5),
+        "p90_ms": _percentile(latencies, 0.9),
+        "error_rate": round(errors / len(window), 3) if window else 0.0,
+    }
+
+
+def get_provider_stats(provider: str) -> dict:
+    """
+    Возвращает скользящую статистику провайдера: p50/p90 задержки успешных ответов
+    и долю ошибок в окне, время до первого токена (TTFT) стриминга, а также накопленные счётчики.
+    """
+    client = get_redis_client()
+    window: list[str] = []
+    ttft_window: list[str] = []
+    counters: dict = {}
+    if client is not None:
+        try:
+            window = client.lrange(f"ai:stats:{provider}:window", 0, -1)
+            ttft_window = client.lrange(f"ai:stats:{provider}:ttft", 0, -1)
+            counters = client.hgetall(f"ai:stats:{provider}")
+        except RedisError as e:
+            logger.error(f"Redis error in get_provider_stats: {e}")
+
+    ttfts = sorted(float(entry) for entry in ttft_window)
+    return {
+        "provider": provider,
+        "configured": is_provider_configured(provider),
+        **_window_stats(window),
+        "ttft_p50_ms": _percentile(ttfts, 0.5),
+        "ttft_p90_ms": _percentile(ttfts, 0.9),
+        "requests": int(counters.get("requests", 0)),
+        "errors": int(counters.get("errors", 0)),
+        "hedged": int(counters.get("hedged", 0)),
+        "cancelled": int(counters.get("cancelled", 0)),
+        "rate_limit": get_rate_limit_stats(provider),
+    }
+
+
+def get_all_provider_stats() -> list[dict]:
+    return [get_provider_stats(provider) for provider in PROVIDER_FUNCTIONS]
+
+
+def _percentile(sorted_values: list[float], q: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+# --- Маршрутизация ---
+
+# Окна статистики для маршрутизации читаются одним pipeline и кэшируются на ROUTING_STATS_TTL
+# секунд: генерации и стримы одного цикла не ждут Redis на каждый запрос
+ROUTING_STATS_TTL = 1.0
+_routing_stats: tuple[float, tuple[str, ...], dict[str, dict]] = (0.0, (), {})
+
+
+def load_routing_stats(providers: list[str]) -> dict[str, dict]:
+    """
+    Читает окна статистики провайдеров маршрута одним pipeline и обновляет кэш маршрутизации.
+    """
+    global _routing_stats
+    windows: list[list[str]] = [[] for _ in providers]
+    client = get_redis_client()
+    if client is not None and providers:
+        try:
+            pipe = client.pipeline()
+            for provider in providers:
+                pipe.lrange(f"ai:stats:{provider}:window", 0, -1)
+            windows = pipe.execute()
+        except RedisError as e:
+            logger.error(f"Redis error in load_routing_stats: {e}")
+    stats = {provider: _window_stats(window) for provider, window in zip(providers, windows)}
+    _routing_stats = (time.monotonic(), tuple(providers), stats)
+    return stats
+
+
+async def get_routing_stats(providers: list[str]) -> dict[str, dict]:
+    """
+    Статистика маршрутизации из кэша; устаревший кэш перечитывается в потоке, не блокируя цикл.
+    """
+    loaded_at, cached_providers, stats = _routing_stats
+    if cached_providers == tuple(providers) and time.monotonic() - loaded_at < ROUTING_STATS_TTL:
+        return stats
+    return await asyncio.to_thread(load_routing_stats, providers)
+
+
+def get_routing_order(order: list[str], stats: dict[str, dict]) -> list[str]:
+    """
+    Порядок попыток: настроенный порядок, но провайдеры с долей ошибок выше
+    AI_ROUTER_MAX_ERROR_RATE переносятся в конец (остаются последним шансом).
+    """
+    healthy, degraded = [], []
+    for provider in order:
+        provider_stats = stats.get(provider) or _window_stats([])
+        if provider_stats["samples"] >= 5 and provider_stats["error_rate"] > settings.ai_router_max_error_rate:
+            degraded.append(provider)
+        else:
+            healthy.append(provider)
+    if degraded:
+        logger.warning(f"AI providers with high error rate moved to the end of routing: {degraded}")
+    return healthy + degraded
+
+
+def get_hedge_delay(provider: str, stats: dict[str, dict]) -> float:
+    """
+    Задержка перед запуском резервного провайдера: p90 задержки основного,
+    ограниченная AI_HEDGE_MIN_DELAY..AI_HEDGE_MAX_DELAY (секунды).
+    """
+    p90_ms = (stats.get(provider) or {}).get("p90_ms")
+    if p90_ms is None:
+        return settings.ai_hedge_max_delay
+    return min(settings.ai_hedge_max_delay, max(settings.ai_hedge_min_delay, p90_ms / 1000))
+
+
+async def _timed_call(provider: str, prompt: str, system_message: str, max_tokens: int | None = None, history: list[dict] | None = None) -> str | None:
+    started = time.perf_counter()
+    try:
+        result = await PROVIDER_FUNCTIONS[provider](prompt, system_message, max_tokens, history)
+    except asyncio.CancelledError:
+        record_provider_event(provider, "cancelled")
+        raise
+    except Exception as e:
+        logger.error(f"Provider {provider} raised: {e}")
+        result = None
+    record_provider_result(provider, bool(result), (time.perf_counter() - started) * 1000)
+    return result
+
+
+async def route_generation(prompt: str, system_message: str, max_tokens: int | None = None, history: list[dict] | None = None) -> tuple[str | None, str | None]:
+    """
+    Генерирует текст, перебирая провайдеров по порядку маршрутизации.
+
+    - Failover: если провайдер вернул ошибку/пустой ответ, запрос уходит следующему.
+    - Hedging: если основной провайдер не ответил за свою p90 задержку, параллельно
+      запускается следующий; побеждает первый успешный ответ, проигравший отменяется.
+
+    max_tokens ограничивает длину ответа (None — бюджет ответа провайдера),
+    history — предыдущие сообщения диалога.
+    Возвращает (текст, провайдер) или (None, None), если не ответил никто.
+    """
+    configured = get_configured_order()
+    if not configured:
+        logger.error("No AI provider is configured (missing API keys).")
+        return None, None
+    stats = await get_routing_stats(configured)
+    order = get_routing_order(configured, stats)
+
+    in_flight: dict[asyncio.Task, str] = {}
+    next_index = 0
+
+    def launch(hedged: bool = False) -> None:
+        nonlocal next_index
+        provider = order[next_index]
+        next_index += 1
+        if hedged:
+            record_provider_event(provider, "hedged")
+        in_flight[asyncio.create_task(_timed_call(provider, prompt, system_message, max_tokens, history))] = provider
+
+    launch()
+    try:
+        while in_flight:
+            timeout = None
+            if settings.ai_hedge_enabled and next_index < len(order) and len(in_flight) == 1:
+                timeout = get_hedge_delay(next(iter(in_flight.values())), stats)
+
+            done, _ = await asyncio.wait(in_flight.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info(f"Provider {next(iter(in_flight.values()))} is slow (> {timeout:.1f}s), hedging with {order[next_index]}")
+                launch(hedged=True)
+                continue
+
+            for task in done:
+                provider = in_flight.pop(task)
+                result = task.result()
+                if result:
+                    return result, provider
+                logger.warning(f"Provider {provider} failed, trying next provider")
+
+            # Никто не ответил успешно — переходим к следующему провайдеру (failover)
+            if not in_flight and next_index < len(order):
+                launch()
+    finally:
+        # Отменяем проигравшие запросы
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    return None, None
+
+
+async def route_stream(prompt: str, system_message: str, max_tokens: int | None = None, history: list[dict] | None = None) -> AsyncIterator[tuple[str, str]]:
+    """
+    Стриминговая генерация: отдаёт пары (часть текста, провайдер) по мере генерации.
+
+    Failover возможен только до первого токена: если провайдер не отдал ни одной части,
+    запрос уходит следующему. После первого токена ответ продолжается у того же провайдера.
+    Время до первого токена записывается в статистику провайдера.
+    """
+    configured = get_configured_order()
+    if not configured:
+        logger.error("No AI provider is configured (missing API keys).")
+        return
+    order = get_routing_order(configured, await get_routing_stats(configured))
+
+    for provider in order:
+        started = time.perf_counter()
+        received = False
+        stream = STREAM_FUNCTIONS[provider](prompt, system_message, max_tokens, history)
+        try:
+            async for content in stream:
+                if not received:
+                    received = True
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                    record_provider_ttft(provider, ttft_ms)
+                    logger.info(f"First token from {provider} in {ttft_ms:.0f} ms")
+                yield content, provider
+        finally:
+            await stream.aclose()
+
+        record_provider_result(provider, received, (time.perf_counter() - started) * 1000)
+        if received:
+            return
+        logger.warning(f"Provider {provider} returned no stream, trying next provider")
@@ -0,0 +1,108 @@
+# Быстрая локальная оценка количества токенов (без загрузки токенизатора модели)
+# и бюджеты токенов провайдеров для построения промптов.
+import logging
+import math
+import re
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# В среднем около 3 символов на токен для смеси русского и английского текста
+CHARS_PER_TOKEN = 3.0
+# Ожидаемый размер ответа, который резервируется в квоте токенов до получения usage
+COMPLETION_TOKENS_ESTIMATE = 512
+# Запас на ответ сверх оценки по символам (эмодзи и редкие слова дробятся на несколько токенов)
+OUTPUT_TOKENS_MARGIN = 2.0
+# Меньше этого ответ не запрашиваем, даже если промпт почти заполнил контекст
+MIN_OUTPUT_TOKENS = 64
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубо оценивает количество токенов в тексте.
+    """
+    if not text:
+        return 0
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def estimate_messages_tokens(messages: list[dict]) -> int:
+    """
+    Оценка токенов списка сообщений чата (с небольшой служебной надбавкой на каждое сообщение).
+    """
+    return sum(estimate_tokens(message.get("content") or "") + 4 for message in messages)
+
+
+def output_tokens_for_chars(chars: int) -> int:
+    """
+    Лимит max_tokens для ответа длиной около chars символов (с запасом).
+    """
+    return math.ceil(chars / CHARS_PER_TOKEN * OUTPUT_TOKENS_MARGIN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens (по оценке) на границе предложения.
+    Если не помещается даже первое предложение, режет по границе слова и ставит "…".
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    result = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        candidate = f"{result} {sentence}" if result else sentence
+        if len(candidate) > max_chars:
+            break
+        result = candidate
+    if result:
+        return result
+
+    cut = text[:max_chars].rsplit(" ", 1)[0] if " " in text[:max_chars] else text[:max_chars]
+    return cut.rstrip(" ,;:-") + "…"
+
+
+def get_token_budget(provider: str) -> tuple[int, int]:
+    """
+    Бюджет провайдера: (размер контекста, максимум токенов ответа).
+    """
+    return {
+        "groq": (settings.groq_context_tokens, settings.groq_max_output_tokens),
+        "openai": (settings.openai_context_tokens, settings.openai_max_output_tokens),
+        "deepseek": (settings.deepseek_context_tokens, settings.deepseek_max_output_tokens),
+    }.get(provider, (8192, 2048))
+
+
+def fit_output_tokens(provider: str, prompt_tokens: int, requested: int | None = None) -> int:
+    """
+    Размер max_tokens запроса: запрошенный (или бюджет ответа провайдера), но не больше
+    бюджета ответа и не больше, чем осталось в контексте после промпта.
+    """
+    context_tokens, max_output_tokens = get_token_budget(provider)
+    max_tokens = min(requested or max_output_tokens, max_output_tokens)
+    available = context_tokens - prompt_tokens
+    if available < max_tokens:
+        logger.warning(
+            f"Prompt for {provider} (~{prompt_tokens} tokens) leaves {available} of {context_tokens} "
+            f"context tokens for the answer"
+        )
+        max_tokens = max(MIN_OUTPUT_TOKENS, available)
+    return max_tokens
+
+
+def reserved_tokens(prompt_tokens: int, max_tokens: int) -> int:
+    """
+    Сколько токенов списать из квоты до ответа: промпт и ожидаемый (не максимальный) ответ.
+    Точное значение учитывается после ответа по usage.
+    """
+    return prompt_tokens + min(max_tokens, COMPLETION_TOKENS_ESTIMATE)
+
+
+def get_min_context_tokens(providers: list[str]) -> int:
+    """
+    Наименьший контекст среди провайдеров маршрута: промпт должен поместиться в любой из них.
+    """
+    return min((get_token_budget(provider)[0] for provider in providers), default=get_token_budget("")[0])
@@ -1,14 +1,21 @@
 """ Маршруты для FastAPI """
+import base64
+import json
+import zlib
+from datetime import datetime, timezone
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from starlette.concurrency import run_in_threadpool
 
+from app.config import settings
 from app.schemas import NewsItem, Post, Source, Keywords
 from app.news_parser import collect_from_all_sources
 from app.utils import (
-    list_news_items, 
+    list_news_page,
+    prune_expired_news,
+    get_news_index_version,
     get_news_item, 
-    save_post, 
     add_keyword, 
     list_keywords, 
     delete_keyword, 
@@ -16,14 +23,28 @@ from app.utils import (
     list_sources, 
     delete_source,
     get_post,
-    get_redis_client
+    get_redis_client,
+    get_chat_memory_stats,
+    get_chat_queue_stats,
+    is_news_published_to,
+    get_scrape_report,
 )
-from app.telegram.publisher import publish_to_channel
-from app.ai.generator import generate_telegram_post
+from app.telegram.publish_queue import (
+    enqueue_publication, get_publish_queue_stats, channel_key, create_outbox_entries, discard_outbox_entries,
+    publish_now, list_outbox_entries, STATUS_PUBLISHED, STATUS_FAILED,
+)
+from app.ai.generator import generate_telegram_post, get_post_text
+from app.ai.cache import get_generation_cache_stats
+from app.ai.router import get_all_provider_stats
 from app.filters import filter_news
 
 
-from app.tasks import fetch_and_store_news_task, publish_next_news_task
+from app.tasks import (
+    fetch_and_store_news_task, publish_next_news_task, schedule_publish_dispatch, finish_scrape_run, scrape_run_result,
+    SCRAPE_LEASE,
+)
+from app.publish_schedule import get_publish_plan, record_publication
+from app.lease import acquire_lease, current_lease, hold_lease, wait_for_lease_result
 
 api_router = APIRouter()
 
@@ -33,7 +54,7 @@ async def manual_publish():
     """
     Принудительно запускает задачу публикации следующей новости.
     """
-    result = publish_next_news_task.delay()
+    result = publish_next_news_task.delay(force=True)
     return {"status": "Task queued", "task_id": result.id}
 
 # Эндпоинт "/news/scrape-task"
@@ -41,11 +62,24 @@ async def manual_publish():
 async def manual_scrape():
     """
     Принудительно запускает задачу сбора новостей в фоновом режиме.
+    Если сбор уже идёт, новый не ставится — возвращается номер идущего запуска.
     """
+    running = current_lease(SCRAPE_LEASE)
+    if running is not None:
+        return {"status": "Already running", "run": running}
     result = fetch_and_store_news_task.delay()
     return {"status": "Task queued", "task_id": result.id}
 
 
+# Эндпоинт "/news/scrape/report"
+@api_router.get("/news/scrape/report", response_model=dict)
+async def scrape_report():
+    """
+    Отчёт последнего сбора новостей: сколько собрано и отфильтровано, время и ошибки по источникам.
+    """
+    return get_scrape_report()
+
+
 # Эндпоинт "/health"
 @api_router.get("/health")
 async def health():
@@ -54,10 +88,68 @@ async def health():
     """
     return {"status": "ok"}
 
+def _encode_cursor(cursor: tuple[float, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[float, str]:
+    try:
+        score, news_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), str(news_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный cursor")
+
+
+def _news_etag(query: str) -> str:
+    return f'W/"{get_news_index_version()}-{zlib.crc32(query.encode("utf-8")):08x}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # Слабое сравнение: W/ не учитывается
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
 # Эндпоинт "/news"
 @api_router.get("/news", response_model=list[NewsItem])
-async def news_list(limit: int | None = None) -> list[NewsItem]:
-    return list_news_items(limit=limit)
+async def news_list(
+    request: Request,
+    response: Response,
+    limit: int | None = Query(default=None, ge=1),
+    cursor: str | None = None,
+    source: str | None = None,
+    since: datetime | None = None,
+    published: bool | None = None,
+    keyword: str | None = None,
+):
+    """
+    Новости от новых к старым, постранично: курсор следующей страницы приходит в заголовке
+    X-Next-Cursor. Фильтры: source, since (published_at не раньше), published, keyword.
+    Слабый ETag меняется только при изменении списка новостей — на If-None-Match отвечает 304.
+    """
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    # Истёкшие по TTL новости убираются до расчёта ETag: их истечение тоже меняет список
+    prune_expired_news()
+    etag = _news_etag(query)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    items, next_cursor = list_news_page(
+        limit=min(limit or settings.max_news_items, settings.max_news_items),
+        cursor=_decode_cursor(cursor) if cursor else None,
+        source=source,
+        # Время без часового пояса считается UTC, как и published_at новостей
+        since=(since if since.tzinfo else since.replace(tzinfo=timezone.utc)).timestamp() if since else None,
+        published=published,
+        keyword=keyword,
+    )
+    # Выдача могла сама убрать истёкшие id и сменить версию — ETag описывает итоговое состояние
+    response.headers.update({"ETag": _news_etag(query), "Cache-Control": "no-cache"})
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = _encode_cursor(next_cursor)
+    return items
 
 
 # Эндпоинт "/news/scrape"
@@ -65,9 +157,24 @@ async def news_list(limit: int | None = None) -> list[NewsItem]:
 async def scrape_news():
     """
     Запускает парсер новостей со всех источников, фильтрует их и возвращает актуальный список.
+    Если сбор уже идёт (по расписанию или из другого запроса), ждёт его и возвращает его результат.
     """
-    news_items = collect_from_all_sources()
-    filtered_news = filter_news(news_items)
+    token = acquire_lease(SCRAPE_LEASE, settings.scrape_lock_ttl)
+    if token is None:
+        running = current_lease(SCRAPE_LEASE)
+        # Дольше всего сбор ждёт самый медленный источник со всеми повторами
+        timeout = settings.scrape_source_time_limit * (settings.scrape_source_max_retries + 1)
+        result = await run_in_threadpool(wait_for_lease_result, SCRAPE_LEASE, running, timeout)
+        # Результат запуска — тот же отфильтрованный список, что вернул бы его владелец
+        return [NewsItem.model_validate(item) for item in result["news"]] if result else []
+
+    filtered_news = []
+    try:
+        with hold_lease(SCRAPE_LEASE, token, settings.scrape_lock_ttl):
+            news_items = await run_in_threadpool(collect_from_all_sources)
+            filtered_news = filter_news(news_items)
+    finally:
+        finish_scrape_run(token, scrape_run_result(filtered_news))
     return filtered_news
 
 
@@ -75,7 +182,7 @@ async def scrape_news():
 @api_router.post("/news/{news_id}/publish", response_model=Post)
 async def publish_news(news_id: str) -> Post:
     """
-    Публикует выбранную новость в Telegram‑канал и сохраняет информацию о посте.
+    Публикует выбранную новость в основной Telegram‑канал (TELEGRAM_CHANNEL_ID) и сохраняет информацию о посте.
     """
     news = get_news_item(news_id)
     if news is None:
@@ -84,26 +191,52 @@ async def publish_news(news_id: str) -> Post:
             detail="Новость не найдена в хранилище",
         )
 
-    # Генерируем текст поста через AI
-    text = await generate_telegram_post(news)
+    channel = channel_key()
+    if is_news_published_to(news.id, channel):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Новость уже опубликована в канале",
+        )
+    # Запись outbox создаётся атомарно: повторный запрос не отправит пост второй раз
+    if not create_outbox_entries(news.id, [channel]):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Новость уже публикуется в канале",
+        )
 
+    # Берём готовый черновик или генерируем текст поста через AI
     try:
-        message_id = await publish_to_channel(text, url=str(news.url))
-    except Exception as exc:
+        text = await get_post_text(news)
+    except Exception:
+        discard_outbox_entries(news.id, [channel])
+        raise
+    if enqueue_publication(news.id, text, url=str(news.url), channel=channel) is None:
+        discard_outbox_entries(news.id, [channel])
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Не удалось поставить пост в очередь канала",
+        )
+    # Ручная публикация тоже расходует дневной лимит и сдвигает следующий плановый слот
+    record_publication()
+
+    entry = await publish_now(news.id, channel)
+    if entry.get("status") == STATUS_PUBLISHED:
+        return Post(
+            id=str(uuid4()),
+            news_id=news.id,
+            generated_text=text,
+            published_at=news.published_at,
+            channel_id=channel,
+            status="published",
+        )
+    if entry.get("status") == STATUS_FAILED:
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"Ошибка при отправке сообщения в Telegram: {exc}",
+            detail=f"Ошибка при отправке сообщения в Telegram: {entry.get('error')}",
         )
-
-    post = Post(
-        id=str(uuid4()),
-        news_id=news.id,
-        generated_text=text,
-        published_at=news.published_at,
-        status="published",
-    )
-    save_post(post)
-    return post
+    # FloodWait или временная ошибка — пост не теряется, а ждёт своей очереди в канале
+    schedule_publish_dispatch(0)
+    return Post(id=str(uuid4()), news_id=news.id, generated_text=text, channel_id=channel, status="queued")
 
 
 @api_router.get("/posts", response_model=list[Post])
@@ -165,6 +298,7 @@ async def remove_keyword(keyword: str):
 async def generate_only(news_id: str):
     """
     Генерирует текст поста без публикации (для теста).
+    Результат попадает в кэш генераций и переиспользуется при публикации этой новости.
     """
     news = get_news_item(news_id)
     if news is None:
@@ -172,3 +306,61 @@ async def generate_only(news_id: str):
     
     text = await generate_telegram_post(news)
     return {"news_id": news_id, "generated_text": text}
+
+
+@api_router.get("/ai/cache/stats", response_model=dict)
+async def generation_cache_stats():
+    """
+    Статистика кэша генераций постов (попадания, промахи, доля попаданий, размер).
+    """
+    return get_generation_cache_stats()
+
+
+@api_router.get("/ai/chat/memory/stats", response_model=dict)
+async def chat_memory_stats():
+    """
+    Память диалогов чата с ИИ: число пользователей с историей и занимаемые байты в Redis.
+    """
+    return get_chat_memory_stats()
+
+
+@api_router.get("/ai/chat/queue/stats", response_model=list[dict])
+async def chat_queue_stats():
+    """
+    Очередь чата с ИИ по пользователям: глубина очереди, ожидание и объединённые сообщения.
+    """
+    return get_chat_queue_stats()
+
+
+@api_router.get("/publish/queue/stats", response_model=list[dict])
+async def publish_queue_stats():
+    """
+    Очередь публикаций по каналам: размер, время до следующей отправки, интервал,
+    опубликовано за час/сутки и полученные FloodWait.
+    """
+    return get_publish_queue_stats()
+
+
+@api_router.get("/publish/schedule", response_model=dict)
+async def publish_schedule():
+    """
+    Решение адаптивного планировщика: когда следующая публикация, выбранный интервал и почему
+    (глубина очереди, свежесть новостей, активные часы, дневной лимит).
+    """
+    return get_publish_plan()
+
+
+@api_router.get("/publish/outbox", response_model=list[dict])
+async def publish_outbox(status: str | None = None, limit: int = 100):
+    """
+    Записи outbox публикаций (new, generated, publishing, published, failed) без текста поста.
+    """
+    return list_outbox_entries(status=status, limit=limit)
+
+
+@api_router.get("/ai/providers/stats", response_model=list[dict])
+async def ai_providers_stats():
+    """
+    Скользящая статистика провайдеров ИИ: задержки p50/p90, доля ошибок, резервные запросы.
+    """
+    return get_all_provider_stats()
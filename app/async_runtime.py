@@ -0,0 +1,107 @@
+# Долгоживущий event loop процесса воркера Celery: асинхронный код задач выполняется в одном
+# цикле, поэтому пулы HTTP-соединений, клиенты ИИ и сессия Telethon переживают задачу.
+#
+# Цикл работает в отдельном потоке, задачи отправляют в него корутины через run_async.
+# Вне воркера (API, CLI, тесты) run_async запускает корутину во временном цикле и закрывает
+# ресурсы этого цикла сразу после неё.
+import asyncio
+import logging
+import os
+import threading
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_loop: asyncio.AbstractEventLoop | None = None
+_thread: threading.Thread | None = None
+# Процесс, в котором запущен цикл: после fork (prefork-пул) поток цикла в дочернем процессе не существует
+_pid: int | None = None
+# Закрытие ресурсов, привязанных к циклу (клиенты ИИ, клиент публикации)
+_cleanups: list[Callable[[], Awaitable[None]]] = []
+
+# Сколько ждать закрытия ресурсов и остановки цикла при завершении процесса
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def register_loop_cleanup(cleanup: Callable[[], Awaitable[None]]) -> None:
+    """
+    Регистрирует корутинную функцию, закрывающую ресурсы текущего цикла. Вызывается при
+    остановке цикла воркера или после каждой корутины во временном цикле.
+    """
+    if cleanup not in _cleanups:
+        _cleanups.append(cleanup)
+
+
+async def _run_cleanups() -> None:
+    for cleanup in _cleanups:
+        try:
+            await cleanup()
+        except Exception as e:
+            logger.warning(f"Error in loop cleanup {cleanup.__name__}: {e}")
+
+
+def start_worker_loop() -> None:
+    """
+    Запускает цикл процесса в фоновом потоке (worker_process_init в prefork-пуле, worker_init
+    в пуле потоков). Повторный вызов в том же процессе ничего не делает.
+    """
+    global _loop, _thread, _pid
+    if get_worker_loop() is not None:
+        return
+    _pid = os.getpid()
+    _loop = asyncio.new_event_loop()
+    _thread = threading.Thread(target=_loop.run_forever, name="worker-event-loop", daemon=True)
+    _thread.start()
+    logger.info("Started persistent worker event loop")
+
+
+def stop_worker_loop() -> None:
+    """
+    Закрывает ресурсы цикла и останавливает его (worker_process_shutdown).
+    """
+    global _loop, _thread
+    loop, thread = get_worker_loop(), _thread
+    _loop, _thread = None, None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_run_cleanups(), loop).result(timeout=SHUTDOWN_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Error while closing worker loop resources: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(timeout=SHUTDOWN_TIMEOUT)
+    if not loop.is_running():
+        loop.close()
+    logger.info("Stopped persistent worker event loop")
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop | None:
+    if _loop is None or _loop.is_closed() or _pid != os.getpid():
+        return None
+    return _loop
+
+
+async def _run_once(coro, timeout: float | None):
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    finally:
+        await _run_cleanups()
+
+
+def run_async(coro, timeout: float | None = None):
+    """
+    Выполняет корутину из синхронного кода задачи и возвращает её результат. В воркере — в
+    постоянном цикле процесса, иначе — во временном цикле через asyncio.run. По истечении
+    timeout корутина отменяется (так действуют лимиты времени в пуле потоков).
+    """
+    loop = get_worker_loop()
+    if loop is None:
+        return asyncio.run(_run_once(coro, timeout))
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout=timeout)
+    except BaseException:
+        # Таймаут или SoftTimeLimitExceeded задачи — корутина не должна работать дальше без неё
+        future.cancel()
+        raise
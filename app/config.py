@@ -1,3 +1,5 @@
+import json
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -18,6 +20,34 @@ class Settings(BaseSettings):
     telegram_bot_token: str = Field(default="", validation_alias="TELEGRAM_BOT_TOKEN")
     telegram_channel_id: str = Field(default="", validation_alias="TELEGRAM_CHANNEL_ID")
 
+    # Telegram Publisher Settings (telethon - MTProto клиент, botapi - HTTP Bot API)
+    telegram_publisher_backend: str = Field(default="telethon", validation_alias="TELEGRAM_PUBLISHER_BACKEND")
+    telegram_bot_api_url: str = Field(default="https://api.telegram.org", validation_alias="TELEGRAM_BOT_API_URL")
+    telegram_bot_api_timeout: float = Field(default=15.0, validation_alias="TELEGRAM_BOT_API_TIMEOUT")
+
+    # Publish queue Settings (очередь отправки постов по каналам с учётом FloodWait)
+    publish_queue_min_interval: float = Field(default=20.0, validation_alias="PUBLISH_QUEUE_MIN_INTERVAL")
+    publish_queue_max_interval: float = Field(default=300.0, validation_alias="PUBLISH_QUEUE_MAX_INTERVAL")
+    publish_queue_max_attempts: int = Field(default=5, validation_alias="PUBLISH_QUEUE_MAX_ATTEMPTS")
+    publish_queue_retry_delay: float = Field(default=60.0, validation_alias="PUBLISH_QUEUE_RETRY_DELAY")
+    publish_claim_timeout: float = Field(default=300.0, validation_alias="PUBLISH_CLAIM_TIMEOUT")
+    publish_sweep_interval: int = Field(default=5, validation_alias="PUBLISH_SWEEP_INTERVAL")
+
+    # Publish schedule Settings (адаптивный темп: интервалы в минутах, окна в часовом поясе канала)
+    publish_active_hours: str = Field(default="", validation_alias="PUBLISH_ACTIVE_HOURS")
+    publish_cadence_min_interval: int = Field(default=5, validation_alias="PUBLISH_CADENCE_MIN_INTERVAL")
+    publish_cadence_max_interval: int = Field(default=0, validation_alias="PUBLISH_CADENCE_MAX_INTERVAL")
+    publish_daily_budget: int = Field(default=0, validation_alias="PUBLISH_DAILY_BUDGET")
+
+    # Celery queues Settings (очереди scrape / ai / publish со своими лимитами времени задач в секундах)
+    celery_scrape_time_limit: int = Field(default=300, validation_alias="CELERY_SCRAPE_TIME_LIMIT")
+    celery_ai_time_limit: int = Field(default=240, validation_alias="CELERY_AI_TIME_LIMIT")
+    celery_publish_time_limit: int = Field(default=120, validation_alias="CELERY_PUBLISH_TIME_LIMIT")
+    celery_hard_time_limit_margin: int = Field(default=30, validation_alias="CELERY_HARD_TIME_LIMIT_MARGIN")
+
+    # Channel routing Settings (дополнительные каналы по ключевым словам и источникам)
+    channel_routes: str = Field(default="", validation_alias="CHANNEL_ROUTES")
+
     # News Settings
     news_keywords: str = Field(default="", validation_alias="NEWS_KEYWORDS")
     news_time: int = Field(default=30, validation_alias="NEWS_TIME")
@@ -26,6 +56,25 @@ class Settings(BaseSettings):
     time_life_news: int = Field(default=172800, validation_alias="TIME_LIFE_NEWS")
     timezone: str = Field(default="UTC", validation_alias="TIMEZONE")
     utc_offset: int = Field(default=0, validation_alias="UTC_OFFSET")
+    scrape_low_watermark: int = Field(default=3, validation_alias="SCRAPE_LOW_WATERMARK")
+    scrape_lock_ttl: int = Field(default=120, validation_alias="SCRAPE_LOCK_TTL")
+    scrape_refill_cooldown: int = Field(default=600, validation_alias="SCRAPE_REFILL_COOLDOWN")
+    scrape_source_time_limit: int = Field(default=90, validation_alias="SCRAPE_SOURCE_TIME_LIMIT")
+    scrape_source_max_retries: int = Field(default=2, validation_alias="SCRAPE_SOURCE_MAX_RETRIES")
+    scrape_source_retry_delay: int = Field(default=15, validation_alias="SCRAPE_SOURCE_RETRY_DELAY")
+
+    # Ranking Settings (оценка релевантности очереди публикации)
+    ranking_hash_dim: int = Field(default=4096, validation_alias="RANKING_HASH_DIM")
+    ranking_half_life_hours: float = Field(default=6.0, validation_alias="RANKING_HALF_LIFE_HOURS")
+    ranking_tfidf_weight: float = Field(default=1.0, validation_alias="RANKING_TFIDF_WEIGHT")
+    ranking_keyword_weight: float = Field(default=1.0, validation_alias="RANKING_KEYWORD_WEIGHT")
+    ranking_index_size: int = Field(default=5000, validation_alias="RANKING_INDEX_SIZE")
+    source_weights: str = Field(default="", validation_alias="SOURCE_WEIGHTS")
+
+    # Near-duplicate Settings (поиск одинаковых новостей из разных источников)
+    dedup_enabled: bool = Field(default=True, validation_alias="DEDUP_ENABLED")
+    dedup_lsh_bands: int = Field(default=4, validation_alias="DEDUP_LSH_BANDS")
+    dedup_max_distance: int = Field(default=3, validation_alias="DEDUP_MAX_DISTANCE")
 
     # Logging Settings
     log_max_bytes: int = Field(default=10485760, validation_alias="LOG_MAX_BYTES")
@@ -34,23 +83,93 @@ class Settings(BaseSettings):
 
     # AI Agent Settings (Multi-provider)
     ai_agent: str = Field(default="off", validation_alias="AI_AGENT")  # "on" или "off"
-    ai_provider: str = Field(default="groq", validation_alias="AI_PROVIDER")  # "groq" или "openai"
+    ai_provider: str = Field(default="groq", validation_alias="AI_PROVIDER")  # "groq", "openai", "deepseek" или "fake"
+    ai_provider_order: str = Field(default="", validation_alias="AI_PROVIDER_ORDER")  # "groq,openai,deepseek"
+
+    # AI Routing Settings (failover и hedging между провайдерами)
+    ai_hedge_enabled: bool = Field(default=True, validation_alias="AI_HEDGE_ENABLED")
+    ai_hedge_min_delay: float = Field(default=2.0, validation_alias="AI_HEDGE_MIN_DELAY")
+    ai_hedge_max_delay: float = Field(default=20.0, validation_alias="AI_HEDGE_MAX_DELAY")
+    ai_stats_window: int = Field(default=50, validation_alias="AI_STATS_WINDOW")
+    ai_router_max_error_rate: float = Field(default=0.5, validation_alias="AI_ROUTER_MAX_ERROR_RATE")
+
+    # AI Chat Settings (режим прямого общения с ИИ в боте)
+    chat_stream_enabled: bool = Field(default=True, validation_alias="CHAT_STREAM_ENABLED")
+    chat_stream_edit_interval: float = Field(default=1.5, validation_alias="CHAT_STREAM_EDIT_INTERVAL")
+    chat_mode_ttl: int = Field(default=3600, validation_alias="CHAT_MODE_TTL")
+    chat_max_concurrency: int = Field(default=4, validation_alias="CHAT_MAX_CONCURRENCY")
+    # Память диалога: бюджет истории в токенах, жёсткий лимит сообщений и размер сводки
+    chat_history_max_tokens: int = Field(default=1500, validation_alias="CHAT_HISTORY_MAX_TOKENS")
+    chat_history_max_messages: int = Field(default=20, validation_alias="CHAT_HISTORY_MAX_MESSAGES")
+    chat_summary_max_tokens: int = Field(default=300, validation_alias="CHAT_SUMMARY_MAX_TOKENS")
     
+    # AI HTTP pool Settings (долгоживущие клиенты провайдеров)
+    ai_http_max_connections: int = Field(default=20, validation_alias="AI_HTTP_MAX_CONNECTIONS")
+    ai_http_max_keepalive: int = Field(default=10, validation_alias="AI_HTTP_MAX_KEEPALIVE")
+    ai_http_keepalive_expiry: float = Field(default=60.0, validation_alias="AI_HTTP_KEEPALIVE_EXPIRY")
+    ai_http_timeout: float = Field(default=60.0, validation_alias="AI_HTTP_TIMEOUT")
+    ai_http_connect_timeout: float = Field(default=10.0, validation_alias="AI_HTTP_CONNECT_TIMEOUT")
+
+    # Generation cache Settings (кэш сгенерированных постов)
+    generation_cache_ttl: int = Field(default=172800, validation_alias="GENERATION_CACHE_TTL")
+    generation_cache_max_items: int = Field(default=1000, validation_alias="GENERATION_CACHE_MAX_ITEMS")
+
+    # Prompt budget Settings (размер промпта и ответа в токенах)
+    prompt_summary_max_tokens: int = Field(default=400, validation_alias="PROMPT_SUMMARY_MAX_TOKENS")
+
+    # Pre-generation Settings (фоновая генерация постов для начала очереди)
+    pregenerate_queue_size: int = Field(default=3, validation_alias="PREGENERATE_QUEUE_SIZE")
+    pregenerate_concurrency: int = Field(default=2, validation_alias="PREGENERATE_CONCURRENCY")
+    pregenerate_interval: int = Field(default=5, validation_alias="PREGENERATE_INTERVAL")
+    # Пакетная генерация: сколько новостей отправлять в одном запросе к ИИ (1 — без пакетов)
+    # и бюджет токенов на пакет (промпт + ожидаемый ответ)
+    generation_batch_size: int = Field(default=4, validation_alias="GENERATION_BATCH_SIZE")
+    generation_batch_max_tokens: int = Field(default=4000, validation_alias="GENERATION_BATCH_MAX_TOKENS")
+
     # Groq Settings
     groq_api_key: str = Field(default="", validation_alias="GROQ_API_KEY")
     groq_model: str = Field(default="llama-3.3-70b-versatile", validation_alias="GROQ_MODEL")
     groq_base_url: str = Field(default="https://api.groq.com", validation_alias="GROQ_BASE_URL")
     groq_reasoning_effort: str = Field(default="medium", validation_alias="GROQ_REASONING_EFFORT")
+    groq_rpm: int = Field(default=30, validation_alias="GROQ_RPM")
+    groq_tpm: int = Field(default=6000, validation_alias="GROQ_TPM")
+    groq_max_concurrency: int = Field(default=4, validation_alias="GROQ_MAX_CONCURRENCY")
+    groq_context_tokens: int = Field(default=8192, validation_alias="GROQ_CONTEXT_TOKENS")
+    groq_max_output_tokens: int = Field(default=2048, validation_alias="GROQ_MAX_OUTPUT_TOKENS")
 
     # OpenAI Settings
     openai_api_key: str = Field(default="", validation_alias="OPENAI_API_KEY")
     openai_model: str = Field(default="gpt-3.5-turbo", validation_alias="OPENAI_MODEL")
     openai_base_url: str = Field(default="https://api.openai.com/v1", validation_alias="OPENAI_BASE_URL")
+    openai_rpm: int = Field(default=500, validation_alias="OPENAI_RPM")
+    openai_tpm: int = Field(default=60000, validation_alias="OPENAI_TPM")
+    openai_max_concurrency: int = Field(default=8, validation_alias="OPENAI_MAX_CONCURRENCY")
+    openai_context_tokens: int = Field(default=16385, validation_alias="OPENAI_CONTEXT_TOKENS")
+    openai_max_output_tokens: int = Field(default=2048, validation_alias="OPENAI_MAX_OUTPUT_TOKENS")
 
     # DeepSeek Settings
     deepseek_api_key: str = Field(default="", validation_alias="DEEPSEEK_API_KEY")
     deepseek_model: str = Field(default="deepseek-chat", validation_alias="DEEPSEEK_MODEL")
     deepseek_base_url: str = Field(default="https://api.deepseek.com", validation_alias="DEEPSEEK_BASE_URL")
+    deepseek_rpm: int = Field(default=0, validation_alias="DEEPSEEK_RPM")
+    deepseek_tpm: int = Field(default=0, validation_alias="DEEPSEEK_TPM")
+    deepseek_max_concurrency: int = Field(default=8, validation_alias="DEEPSEEK_MAX_CONCURRENCY")
+    deepseek_context_tokens: int = Field(default=65536, validation_alias="DEEPSEEK_CONTEXT_TOKENS")
+    deepseek_max_output_tokens: int = Field(default=2048, validation_alias="DEEPSEEK_MAX_OUTPUT_TOKENS")
+
+    # Fake AI Settings (локальный провайдер без сети для нагрузочных тестов и замеров)
+    fake_ai_latency_ms: float = Field(default=800.0, validation_alias="FAKE_AI_LATENCY_MS")
+    fake_ai_latency_distribution: str = Field(default="lognormal", validation_alias="FAKE_AI_LATENCY_DISTRIBUTION")
+    fake_ai_latency_sigma: float = Field(default=0.5, validation_alias="FAKE_AI_LATENCY_SIGMA")
+    fake_ai_ttft_ms: float = Field(default=200.0, validation_alias="FAKE_AI_TTFT_MS")
+    fake_ai_chunk_chars: int = Field(default=20, validation_alias="FAKE_AI_CHUNK_CHARS")
+    fake_ai_error_rate: float = Field(default=0.0, validation_alias="FAKE_AI_ERROR_RATE")
+    fake_ai_rate_limit_rate: float = Field(default=0.0, validation_alias="FAKE_AI_RATE_LIMIT_RATE")
+    fake_ai_retry_after: float = Field(default=1.0, validation_alias="FAKE_AI_RETRY_AFTER")
+    fake_ai_seed: int = Field(default=42, validation_alias="FAKE_AI_SEED")
+    fake_ai_rpm: int = Field(default=0, validation_alias="FAKE_AI_RPM")
+    fake_ai_tpm: int = Field(default=0, validation_alias="FAKE_AI_TPM")
+    fake_ai_max_concurrency: int = Field(default=0, validation_alias="FAKE_AI_MAX_CONCURRENCY")
 
     @property
     def keywords_list(self) -> list[str]:
@@ -58,5 +177,34 @@ class Settings(BaseSettings):
         parts = [part.strip() for part in raw_value.split(',') if part.strip()]
         return parts
 
+    @property
+    def ai_provider_order_list(self) -> list[str]:
+        return [part.strip().lower() for part in self.ai_provider_order.split(',') if part.strip()]
+
+    @property
+    def channel_routes_list(self) -> list[dict]:
+        # Формат: JSON-список [{"channel": "@ai_feed", "keywords": ["ai"], "sources": ["habr"]}, ...]
+        if not self.channel_routes.strip():
+            return []
+        try:
+            routes = json.loads(self.channel_routes)
+        except ValueError:
+            return []
+        return [route for route in routes if isinstance(route, dict) and route.get("channel")] if isinstance(routes, list) else []
+
+    @property
+    def source_weights_map(self) -> dict[str, float]:
+        # Формат: "habr:1.2,3dnews:0.8,tg:habr_com:1.0" (id источника может содержать ":")
+        result: dict[str, float] = {}
+        for part in self.source_weights.split(','):
+            source_id, sep, weight = part.strip().rpartition(':')
+            if not sep or not source_id:
+                continue
+            try:
+                result[source_id] = float(weight)
+            except ValueError:
+                continue
+        return result
+
 
 settings = Settings()
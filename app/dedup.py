@@ -0,0 +1,146 @@
+# Поиск почти одинаковых новостей из разных источников (SimHash + банды LSH в Redis).
+import hashlib
+import logging
+import re
+
+import numpy as np
+from redis import Redis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.schemas import NewsItem
+from app.text import stem, news_summary
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_BITS = 64
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+# У сайтов описания нет, а у TG-постов это полный текст сообщения, поэтому основой
+# сигнатуры служит заголовок; начало описания добавляется только к коротким заголовкам
+MIN_TITLE_WORDS = 5
+SUMMARY_WORDS = 20
+
+_BIT_SHIFTS = np.arange(SIGNATURE_BITS, dtype=np.uint64)
+
+
+def normalize_words(news: NewsItem) -> list[str]:
+    """
+    Нормализует заголовок (и начало описания для коротких заголовков) в список слов
+    в нижнем регистре, без пунктуации.
+    """
+    words = [word for word in WORD_PATTERN.findall(news.title.lower()) if len(word) > 1]
+    summary = news_summary(news)
+    if len(words) < MIN_TITLE_WORDS and summary:
+        summary_words = [word for word in WORD_PATTERN.findall(summary.lower()) if len(word) > 1]
+        # Описание TG-поста начинается с заголовка — не дублируем его
+        if summary_words[:len(words)] == words:
+            summary_words = summary_words[len(words):]
+        words += summary_words[:SUMMARY_WORDS]
+    # Усечение словоформ даёт одинаковые шинглы для "нейросети"/"нейросеть"
+    return [stem(word) for word in words]
+
+
+def build_shingles(words: list[str], size: int = 2) -> set[str]:
+    """
+    Строит множество словесных шинглов. Для очень коротких текстов — сами слова.
+    """
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def compute_simhash(shingles: set[str]) -> int:
+    """
+    Считает 64-битный SimHash: каждый шингл голосует за биты своего хеша.
+    """
+    if not shingles:
+        return 0
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+        dtype=np.uint64,
+    )
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int(np.sum(np.left_shift(np.uint64(1), _BIT_SHIFTS[votes > 0]), dtype=np.uint64))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def split_bands(signature: int) -> list[int]:
+    """
+    Делит сигнатуру на DEDUP_LSH_BANDS равных полос. При расстоянии Хэмминга
+    не больше DEDUP_MAX_DISTANCE < числа полос хотя бы одна полоса совпадает точно.
+    """
+    bands = settings.dedup_lsh_bands
+    width = SIGNATURE_BITS // bands
+    mask = (1 << width) - 1
+    return [(signature >> (band * width)) & mask for band in range(bands)]
+
+
+def news_signature(news: NewsItem) -> int:
+    return compute_simhash(build_shingles(normalize_words(news)))
+
+
+def find_or_index_duplicate(client: Redis, news: NewsItem) -> str | None:
+    """
+    Ищет в LSH-индексе кластер, к которому относится новость.
+
+    Если найдена близкая новость (расстояние Хэмминга <= DEDUP_MAX_DISTANCE),
+    новость записывается в кластер этого представителя и возвращается id представителя.
+    Иначе сигнатура новости добавляется в индекс, новость становится представителем
+    нового кластера, и возвращается None. Все ключи живут TIME_LIFE_NEWS, как и сами новости.
+    """
+    signature = news_signature(news)
+    if signature == 0:
+        return None
+
+    ttl = settings.time_life_news
+    bands = split_bands(signature)
+    band_keys = [f"lsh:{band}:{value:x}" for band, value in enumerate(bands)]
+
+    try:
+        # 1. Кандидаты — новости, совпадающие хотя бы по одной полосе (без полного перебора)
+        pipe = client.pipeline()
+        for key in band_keys:
+            pipe.smembers(key)
+        candidates: set[str] = set().union(*pipe.execute())
+        candidates.discard(news.id)
+
+        # 2. Проверяем кандидатов по полной сигнатуре
+        if candidates:
+            candidate_ids = list(candidates)
+            raw_signatures = client.mget([f"simhash:{cid}" for cid in candidate_ids])
+            best: tuple[int, str] | None = None
+            for cid, raw in zip(candidate_ids, raw_signatures):
+                if raw is None:
+                    continue
+                distance = hamming_distance(signature, int(raw, 16))
+                if distance <= settings.dedup_max_distance and (best is None or distance < best[0]):
+                    best = (distance, cid)
+
+            if best is not None:
+                representative = client.get(f"dup:cluster:{best[1]}") or best[1]
+                pipe = client.pipeline()
+                pipe.set(f"dup:cluster:{news.id}", representative, ex=ttl)
+                pipe.sadd(f"dup:members:{representative}", news.id)
+                pipe.expire(f"dup:members:{representative}", ttl)
+                pipe.execute()
+                logger.info(
+                    f"Near-duplicate news {news.id[:12]} ({news.source}) joined cluster "
+                    f"{representative[:12]} (distance {best[0]})"
+                )
+                return representative
+
+        # 3. Новый кластер: индексируем сигнатуру по полосам
+        pipe = client.pipeline()
+        pipe.set(f"simhash:{news.id}", f"{signature:x}", ex=ttl)
+        pipe.set(f"dup:cluster:{news.id}", news.id, ex=ttl)
+        for key in band_keys:
+            pipe.sadd(key, news.id)
+            pipe.expire(key, ttl)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in find_or_index_duplicate: {e}")
+    return None
@@ -0,0 +1,203 @@
+# Распределённые замки-аренды для сбора и публикации: в каждый момент идёт не больше одного
+# запуска, а параллельные вызовы присоединяются к нему и получают его результат.
+#
+# Аренда lease:<имя> хранит fencing-токен — монотонно растущий номер запуска. Владелец продлевает
+# аренду (heartbeat), пока работает; после падения процесса аренда истекает сама. Запись
+# результатов сверяется с токеном: запуск, потерявший аренду, уже ничего не перезапишет.
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from redis.exceptions import RedisError
+
+from app.utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Захват: токен — следующий номер из счётчика lease:<имя>:fence
+_ACQUIRE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return false
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], token, 'EX', tonumber(ARGV[1]))
+return token
+"""
+
+# Продление и освобождение — только владельцем текущего токена
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+return 1
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', tonumber(ARGV[3]))
+end
+return 1
+"""
+
+# Результат запуска хранится, пока его могут забрать присоединившиеся вызовы
+RESULT_TTL = 600
+# Как часто ожидающий вызов проверяет, завершился ли запуск
+WAIT_POLL = 0.5
+
+
+def _lease_key(name: str) -> str:
+    return f"lease:{name}"
+
+
+def acquire_lease(name: str, ttl: int) -> int | None:
+    """
+    Захватывает аренду на ttl секунд. Возвращает fencing-токен или None, если аренда занята.
+    Без Redis возвращает 0: работа идёт без защиты от параллельных запусков.
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+    try:
+        token = client.eval(_ACQUIRE_SCRIPT, 2, _lease_key(name), f"{_lease_key(name)}:fence", ttl)
+    except RedisError as e:
+        logger.error(f"Redis error in acquire_lease: {e}")
+        return 0
+    return int(token) if token is not None else None
+
+
+def renew_lease(name: str, token: int, ttl: int) -> bool:
+    """
+    Продлевает аренду. False — аренда потеряна (истекла и, возможно, захвачена другим запуском).
+    """
+    if not token:
+        return True
+    client = get_redis_client()
+    if client is None:
+        return True
+    try:
+        return bool(client.eval(_RENEW_SCRIPT, 1, _lease_key(name), token, ttl))
+    except RedisError as e:
+        logger.error(f"Redis error in renew_lease: {e}")
+        return True
+
+
+def release_lease(name: str, token: int, result=None) -> None:
+    """
+    Освобождает аренду и сохраняет результат запуска для присоединившихся вызовов.
+    """
+    if not token:
+        return
+    client = get_redis_client()
+    if client is None:
+        return
+    payload = json.dumps({"token": token, "result": result}, ensure_ascii=False) if result is not None else ""
+    try:
+        if not client.eval(
+            _RELEASE_SCRIPT, 2, _lease_key(name), f"{_lease_key(name)}:result", token, payload, RESULT_TTL,
+        ):
+            logger.warning(f"Lease {name} #{token} was lost before release")
+    except RedisError as e:
+        logger.error(f"Redis error in release_lease: {e}")
+
+
+def current_lease(name: str) -> int | None:
+    """
+    Токен идущего запуска или None, если аренда свободна.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        token = client.get(_lease_key(name))
+    except RedisError as e:
+        logger.error(f"Redis error in current_lease: {e}")
+        return None
+    return int(token) if token is not None else None
+
+
+def holds_lease(name: str, token: int) -> bool:
+    """
+    Fencing-проверка перед записью результатов: аренда всё ещё принадлежит этому запуску.
+    """
+    if not token or get_redis_client() is None:
+        return True
+    return current_lease(name) == token
+
+
+def get_lease_result(name: str, token: int):
+    """
+    Результат завершённого запуска token или None, если он ещё идёт, упал или результат истёк.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        raw = client.get(f"{_lease_key(name)}:result")
+    except RedisError as e:
+        logger.error(f"Redis error in get_lease_result: {e}")
+        return None
+    if not raw:
+        return None
+    payload = json.loads(raw)
+    return payload["result"] if payload.get("token") == token else None
+
+
+def wait_for_lease_result(name: str, token: int, timeout: float):
+    """
+    Ждёт окончания запуска token (до timeout секунд) и возвращает его результат.
+    """
+    deadline = time.monotonic() + timeout
+    while current_lease(name) == token and time.monotonic() < deadline:
+        time.sleep(WAIT_POLL)
+    return get_lease_result(name, token)
+
+
+class LeaseHeartbeat:
+    """
+    Фоновый поток, продлевающий аренду каждые ttl/3 секунд, пока владелец работает.
+    Потерю аренды отражает свойство lost.
+    """
+
+    def __init__(self, name: str, token: int, ttl: int):
+        self.name = name
+        self.token = token
+        self.ttl = ttl
+        self.lost = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{name}", daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(max(1.0, self.ttl / 3)):
+            if not renew_lease(self.name, self.token, self.ttl):
+                logger.warning(f"Lease {self.name} #{self.token} lost, heartbeat stopped")
+                self.lost = True
+                return
+
+    def start(self) -> "LeaseHeartbeat":
+        if self.token:
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+
+
+@contextmanager
+def hold_lease(name: str, token: int, ttl: int):
+    """
+    Продлевает уже захваченную аренду, пока выполняется блок with.
+    """
+    heartbeat = LeaseHeartbeat(name, token, ttl).start()
+    try:
+        yield heartbeat
+    finally:
+        heartbeat.stop()
@@ -3,13 +3,19 @@ import logging
 import hashlib
 from typing import Any
 
-from app.schemas import NewsItem
+from app.async_runtime import run_async, register_loop_cleanup
+from app.schemas import NewsItem, Source
+from app.text import EMPTY_SUMMARY
 from app.utils import save_news_item, list_sources
 from app.news_parser import habr, vc, tproger, three_dnews, ixbt, telegram
 
 
 logger = logging.getLogger(__name__)
 
+# Клиент t.me закрывается вместе с циклом, в котором работает
+register_loop_cleanup(telegram.close_tg_web_client)
+
+
 # Генерирует детерминированный идентификатор новости по паре (source, url).
 def generate_news_id(source: str, url: str) -> str:
     base = f'{source}:{url}'
@@ -29,7 +35,7 @@ def normalize_raw_news(source_name: str, raw_item: dict[str, Any]) -> NewsItem:
         id=news_id,
         title=raw_item.get('title'),
         url=raw_item.get('url'),
-        summary=raw_item.get('summary') or 'Нет текста',
+        summary=raw_item.get('summary') or EMPTY_SUMMARY,
         source=source,
         published_at=datetime.now(timezone.utc),
         keywords=[],
@@ -40,65 +46,66 @@ def normalize_raw_news(source_name: str, raw_item: dict[str, Any]) -> NewsItem:
 
 
 
+# Маппинг ID статических источников на функции парсинга
+SITE_PARSERS = {
+    "habr": habr.fetch_habr_news_raw,
+    "vc": vc.fetch_vc_news_raw,
+    "tproger": tproger.fetch_tproger_news_raw,
+    "3dnews": three_dnews.fetch_3dnews_news_raw,
+    "ixbt": ixbt.fetch_ixbt_news_raw,
+}
+
+
+def list_enabled_sources() -> list[Source]:
+    """
+    Включённые источники, которые умеет парсить бот: сайты из SITE_PARSERS и Telegram-каналы.
+    """
+    return [
+        s for s in list_sources()
+        if s.enabled and ((s.type == "site" and s.id in SITE_PARSERS) or (s.type == "tg" and _tg_username(s)))
+    ]
+
+
+def _tg_username(source: Source) -> str:
+    # Если это username (начинается с @), убираем его
+    return source.url.replace("https://t.me/", "").replace("@", "").strip("/")
+
+
+def collect_from_source(source: Source) -> list[NewsItem]:
+    """
+    Собирает и сохраняет новости одного источника. Ошибки загрузки не перехватываются —
+    их обрабатывает вызывающий (повтор подзадачи сбора или пропуск источника).
+    """
+    collected_news: list[NewsItem] = []
+    if source.type == "site":
+        logger.info(f"Parsing site source: {source.id}")
+        raw_items = [(source.id, raw_item) for raw_item in SITE_PARSERS[source.id]()]
+    else:
+        username = _tg_username(source)
+        logger.info(f"Parsing dynamic TG channel: {username}")
+        # Асинхронный парсер выполняется в цикле процесса воркера (или во временном цикле вне воркера)
+        raw_items = [(raw_item['source'], raw_item) for raw_item in run_async(telegram.fetch_tg_news_raw([username]))]
+
+    for source_name, raw_item in raw_items:
+        try:
+            news_item = normalize_raw_news(source_name=source_name, raw_item=raw_item)
+            save_news_item(news_item)
+            collected_news.append(news_item)
+        except Exception as e:
+            logger.warning(f"Ошибка при обработке новости из {source.id}: {e}")
+    return collected_news
+
+
 def collect_from_all_sources() -> list[NewsItem]:
     """
     Собирает новости со всех поддерживаемых источников и нормализует их в NewsItem.
-    Учитывает настройки включения/выключения из Redis.
+    Учитывает настройки включения/выключения из Redis. Источники обходятся по очереди
+    (параллельный сбор по источникам — задача Celery fetch_and_store_news_task).
     """
     collected_news: list[NewsItem] = []
-    
-    # Получаем все источники из Redis
-    all_sources = list_sources()
-    
-    # 1. Маппинг ID статических источников на функции парсинга
-    site_parsers = {
-        "habr": habr.fetch_habr_news_raw,
-        "vc": vc.fetch_vc_news_raw,
-        "tproger": tproger.fetch_tproger_news_raw,
-        "3dnews": three_dnews.fetch_3dnews_news_raw,
-        "ixbt": ixbt.fetch_ixbt_news_raw,
-    }
-
-    # Обработка сайтов
-    for s in all_sources:
-        if s.type == "site" and s.enabled and s.id in site_parsers:
-            fetch_func = site_parsers[s.id]
-            try:
-                logger.info(f"Parsing site source: {s.id}")
-                raw_items = fetch_func()
-                for raw_item in raw_items:
-                    try:
-                        news_item = normalize_raw_news(source_name=s.id, raw_item=raw_item)
-                        save_news_item(news_item)
-                        collected_news.append(news_item)
-                    except Exception as e:
-                        logger.warning(f"Ошибка при обработке новости из {s.id}: {e}")
-            except Exception as exc:
-                logger.error(f'Ошибка при парсинге новостей {s.id}: {exc}')
-
-    # 2. Обработка динамических источников (Telegram-каналы)
-    tg_channels = []
-    for s in all_sources:
-        if s.type == "tg" and s.enabled:
-            # Если это username (начинается с @), убираем его
-            username = s.url.replace("https://t.me/", "").replace("@", "").strip("/")
-            if username:
-                tg_channels.append(username)
-    
-    if tg_channels:
+    for source in list_enabled_sources():
         try:
-            logger.info(f"Parsing dynamic TG channels: {tg_channels}")
-            import asyncio
-            # Используем asyncio.run для запуска асинхронного парсера в синхронном контексте
-            raw_tg_items = asyncio.run(telegram.fetch_tg_news_raw(tg_channels))
-            for raw_item in raw_tg_items:
-                try:
-                    news_item = normalize_raw_news(source_name=raw_item['source'], raw_item=raw_item)
-                    save_news_item(news_item)
-                    collected_news.append(news_item)
-                except Exception as e:
-                    logger.warning(f"Ошибка при нормализации новости из TG {raw_item.get('source')}: {e}")
+            collected_news.extend(collect_from_source(source))
         except Exception as exc:
-            logger.error(f"Ошибка при парсинге TG каналов: {exc}")
-
+            logger.error(f'Ошибка при парсинге новостей {source.id}: {exc}')
     return collected_news
@@ -0,0 +1,172 @@
+# Адаптивный темп публикации: следующий слот рассчитывается по глубине очереди, сроку жизни
+# новостей в ней, окнам активных часов (в часовом поясе канала) и дневному лимиту постов.
+#
+# Очередь распределяется по оставшемуся активному времени дня: большая очередь — посты чаще,
+# пустая — реже. Если новости истекут по TIME_LIFE_NEWS раньше, чем до них дойдёт очередь,
+# интервал сокращается. Результат всегда в пределах PUBLISH_CADENCE_MIN/MAX_INTERVAL.
+import logging
+import math
+from datetime import datetime, timedelta, timezone, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.utils import get_redis_client, count_ranked_news, list_top_ranked_news
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+# Сколько лидеров очереди учитывается при оценке свежести
+FRESHNESS_SAMPLE = 20
+# Период проверки планировщика (задача публикации запускается beat каждую минуту)
+TICK_SECONDS = 60
+
+
+def get_local_timezone() -> tzinfo:
+    """
+    Часовой пояс канала: UTC_OFFSET, если задан, иначе TIMEZONE (как у планировщика Celery).
+    """
+    if settings.utc_offset != 0:
+        return timezone(timedelta(hours=settings.utc_offset))
+    try:
+        return ZoneInfo(settings.timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown TIMEZONE '{settings.timezone}', using UTC for publish schedule")
+        return timezone.utc
+
+
+def parse_active_hours(spec: str) -> list[tuple[int, int]]:
+    """
+    Окна активных часов "08:00-12:00,18:00-23:30" в секунды от начала суток. Окно через
+    полночь ("22:00-02:00") делится на два. Пустая строка — весь день.
+    """
+    windows = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = (_parse_clock(value) for value in part.split("-", 1))
+        except ValueError:
+            logger.warning(f"Invalid PUBLISH_ACTIVE_HOURS window '{part}', skipping it")
+            continue
+        if start < end:
+            windows.append((start, end))
+        elif start > end:
+            windows += [(start, DAY_SECONDS), (0, end)]
+    return sorted(windows) or [(0, DAY_SECONDS)]
+
+
+def _parse_clock(value: str) -> int:
+    hours, _, minutes = value.strip().partition(":")
+    seconds = int(hours) * 3600 + int(minutes or 0) * 60
+    if not 0 <= seconds <= DAY_SECONDS:
+        raise ValueError(value)
+    return seconds
+
+
+def _day_key(day: str) -> str:
+    return f"publish:schedule:day:{day}"
+
+
+def get_publish_state(day: str) -> tuple[float | None, int]:
+    """
+    Время последней плановой публикации и число публикаций за день day (в часовом поясе канала).
+    """
+    client = get_redis_client()
+    if client is None:
+        return None, 0
+    try:
+        last, count = client.mget("publish:schedule:last", _day_key(day))
+    except RedisError as e:
+        logger.error(f"Redis error in get_publish_state: {e}")
+        return None, 0
+    return (float(last) if last else None), int(count or 0)
+
+
+def record_publication(now: datetime | None = None) -> None:
+    """
+    Учитывает публикацию: сдвигает отсчёт интервала и расходует дневной лимит.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    now = now or datetime.now(timezone.utc)
+    day = now.astimezone(get_local_timezone()).date().isoformat()
+    try:
+        pipe = client.pipeline()
+        pipe.set("publish:schedule:last", now.timestamp())
+        pipe.incr(_day_key(day))
+        pipe.expire(_day_key(day), 2 * DAY_SECONDS)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in record_publication: {e}")
+
+
+def get_publish_plan(now: datetime | None = None) -> dict:
+    """
+    Решение планировщика: пора ли публиковать, когда следующий слот, выбранный интервал и причина.
+    """
+    now = now or datetime.now(timezone.utc)
+    local_now = now.astimezone(get_local_timezone())
+    midnight = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_second = (local_now - midnight).total_seconds()
+    windows = parse_active_hours(settings.publish_active_hours)
+
+    active = any(start <= day_second < end for start, end in windows)
+    active_left = sum(max(0.0, end - max(start, day_second)) for start, end in windows)
+    last_at, posts_today = get_publish_state(local_now.date().isoformat())
+    budget = settings.publish_daily_budget
+    budget_left = max(0, budget - posts_today) if budget > 0 else None
+
+    depth = count_ranked_news()
+    # Новость с k-м по близости сроком истечения должна уйти не позже своего срока,
+    # то есть за k слотов: интервал не больше срок/k
+    lifetimes = sorted(
+        settings.time_life_news - (now - item.published_at).total_seconds()
+        for item in list_top_ranked_news(limit=FRESHNESS_SAMPLE)
+    )
+    freshness_bound = min((life / rank for rank, life in enumerate(lifetimes, 1) if life > 0), default=math.inf)
+
+    min_interval = settings.publish_cadence_min_interval * 60
+    max_interval = (settings.publish_cadence_max_interval or settings.news_time) * 60
+    to_post = depth if budget_left is None else min(depth, budget_left)
+    interval = active_left / to_post if to_post else max_interval
+    interval = min(max(min(interval, freshness_bound), min_interval), max_interval)
+
+    next_at = datetime.fromtimestamp(last_at, timezone.utc) + timedelta(seconds=interval) if last_at else now
+    reason = f"queue depth {depth}"
+    if budget_left == 0:
+        # Лимит на сегодня исчерпан — ждём первого окна следующего дня
+        next_at = max(next_at, midnight + timedelta(days=1, seconds=windows[0][0]))
+        reason = f"daily budget of {budget} posts is used up"
+    elif not active:
+        upcoming = [start for start, _ in windows if start > day_second]
+        window_start = midnight + (timedelta(seconds=upcoming[0]) if upcoming else timedelta(days=1, seconds=windows[0][0]))
+        next_at = max(next_at, window_start)
+        reason = "outside active hours"
+    elif depth == 0:
+        reason = "queue is empty"
+    elif freshness_bound < active_left / max(to_post, 1):
+        reason = f"queue depth {depth}, news expire soon"
+
+    # С пустой очередью задача запускается раз в max_interval (в первую минуту интервала):
+    # пересчитать ранжированный индекс, если он пуст, а новости в хранилище есть
+    due = now >= next_at and (depth > 0 or now.timestamp() % max_interval < TICK_SECONDS)
+    return {
+        "due": due,
+        "now": now.isoformat(),
+        "local_time": local_now.isoformat(),
+        "next_at": next_at.isoformat(),
+        "wait_seconds": round(max(0.0, (next_at - now).total_seconds()), 1),
+        "interval_seconds": round(interval, 1),
+        "reason": reason,
+        "active": active,
+        "active_seconds_left": round(active_left),
+        "queue_depth": depth,
+        "posts_today": posts_today,
+        "daily_budget": budget or None,
+        "budget_left": budget_left,
+        "last_published_at": datetime.fromtimestamp(last_at, timezone.utc).isoformat() if last_at else None,
+    }
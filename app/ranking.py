@@ -0,0 +1,141 @@
+# Векторизованная оценка релевантности новостей и ранжирование очереди публикации.
+import logging
+import math
+import re
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.config import settings
+from app.filters import filter_news
+from app.schemas import NewsItem
+from app.text import stem, news_summary
+from app.utils import list_keywords, save_news_scores, list_all_news_ids, list_published_news_ids, get_news_items_bulk
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[\w+#]+", re.UNICODE)
+# Базовая релевантность, чтобы новости без ключевых слов ранжировались по свежести
+BASE_RELEVANCE = 0.05
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Разбивает текст на нормализованные токены (нижний регистр, усечение до STEM_LENGTH).
+    """
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+def hash_token(token: str, dim: int) -> int:
+    # crc32 стабилен между процессами, в отличие от встроенного hash()
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+
+def news_text(item: NewsItem) -> str:
+    return f"{item.title} {news_summary(item)}"
+
+
+def score_news_items(news_items: list[NewsItem], keywords: list[str], now: datetime | None = None) -> np.ndarray:
+    """
+    Считает ранжирующий ключ для пачки новостей.
+
+    Релевантность = косинус TF-IDF (hashed bag of words) с запросом из ключевых слов
+    + вес доли найденных ключевых слов, умноженные на вес источника.
+    Свежесть учитывается экспоненциальным затуханием с периодом RANKING_HALF_LIFE_HOURS.
+
+    Ключ возвращается в лог-шкале: ln(релевантность) + ln2 * t / half_life, где t — время
+    публикации в часах. Порядок таких ключей не зависит от момента расчёта, поэтому
+    оценки разных пачек можно хранить в одном индексе и не пересчитывать при старении.
+    """
+    n = len(news_items)
+    if n == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    dim = settings.ranking_hash_dim
+
+    # 1. Hashed bag of words в разреженном COO-виде: (номер документа, корзина)
+    rows: list[int] = []
+    cols: list[int] = []
+    for row, item in enumerate(news_items):
+        for token in tokenize(news_text(item)):
+            rows.append(row)
+            cols.append(hash_token(token, dim))
+
+    keyword_buckets = np.unique(np.array(
+        [hash_token(token, dim) for keyword in keywords for token in tokenize(keyword)],
+        dtype=np.int64,
+    ))
+
+    relevance = np.full(n, BASE_RELEVANCE, dtype=np.float64)
+    if rows:
+        flat = np.array(rows, dtype=np.int64) * dim + np.array(cols, dtype=np.int64)
+        cells, tf = np.unique(flat, return_counts=True)
+        doc, bucket = np.divmod(cells, dim)
+
+        # 2. TF-IDF: сублинейный TF и сглаженный IDF по текущей пачке
+        df = np.bincount(bucket, minlength=dim)
+        idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+        weights = (1.0 + np.log(tf)) * idf[bucket]
+        doc_norms = np.sqrt(np.bincount(doc, weights=weights ** 2, minlength=n))
+
+        if keyword_buckets.size:
+            query = np.zeros(dim, dtype=np.float64)
+            query[keyword_buckets] = idf[keyword_buckets]
+            query_norm = np.linalg.norm(query)
+
+            # 3. Косинусная близость документа к запросу из ключевых слов
+            dot = np.bincount(doc, weights=weights * query[bucket], minlength=n)
+            cosine = np.divide(dot, doc_norms * query_norm, out=np.zeros(n), where=doc_norms > 0)
+
+            # 4. Доля ключевых слов, встретившихся в документе
+            hits = np.bincount(doc, weights=(query[bucket] > 0).astype(np.float64), minlength=n)
+            keyword_share = hits / keyword_buckets.size
+
+            relevance += settings.ranking_tfidf_weight * cosine + settings.ranking_keyword_weight * keyword_share
+
+    # 5. Вес источника
+    source_weights = settings.source_weights_map
+    relevance *= np.array([source_weights.get(item.source, 1.0) for item in news_items], dtype=np.float64)
+
+    # 6. Свежесть: экспоненциальное затухание в лог-шкале
+    published_hours = np.array([_as_utc(item.published_at).timestamp() for item in news_items], dtype=np.float64) / 3600.0
+    now_hours = (now or datetime.now(timezone.utc)).timestamp() / 3600.0
+    published_hours = np.minimum(published_hours, now_hours)
+    freshness = math.log(2.0) * published_hours / settings.ranking_half_life_hours
+
+    return np.log(np.maximum(relevance, 1e-9)) + freshness
+
+
+def rank_news_items(news_items: list[NewsItem]) -> int:
+    """
+    Оценивает пачку новостей и записывает результат в ранжированный индекс news:ranked.
+    Возвращает количество оценённых новостей.
+    """
+    if not news_items:
+        return 0
+
+    started = time.perf_counter()
+    keywords = list(set(settings.keywords_list + list_keywords()))
+    scores = score_news_items(news_items, keywords)
+    save_news_scores({item.id: float(score) for item, score in zip(news_items, scores)})
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Ranked {len(news_items)} news items in {elapsed_ms:.1f} ms")
+    return len(news_items)
+
+
+def rank_news_queue() -> int:
+    """
+    Полностью пересчитывает ранжированный индекс по всем неопубликованным новостям в хранилище.
+    В хранилище лежат все собранные новости, поэтому в очередь попадают только прошедшие
+    фильтр ключевых слов — как и при обычном сборе.
+    """
+    published_ids = set(list_published_news_ids())
+    unpublished_ids = [news_id for news_id in list_all_news_ids() if news_id not in published_ids]
+    return rank_news_items(filter_news(get_news_items_bulk(unpublished_ids)))
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,55 @@
+# Маршрутизация новостей по каналам: новость собирается и генерируется один раз,
+# а публикуется во все каналы, чьим правилам (ключевые слова, источники) она подходит.
+from __future__ import annotations
+
+import logging
+
+from pydantic import ValidationError
+
+from app.config import settings
+from app.schemas import ChannelRoute, NewsItem
+from app.telegram.publisher import normalize_target
+
+logger = logging.getLogger(__name__)
+
+
+def get_channel_routes() -> list[ChannelRoute]:
+    """
+    Правила из CHANNEL_ROUTES. Основной канал TELEGRAM_CHANNEL_ID получает все новости,
+    если для него не задано собственное правило.
+    """
+    routes: list[ChannelRoute] = []
+    for raw_route in settings.channel_routes_list:
+        try:
+            route = ChannelRoute.model_validate(raw_route)
+        except ValidationError as e:
+            logger.warning(f"Skipping invalid channel route {raw_route}: {e}")
+            continue
+        route.channel = str(normalize_target(route.channel))
+        routes.append(route)
+
+    if settings.telegram_channel_id:
+        default_channel = str(normalize_target(settings.telegram_channel_id))
+        if all(route.channel != default_channel for route in routes):
+            routes.insert(0, ChannelRoute(channel=default_channel))
+    return routes
+
+
+def route_matches(route: ChannelRoute, news: NewsItem) -> bool:
+    if route.sources and news.source.lower() not in {source.lower() for source in route.sources}:
+        return False
+    if not route.keywords:
+        return True
+    text_to_check = f"{news.title} {news.summary} {' '.join(news.keywords)}".lower()
+    return any(keyword.lower() in text_to_check for keyword in route.keywords)
+
+
+def match_channels(news: NewsItem, routes: list[ChannelRoute] | None = None) -> list[str]:
+    """
+    Каналы, в которые нужно опубликовать новость (без повторов, в порядке правил).
+    """
+    channels: list[str] = []
+    for route in routes if routes is not None else get_channel_routes():
+        if route.channel not in channels and route_matches(route, news):
+            channels.append(route.channel)
+    return channels
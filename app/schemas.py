@@ -109,6 +109,25 @@ class Source(BaseModel):
     )
 
 
+class ChannelRoute(BaseModel):
+    channel: str = Field(
+        ...,
+        min_length=1,
+        description="Канал для публикации (@username или числовой id)",
+        examples=["@ai_feed", "-10001234355466"]
+    )
+    keywords: list[str] = Field(
+        default_factory=list,
+        description="Ключевые слова (любое из них в заголовке или описании); пусто - любые новости",
+        examples=[["ИИ", "нейросет", "LLM"]]
+    )
+    sources: list[str] = Field(
+        default_factory=list,
+        description="id источников; пусто - все источники",
+        examples=[["habr", "tg:habr_com"]]
+    )
+
+
 class Post(BaseModel):
     id: str = Field(
         ...,
@@ -129,8 +148,13 @@ class Post(BaseModel):
         default=None,
         description="Время публикации поста в Telegram, если уже опубликован"
     )
+    channel_id: str | None = Field(
+        default=None,
+        description="Канал, в который опубликован пост",
+        examples=["@my_telegram_chanel"]
+    )
     status: str = Field(
         default="new",
-        description="Статус поста: new/generated/published/failed",
-        examples=["new", "generated", "published"]
+        description="Статус поста: new/generated/queued/published/failed",
+        examples=["new", "generated", "queued", "published"]
     )
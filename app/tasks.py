@@ -1,14 +1,35 @@
-import asyncio
-from celery import Celery
+import time
+from datetime import datetime, timezone
+from celery import Celery, chord, concurrency
+from celery.exceptions import SoftTimeLimitExceeded
 from celery.schedules import crontab
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+from kombu import Queue
 from app.config import settings
-from app.news_parser import collect_from_all_sources
+from app.news_parser import list_enabled_sources, collect_from_source
 from app.filters import filter_news
-from app.utils import save_news_item, list_news_items, is_news_published, init_app_settings
-from app.ai.generator import generate_telegram_post
-from app.telegram.publisher import publish_to_channel
-from app.schemas import Post
-from app.utils import save_post
+from app.utils import (
+    save_news_item, is_news_published, init_app_settings, get_news_items_bulk,
+    list_top_ranked_news, count_ranked_news, get_ai_setting, get_draft_post, save_draft_post, is_news_published_to, drop_ranked_news,
+    claim_news_generation, release_news_generation, claim_scrape_request, hold_scrape_request,
+    get_source, save_scrape_report,
+)
+from app.ranking import rank_news_items, rank_news_queue
+from app.ai.generator import (
+    generate_telegram_posts_batch, get_post_text, get_generation_fingerprint, ORIGINAL_POST_MARKER,
+    GENERATION_CLAIM_TTL,
+)
+from app.ai.clients import close_ai_clients, shutdown_ai_clients
+from app.telegram.publisher import close_publisher_client
+from app.telegram.publish_queue import (
+    enqueue_publications, dispatch_publications, claim_dispatch_wakeup, create_outbox_entries,
+    discard_outbox_entries, sweep_outbox,
+)
+from app.routing import match_channels
+from app.publish_schedule import get_publish_plan, record_publication
+from app.async_runtime import run_async, start_worker_loop, stop_worker_loop, register_loop_cleanup
+from app.lease import acquire_lease, renew_lease, release_lease, current_lease, holds_lease, hold_lease
+from app.schemas import NewsItem, Post
 from uuid import uuid4
 
 from app.logger import setup_logging
@@ -33,8 +54,22 @@ celery_app.conf.beat_schedule = {
         "schedule": crontab(minute=f"*/{settings.news_time_call}"),
     },
     "publish-news-periodically": {
+        # Каждую минуту задача сверяется с планировщиком (app.publish_schedule) и публикует, только когда подошёл слот
         "task": "app.tasks.publish_next_news_task",
-        "schedule": crontab(minute=f"*/{settings.news_time}"),
+        "schedule": crontab(minute="*"),
+    },
+    "dispatch-publish-queue-periodically": {
+        # Страховка: отложенные проходы диспетчера могут потеряться при перезапуске воркера
+        "task": "app.tasks.dispatch_publish_queue_task",
+        "schedule": crontab(minute="*"),
+    },
+    "sweep-publish-outbox-periodically": {
+        "task": "app.tasks.sweep_publish_outbox_task",
+        "schedule": crontab(minute=f"*/{settings.publish_sweep_interval}"),
+    },
+    "pregenerate-posts-periodically": {
+        "task": "app.tasks.pregenerate_posts_task",
+        "schedule": crontab(minute=f"*/{settings.pregenerate_interval}"),
     },
 }
 # Настройка часового пояса на основе UTC_OFFSET
@@ -48,81 +83,344 @@ else:
 
 celery_app.conf.enable_utc = False # False - Используем TIMEZONE для планировщика при значении UTC_OFFSET != 0, а если True - то используем UTC по Гринвичу (для Celery).
 
+# Очереди задач: сбор (CPU — разбор HTML, prefork-пул), генерация ИИ и публикация (ожидание
+# сети — пул потоков). У каждой очереди свой воркер, поэтому долгий сбор или медленный ответ
+# ИИ не задерживает публикацию. Лимиты времени: мягкий из настроек очереди, жёсткий — с запасом
+QUEUE_TIME_LIMITS = {
+    "scrape": settings.celery_scrape_time_limit,
+    "ai": settings.celery_ai_time_limit,
+    "publish": settings.celery_publish_time_limit,
+}
+# Приоритет задачи внутри очереди (в Redis 0 — наивысший): плановая публикация и диспетчер раньше разбора зависших записей
+TASK_QUEUES = {
+    "app.tasks.fetch_and_store_news_task": ("scrape", 5),
+    "app.tasks.scrape_source_task": ("scrape", 6),
+    "app.tasks.aggregate_scrape_task": ("scrape", 3),
+    "app.tasks.release_scrape_lease_task": ("scrape", 0),
+    "app.tasks.pregenerate_posts_task": ("ai", 5),
+    "app.tasks.publish_next_news_task": ("publish", 0),
+    "app.tasks.dispatch_publish_queue_task": ("publish", 1),
+    "app.tasks.sweep_publish_outbox_task": ("publish", 6),
+}
+celery_app.conf.task_queues = [Queue(queue) for queue in QUEUE_TIME_LIMITS]
+celery_app.conf.task_default_queue = "publish"
+celery_app.conf.task_routes = {
+    task: {"queue": queue, "priority": priority} for task, (queue, priority) in TASK_QUEUES.items()
+}
+celery_app.conf.task_annotations = {
+    # У подзадачи одного источника собственный лимит (SCRAPE_SOURCE_TIME_LIMIT)
+    task: {
+        "soft_time_limit": QUEUE_TIME_LIMITS[queue],
+        "time_limit": QUEUE_TIME_LIMITS[queue] + settings.celery_hard_time_limit_margin,
+    }
+    for task, (queue, _) in TASK_QUEUES.items() if task != "app.tasks.scrape_source_task"
+}
+# Приоритеты в брокере Redis: каждая очередь разбивается на подочереди по уровням 0-9
+celery_app.conf.broker_transport_options = {"priority_steps": list(range(10)), "queue_order_strategy": "priority"}
+# Долгая задача не забирает заранее чужие сообщения, пока занята
+celery_app.conf.worker_prefetch_multiplier = 1
+
+
+# Клиенты ИИ и публикации живут в цикле процесса воркера и закрываются вместе с ним
+register_loop_cleanup(close_ai_clients)
+register_loop_cleanup(close_publisher_client)
+
+
+def _runs_tasks_in_main_process(worker) -> bool:
+    # Пул потоков и solo выполняют задачи в главном процессе воркера, prefork — в дочерних
+    pool = concurrency.get_implementation(getattr(worker, "pool_cls", None) or celery_app.conf.worker_pool)
+    return pool in (concurrency.get_implementation("threads"), concurrency.get_implementation("solo"))
+
+
+@worker_init.connect
+def start_worker_runtime(sender=None, **kwargs):
+    """
+    Запускает постоянный event loop процесса воркера: асинхронные ресурсы переживают задачу.
+    В пуле потоков и solo — в главном процессе. В prefork главный процесс задачи не выполняет,
+    а поток цикла не переживает fork, поэтому цикл создаётся только в дочерних процессах.
+    """
+    if _runs_tasks_in_main_process(sender):
+        start_worker_loop()
+
+
+@worker_process_init.connect
+def start_worker_process_runtime(**kwargs):
+    """
+    Собственный цикл дочернего процесса prefork-пула.
+    """
+    start_worker_loop()
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def close_worker_ai_clients(**kwargs):
+    """
+    Закрывает пулы соединений ИИ-провайдеров и клиент публикации при остановке процесса воркера.
+    """
+    stop_worker_loop()
+    shutdown_ai_clients()
+
+# Имена аренд: в каждый момент идёт не больше одного сбора и одного выбора новости для публикации
+SCRAPE_LEASE = "scrape"
+PUBLISH_LEASE = "publish"
+# Аренда выбора новости для публикации (продлевается, пока запуск работает)
+PUBLISH_LEASE_TTL = 120
+
+
 @celery_app.task(name="app.tasks.fetch_and_store_news_task")
 def fetch_and_store_news_task():
     """
-    Фоновая задача для парсинга, фильтрации и сохранения новостей.
+    Фоновая задача сбора новостей: по подзадаче на каждый включённый источник (параллельно
+    на всех воркерах) и общий шаг фильтрации, ранжирования и отчёта после них (chord).
+    """
+    token = acquire_lease(SCRAPE_LEASE, settings.scrape_lock_ttl)
+    if token is None:
+        # Плановый, внеочередной и ручной сбор не идут одновременно: вызов присоединяется к идущему
+        running = current_lease(SCRAPE_LEASE)
+        logger.info(f"Scrape run #{running} is in progress. Coalescing.")
+        return f"Coalesced onto scrape run #{running}."
+    try:
+        source_ids = [source.id for source in list_enabled_sources()]
+        if not source_ids:
+            finish_scrape_run(token, scrape_run_result([]))
+            return "No enabled sources."
+        logger.info(f"Starting scrape run #{token} of {len(source_ids)} sources: {', '.join(source_ids)}")
+        # Аренду продлевают подзадачи источников, а снимает шаг агрегации (или обработчик ошибки chord)
+        chord(scrape_source_task.s(source_id, token) for source_id in source_ids)(
+            aggregate_scrape_task.s(token).on_error(release_scrape_lease_task.si(token))
+        )
+        return f"Scrape run #{token} started for {len(source_ids)} sources."
+    except Exception as e:
+        finish_scrape_run(token)
+        logger.error(f"Error in fetch_and_store_news_task: {e}", exc_info=True)
+        return f"Error: {e}"
+
+
+@celery_app.task(
+    name="app.tasks.scrape_source_task",
+    bind=True,
+    soft_time_limit=settings.scrape_source_time_limit,
+    time_limit=settings.scrape_source_time_limit + 15,
+)
+def scrape_source_task(self, source_id: str, token: int = 0) -> dict:
+    """
+    Собирает новости одного источника. Ошибка повторяется до SCRAPE_SOURCE_MAX_RETRIES раз,
+    а затем (как и превышение времени) попадает в отчёт: один источник не срывает весь сбор.
     """
+    started = time.perf_counter()
+    report = {"source": source_id, "items": [], "count": 0, "error": None, "retries": self.request.retries}
     try:
-        logger.info("Starting fetch_and_store_news_task...")
-        news_items = collect_from_all_sources() # Парсим новости с всех источников
+        source = get_source(source_id)
+        if not renew_lease(SCRAPE_LEASE, token, settings.scrape_lock_ttl):
+            # Запуск потерял аренду (истекла, пока подзадача ждала в очереди) — сбор уже ведёт другой
+            report["error"] = f"scrape run #{token} lost its lease"
+        elif source is None:
+            report["error"] = "source not found"
+        else:
+            with hold_lease(SCRAPE_LEASE, token, settings.scrape_lock_ttl):
+                report["items"] = [item.model_dump(mode="json") for item in collect_from_source(source)]
+            report["count"] = len(report["items"])
+    except SoftTimeLimitExceeded:
+        report["error"] = f"time limit {settings.scrape_source_time_limit} s exceeded"
+    except Exception as e:
+        if self.request.retries < settings.scrape_source_max_retries:
+            logger.warning(f"Scrape of {source_id} failed (attempt {self.request.retries + 1}): {e}. Retrying.")
+            raise self.retry(exc=e, countdown=settings.scrape_source_retry_delay * (self.request.retries + 1))
+        report["error"] = str(e)
+    report["duration"] = round(time.perf_counter() - started, 2)
+    if report["error"]:
+        logger.error(f"Scrape of {source_id} failed: {report['error']}")
+    return report
+
+
+@celery_app.task(name="app.tasks.aggregate_scrape_task")
+def aggregate_scrape_task(results: list[dict], token: int = 0):
+    """
+    Шаг после сбора всех источников: фильтрация, сохранение, ранжирование и общий отчёт.
+    """
+    filtered_news = []
+    try:
+        if not holds_lease(SCRAPE_LEASE, token):
+            # Fencing: аренда перешла к более новому запуску, его результаты не перезаписываем
+            logger.warning(f"Scrape run #{token} lost its lease. Discarding its results.")
+            return f"Scrape run #{token} lost its lease."
+        news_items = [NewsItem.model_validate(item) for result in results for item in result["items"]]
         logger.info(f"Collected {len(news_items)} raw items.")
         filtered_news = filter_news(news_items) # Фильтруем новости по ключевым словам
         logger.info(f"Filtered to {len(filtered_news)} items.")
         
         for item in filtered_news:
             save_news_item(item)
+
+        # Оцениваем сохранённые версии новостей и обновляем ранжированный индекс
+        unpublished_ids = [item.id for item in filtered_news if not is_news_published(item.id)]
+        rank_news_items(get_news_items_bulk(unpublished_ids))
+
+        save_scrape_report({
+            "run": token,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "collected": len(news_items),
+            "filtered": len(filtered_news),
+            "sources": [{key: value for key, value in result.items() if key != "items"} for result in results],
+        })
+        failed = [result["source"] for result in results if result["error"]]
+        if failed:
+            logger.warning(f"Sources failed during scrape: {', '.join(failed)}")
         
         logger.info(f"Successfully scraped and stored {len(filtered_news)} news items.")
+        # Очередь изменилась — готовим посты для новых лидеров заранее
+        pregenerate_posts_task.delay()
         return f"Successfully scraped and stored {len(filtered_news)} news items."
     except Exception as e:
-        logger.error(f"Error in fetch_and_store_news_task: {e}", exc_info=True)
+        logger.error(f"Error in aggregate_scrape_task: {e}", exc_info=True)
         return f"Error: {e}"
+    finally:
+        finish_scrape_run(token, scrape_run_result(filtered_news))
+
+
+@celery_app.task(name="app.tasks.release_scrape_lease_task")
+def release_scrape_lease_task(token: int):
+    """
+    Снимает аренду сбора, если шаг агрегации не запустился (подзадача упала по жёсткому лимиту).
+    """
+    finish_scrape_run(token)
+
+
+def finish_scrape_run(token: int, result: dict | None = None) -> None:
+    """
+    Завершает запуск сбора: освобождает аренду, публикует результат присоединившимся вызовам
+    и продлевает отметку о сборе на SCRAPE_REFILL_COOLDOWN, чтобы пустая очередь не запускала
+    сбор на каждом тике публикации.
+    """
+    release_lease(SCRAPE_LEASE, token, result)
+    hold_scrape_request(settings.scrape_refill_cooldown)
+
+
+def scrape_run_result(filtered_news: list[NewsItem]) -> dict:
+    """
+    Результат запуска сбора для присоединившихся вызовов: сами отфильтрованные новости,
+    а не их id, — часть из них могла не сохраниться (дубликаты) или уже истечь.
+    """
+    return {"news": [item.model_dump(mode="json") for item in filtered_news]}
+
+
+def request_scrape(reason: str) -> bool:
+    """
+    Ставит внеочередной сбор новостей в фоне, если он ещё не запрошен, не идёт и не завершился
+    менее SCRAPE_REFILL_COOLDOWN секунд назад. Вызывающий не ждёт парсинга. Возвращает True, если задача поставлена этим вызовом.
+    """
+    if not claim_scrape_request(max(settings.scrape_lock_ttl, settings.scrape_refill_cooldown)):
+        logger.info(f"Scrape already requested or running ({reason}).")
+        return False
+    logger.info(f"Requesting background scrape: {reason}")
+    fetch_and_store_news_task.delay()
+    return True
+
+
+# Сколько лидеров очереди просматривается, если первые уже взяты в работу другим запуском
+CLAIM_CANDIDATES = 5
+
+
+def claim_next_news(candidates: list) -> tuple:
+    """
+    Берёт в работу первую новость из candidates, для которой удалось создать записи outbox
+    (хотя бы в одном подходящем канале). Возвращает (новость, каналы) или (None, []).
+    Параллельные запуски получают разные новости и не генерируют один пост дважды.
+    """
+    for item in candidates:
+        item_channels = match_channels(item)
+        if not item_channels:
+            logger.info(f"No channel route matches news: {item.title[:50]}. Dropping it from the queue.")
+            drop_ranked_news(item.id)
+            continue
+        created = create_outbox_entries(item.id, item_channels)
+        if created:
+            return item, created
+    return None, []
+
 
 @celery_app.task(name="app.tasks.publish_next_news_task")
-def publish_next_news_task():
+def publish_next_news_task(force: bool = False):
     """
-    Берет одну неопубликованную новость, генерирует пост и публикует.
-    Если уникального материала нет, запускает парсинг.
+    Берет одну неопубликованную новость (атомарно создавая записи outbox), генерирует пост один раз и ставит его в очереди публикации
+    всех каналов, чьим правилам CHANNEL_ROUTES подходит новость (отправляется сразу, если слот канала
+    свободен). Если очередь почти пуста, ставит внеочередной сбор новостей в фоне.
+    Запуски не перекрываются: пока идёт один, остальные присоединяются к нему и завершаются.
+    Публикует, только когда подошёл слот адаптивного планировщика (force=True — сразу, для ручного запуска).
     """
+    token = acquire_lease(PUBLISH_LEASE, PUBLISH_LEASE_TTL)
+    if token is None:
+        running = current_lease(PUBLISH_LEASE)
+        logger.info(f"Publish run #{running} is in progress. Coalescing.")
+        return f"Coalesced onto publish run #{running}."
+    result = None
     try:
-        logger.info(f"Starting scheduled publication (interval: {settings.news_time} min)")
-        
-        # Получаем список всех новостей
-        all_news = list_news_items()
-        
-        # Фильтруем неопубликованные
-        news = None
-        for item in all_news:
-            if not is_news_published(item.id):
-                news = item
-                break
+        with hold_lease(PUBLISH_LEASE, token, PUBLISH_LEASE_TTL):
+            result = publish_next_news(force)
+        return result
+    finally:
+        release_lease(PUBLISH_LEASE, token, result)
+
+
+def publish_next_news(force: bool = False) -> str:
+    try:
+        plan = None if force else get_publish_plan()
+        depth = plan["queue_depth"] if plan else count_ranked_news()
+        # Очередь почти пуста — пополняем её заранее, не дожидаясь планового сбора
+        # (не чаще раза в SCRAPE_REFILL_COOLDOWN: отметку о сборе держит request_scrape)
+        if depth < settings.scrape_low_watermark:
+            request_scrape(f"queue depth {depth} < {settings.scrape_low_watermark}")
+
+        if plan:
+            if not plan["due"]:
+                return f"Next publication in {plan['wait_seconds']:.0f} s ({plan['reason']})."
+            logger.info(f"Starting scheduled publication (interval: {plan['interval_seconds']:.0f} s, {plan['reason']})")
         
+        # Берём самую релевантную новость, которую ещё никто не взял в работу
+        news, channels = claim_next_news(list_top_ranked_news(limit=CLAIM_CANDIDATES))
         if not news:
-            # Если нет готовых, пробуем спарсить принудительно
-            logger.info("No news in queue. Forcing immediate scrape...")
-            news_list = collect_from_all_sources()
-            logger.info(f"Scrape finished. Found {len(news_list)} items")
-            for item in news_list:
-                if not is_news_published(item.id):
-                    news = item
-                    break
-        
+            # Индекс пуст (например, после обновления) — пересчитываем его по всему хранилищу
+            rank_news_queue()
+            news, channels = claim_next_news(list_top_ranked_news(limit=CLAIM_CANDIDATES))
+
         if not news:
-            logger.info("Still no new unique material. Skipping publication.")
+            # Сбор идёт в фоне: слот публикации его не ждёт, новость уйдёт при следующем запуске
+            logger.info("No news in queue. Skipping publication.")
             return "No news to publish."
 
         logger.info(f"Processing news: {news.title[:50]}...")
-        
+
         # Запускаем асинхронную генерацию и публикацию
-        async def process_and_publish():
-            generated_text = await generate_telegram_post(news)
+        async def generate_and_publish():
+            # Заранее сгенерированный черновик публикуется без ожидания ИИ
+            try:
+                generated_text = await get_post_text(news)
+            except Exception:
+                # Записи outbox освобождаются — новость можно будет взять снова
+                discard_outbox_entries(news.id, channels)
+                raise
             if generated_text:
-                msg_id = await publish_to_channel(generated_text, url=news.url)
-                if msg_id:
-                    # Создаем объект Post для сохранения в историю
-                    post = Post(
-                        id=str(uuid4()),
-                        news_id=news.id,
-                        generated_text=generated_text,
-                        status="published"
-                    )
-                    save_post(post)
-                    logger.info(f"Successfully published: {news.title[:50]}")
-                    return f"Published: {news.title}"
+                # Пост уходит через очереди каналов: сразу, если слот канала свободен, иначе в ближайший
+                # слот. Каналы обслуживаются параллельно через общий клиент публикации
+                queued = enqueue_publications(news.id, generated_text, str(news.url), channels)
+                if not queued:
+                    discard_outbox_entries(news.id, channels)
+                    return None
+                # Слот израсходован, только когда пост действительно в очереди: следующий
+                # отсчитывается от этой публикации
+                record_publication()
+                next_run = await dispatch_publications()
+                schedule_publish_dispatch(next_run)
+                published = [channel for channel in queued if is_news_published_to(news.id, channel)]
+                if published:
+                    logger.info(f"Successfully published to {', '.join(published)}: {news.title[:50]}")
+                    return f"Published to {len(published)}/{len(channels)} channels: {news.title}"
+                return f"Queued for {len(queued)}/{len(channels)} channels: {news.title}"
+            discard_outbox_entries(news.id, channels)
             return None
 
-        result = asyncio.run(process_and_publish())
+        # Цикл процесса воркера: клиенты ИИ и публикации остаются подключёнными между задачами
+        result = run_async(generate_and_publish(), timeout=settings.celery_publish_time_limit)
         if result:
             return result
         else:
@@ -132,3 +430,100 @@ def publish_next_news_task():
     except Exception as e:
         logger.error(f"Error in publish_news_task: {e}", exc_info=True)
         return f"Error: {e}"
+
+
+def schedule_publish_dispatch(delay: float | None) -> None:
+    """
+    Планирует следующий проход диспетчера публикаций через delay секунд (если очередь не пуста).
+    """
+    if delay is None:
+        return
+    delay = max(1.0, delay)
+    if claim_dispatch_wakeup(delay):
+        dispatch_publish_queue_task.apply_async(countdown=delay)
+
+
+@celery_app.task(name="app.tasks.dispatch_publish_queue_task")
+def dispatch_publish_queue_task():
+    """
+    Отправляет созревшие посты из очередей каналов (по одному на канал) с учётом FloodWait
+    и планирует следующий проход на время ближайшего слота.
+    """
+    try:
+        next_run = run_async(dispatch_publications(), timeout=settings.celery_publish_time_limit)
+        schedule_publish_dispatch(next_run)
+        return f"Next dispatch in {next_run:.0f} s" if next_run is not None else "Publish queue is empty."
+    except Exception as e:
+        logger.error(f"Error in dispatch_publish_queue_task: {e}", exc_info=True)
+        return f"Error: {e}"
+
+
+@celery_app.task(name="app.tasks.sweep_publish_outbox_task")
+def sweep_publish_outbox_task():
+    """
+    Разбирает записи outbox, зависшие в генерации или отправке после падения воркера.
+    """
+    try:
+        result = sweep_outbox()
+        if result.get("requeued"):
+            schedule_publish_dispatch(0)
+        return f"Outbox sweep: {result}"
+    except Exception as e:
+        logger.error(f"Error in sweep_publish_outbox_task: {e}", exc_info=True)
+        return f"Error: {e}"
+
+
+@celery_app.task(name="app.tasks.pregenerate_posts_task")
+def pregenerate_posts_task():
+    """
+    Заранее генерирует посты для первых PREGENERATE_QUEUE_SIZE новостей очереди
+    (пакетами по GENERATION_BATCH_SIZE новостей в одном запросе, не более
+    PREGENERATE_CONCURRENCY запросов к ИИ одновременно) и сохраняет их
+    черновиками со статусом "generated". Публикация затем только отправляет текст.
+    """
+    try:
+        if get_ai_setting() == "off":
+            # Без ИИ пост собирается по шаблону мгновенно — готовить нечего
+            return "AI is off. Nothing to pre-generate."
+
+        fingerprint = get_generation_fingerprint()
+        queue = list_top_ranked_news(limit=settings.pregenerate_queue_size)
+        # Новости, которые сейчас генерирует другой воркер (публикация), пропускаем
+        owner = uuid4().hex
+        pending = [
+            news for news in queue
+            if get_draft_post(news.id, fingerprint) is None
+            and claim_news_generation(news.id, owner, GENERATION_CLAIM_TTL)
+        ]
+        if not pending:
+            return "All queued posts are already generated."
+
+        logger.info(f"Pre-generating posts for {len(pending)} of {len(queue)} queued news items...")
+
+        results = []
+        try:
+            # Несколько новостей в одном запросе к ИИ (GENERATION_BATCH_SIZE)
+            posts = run_async(
+                generate_telegram_posts_batch(pending, concurrency=settings.pregenerate_concurrency),
+                timeout=settings.celery_ai_time_limit,
+            )
+            for news in pending:
+                text = posts.get(news.id)
+                if not text or text.startswith(ORIGINAL_POST_MARKER):
+                    # ИИ не ответил — не сохраняем шаблонный текст, попробуем в следующий раз
+                    results.append(False)
+                    continue
+                save_draft_post(
+                    Post(id=str(uuid4()), news_id=news.id, generated_text=text, status="generated"),
+                    fingerprint,
+                )
+                results.append(True)
+        finally:
+            # Захват снимается после сохранения черновиков: ожидающая публикация сразу их увидит
+            for news in pending:
+                release_news_generation(news.id, owner)
+        logger.info(f"Pre-generated {sum(results)} of {len(pending)} posts.")
+        return f"Pre-generated {sum(results)} posts."
+    except Exception as e:
+        logger.error(f"Error in pregenerate_posts_task: {e}", exc_info=True)
+        return f"Error: {e}"
@@ -1,15 +1,127 @@
 from telethon import TelegramClient, events, Button
+from telethon.errors import FloodWaitError, MessageNotModifiedError
+import asyncio
 import logging
+import time
+from app.config import settings
 from app.utils import set_user_chat_mode, is_user_in_chat_mode, is_ai_chat_enabled
-from app.ai.generator import generate_ai_chat_response, is_ai_available
+from app.ai.generator import (
+    generate_ai_chat_response, stream_ai_chat_response, is_ai_available, CHAT_UNAVAILABLE_MESSAGE,
+)
+from app.ai.memory import build_chat_history, remember_chat_exchange
+from app.telegram.chat_scheduler import ChatScheduler
 
 logger = logging.getLogger("bot")
 
+# Максимальная длина текстового сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+STREAM_PLACEHOLDER = "⏳ Думаю..."
+# Курсор в конце сообщения, пока ответ ещё генерируется
+STREAM_CURSOR = " ▌"
+
+
+def _split_point(text: str, limit: int) -> int:
+    """
+    Позиция для переноса длинного ответа в следующее сообщение: последний перевод строки
+    или пробел в пределах лимита, иначе жёсткий разрез.
+    """
+    for separator in ("\n", " "):
+        index = text.rfind(separator, 0, limit)
+        if index > limit // 2:
+            return index
+    return limit
+
+
+async def _edit_message(message, text: str, final: bool = False) -> float:
+    """
+    Редактирует сообщение. Возвращает паузу (сек), которую требует Telegram при FloodWait.
+    Финальное редактирование дожидается паузы и повторяется, промежуточное — пропускается.
+    """
+    try:
+        await message.edit(text)
+    except MessageNotModifiedError:
+        pass
+    except FloodWaitError as e:
+        if not final:
+            return e.seconds
+        await asyncio.sleep(e.seconds)
+        await message.edit(text)
+    return 0.0
+
+
+async def stream_chat_reply(event, user_message: str, history: list[dict] | None = None) -> str | None:
+    """
+    Отвечает на сообщение в режиме чата по мере генерации: отправляет заглушку и
+    редактирует её накопленным текстом не чаще CHAT_STREAM_EDIT_INTERVAL. Ответ длиннее
+    лимита Telegram продолжается в новом сообщении.
+    Возвращает полный текст ответа или None, если ИИ не ответил.
+    """
+    message = await event.reply(STREAM_PLACEHOLDER)
+    started = time.perf_counter()
+    text = ""
+    full_text = []
+    next_edit_at = 0.0
+
+    async for content in stream_ai_chat_response(user_message, history):
+        full_text.append(content)
+        text += content
+
+        if message is None:
+            text = text.lstrip()
+
+        # Текущее сообщение заполнено — закрепляем его и продолжаем в новом
+        while len(text) + len(STREAM_CURSOR) > TELEGRAM_MESSAGE_LIMIT:
+            cut = _split_point(text, TELEGRAM_MESSAGE_LIMIT - len(STREAM_CURSOR))
+            if message is None:
+                await event.respond(text[:cut].rstrip())
+            else:
+                await _edit_message(message, text[:cut].rstrip(), final=True)
+            text = text[cut:].lstrip()
+            message = None
+
+        if message is None:
+            # Продолжение открывается, только когда для него есть текст
+            if not text:
+                continue
+            message = await event.respond(text + STREAM_CURSOR)
+            next_edit_at = time.monotonic() + settings.chat_stream_edit_interval
+
+        now = time.monotonic()
+        if now >= next_edit_at:
+            pause = await _edit_message(message, text + STREAM_CURSOR)
+            next_edit_at = now + max(settings.chat_stream_edit_interval, pause)
+
+    answer = "".join(full_text).strip()
+    # Ответ закончился ровно на переносе — последнее сообщение уже закреплено целиком
+    if message is not None:
+        await _edit_message(message, text.strip() if answer else CHAT_UNAVAILABLE_MESSAGE, final=True)
+    logger.info(f"Streamed AI response in {time.perf_counter() - started:.1f}s")
+    return answer or None
+
 def register_ai_chat_handlers(client: TelegramClient):
     """
     Регистрирует обработчики для режима прямого общения с ИИ.
     """
 
+    async def answer_chat_message(event, user_id: int, text: str):
+        # Если пользователь в режиме чата, отправляем его сообщение ИИ вместе с памятью диалога
+        history = build_chat_history(user_id)
+        if settings.chat_stream_enabled:
+            answer = await stream_chat_reply(event, text, history)
+            logger.info(f"AI response sent to user {user_id}")
+        else:
+            async with client.action(event.chat_id, 'typing'):
+                response = await generate_ai_chat_response(text, history)
+                logger.info(f"AI response sent to user {user_id}")
+                await event.reply(response)
+            answer = response if response != CHAT_UNAVAILABLE_MESSAGE else None
+
+        # Запоминаем обмен репликами уже после ответа, чтобы сжатие истории не задерживало его
+        if answer:
+            await remember_chat_exchange(user_id, text, answer)
+
+    chat_scheduler = ChatScheduler(answer_chat_message)
+
     @client.on(events.CallbackQuery(data=b"ai_chat_start"))
     async def ai_chat_start_handler(event):
         if not is_ai_chat_enabled():
@@ -72,8 +184,5 @@ def register_ai_chat_handlers(client: TelegramClient):
         user_id = event.sender_id
         if is_user_in_chat_mode(user_id):
             logger.info(f"User {user_id} sent message to AI: {event.message.text[:50]}...")
-            # Если пользователь в режиме чата, отправляем его сообщение ИИ
-            async with client.action(event.chat_id, 'typing'):
-                response = await generate_ai_chat_response(event.message.text)
-                logger.info(f"AI response sent to user {user_id}")
-                await event.reply(response)
+            # Ответ генерируется в очереди: у пользователя не больше одного запроса одновременно
+            await chat_scheduler.submit(event, user_id, event.message.text)
@@ -7,6 +7,7 @@ from app.utils import (
     init_app_settings, is_ai_chat_enabled, set_ai_chat_enabled
 )
 from app.ai.generator import is_ai_available
+from app.ai.router import get_all_provider_stats, PROVIDER_DISPLAY_NAMES
 
 
 from app.telegram.ai_in_bot import register_ai_chat_handlers
@@ -71,6 +72,20 @@ def register_handlers(client: TelegramClient):
         if not ai_ready:
             status_text += "\n⚠️ **ИИ недоступен (проверьте API ключи)**"
         
+        # Скользящая статистика провайдеров (задержка p90 и доля ошибок)
+        stats_lines = []
+        for stats in get_all_provider_stats():
+            if not stats["configured"]:
+                continue
+            name = PROVIDER_DISPLAY_NAMES.get(stats["provider"], stats["provider"])
+            p90 = f"{stats['p90_ms'] / 1000:.1f}с" if stats["p90_ms"] is not None else "—"
+            stats_lines.append(
+                f"• {name}: p90 {p90}, ошибки {stats['error_rate'] * 100:.0f}%, "
+                f"запросов {stats['requests']}, резервных {stats['hedged']}"
+            )
+        if stats_lines:
+            status_text += "\n\n📊 **Провайдеры:**\n" + "\n".join(stats_lines)
+        
         on_label = "Включить ON"
         if not ai_ready:
             on_label = "🚫 ON (Недоступно)"
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from app.config import settings
+from app.utils import record_chat_queue_stats
+
+logger = logging.getLogger("bot")
+
+# Обработчик сообщения: (событие последнего сообщения, id пользователя, объединённый текст)
+ChatHandler = Callable[[Any, int, str], Awaitable[None]]
+
+
+@dataclass
+class _UserQueue:
+    # Сообщения, пришедшие пока генерация ещё не началась: (событие, текст, время постановки)
+    pending: list[tuple[Any, str, float]] = field(default_factory=list)
+    in_flight: bool = False
+    scheduled: bool = False
+
+
+class ChatScheduler:
+    """
+    Честная очередь генераций чата с ИИ:
+    - у каждого пользователя не больше одной генерации одновременно;
+    - сообщения, пришедшие во время генерации, объединяются в следующий запрос;
+    - пользователи обслуживаются по кругу (round-robin), всего не больше
+      CHAT_MAX_CONCURRENCY генераций одновременно, поэтому один активный
+      пользователь не занимает всю квоту провайдера.
+    """
+
+    def __init__(self, handler: ChatHandler):
+        self._handler = handler
+        self._users: dict[int, _UserQueue] = {}
+        self._ready: deque[int] = deque()
+        self._wakeup: asyncio.Condition | None = None
+        self._workers: list[asyncio.Task] = []
+
+    def _ensure_workers(self) -> None:
+        if self._workers and not all(worker.done() for worker in self._workers):
+            return
+        self._wakeup = asyncio.Condition()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"chat-worker-{index}")
+            for index in range(max(1, settings.chat_max_concurrency))
+        ]
+
+    async def submit(self, event: Any, user_id: int, text: str) -> None:
+        """
+        Ставит сообщение пользователя в очередь и сразу возвращает управление.
+        """
+        self._ensure_workers()
+        queue = self._users.setdefault(user_id, _UserQueue())
+        queue.pending.append((event, text, time.monotonic()))
+        if queue.pending[:-1] or queue.in_flight:
+            logger.info(f"User {user_id} message queued (pending: {len(queue.pending)}, in flight: {queue.in_flight})")
+        record_chat_queue_stats(user_id, depth=len(queue.pending))
+
+        if not queue.in_flight and not queue.scheduled:
+            queue.scheduled = True
+            self._ready.append(user_id)
+            async with self._wakeup:
+                self._wakeup.notify()
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: bool(self._ready))
+                user_id = self._ready.popleft()
+
+            queue = self._users[user_id]
+            queue.scheduled = False
+            batch, queue.pending = queue.pending, []
+            queue.in_flight = True
+
+            waited_ms = (time.monotonic() - batch[0][2]) * 1000
+            record_chat_queue_stats(user_id, depth=0, wait_ms=waited_ms, merged=len(batch))
+            if len(batch) > 1:
+                logger.info(f"Merged {len(batch)} messages of user {user_id} into one AI request")
+
+            # Отвечаем на последнее сообщение, в запрос идут все накопленные
+            event = batch[-1][0]
+            text = "\n\n".join(message_text for _, message_text, _ in batch)
+            try:
+                await self._handler(event, user_id, text)
+            except Exception as e:
+                logger.error(f"Error while answering user {user_id} in AI chat: {e}", exc_info=True)
+            finally:
+                queue.in_flight = False
+
+            if queue.pending:
+                # Пока шла генерация, пришли новые сообщения — пользователь встаёт в конец круга
+                queue.scheduled = True
+                self._ready.append(user_id)
+                async with self._wakeup:
+                    self._wakeup.notify()
+            else:
+                self._users.pop(user_id, None)
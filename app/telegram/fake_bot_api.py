@@ -0,0 +1,91 @@
+"""
+Локальный сервер-заглушка Telegram Bot API для проверки публикации без сети.
+
+Отвечает на getMe и sendMessage в формате Bot API (ok/result, ошибки с error_code и
+parameters.retry_after), с задержкой и долей ответов 429 из аргументов запуска:
+
+    python -m app.telegram.fake_bot_api --port 8098 --latency-ms 80
+    TELEGRAM_PUBLISHER_BACKEND=botapi TELEGRAM_BOT_API_URL=http://localhost:8098
+
+Отправленные сообщения хранятся в памяти и доступны через GET /messages.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import FastAPI, Request
+
+app = FastAPI(title="Fake Telegram Bot API")
+
+_state = {"latency_ms": 50.0, "flood_rate": 0.0, "retry_after": 3, "next_id": 1}
+_messages: list[dict] = []
+_rng = random.Random(42)
+
+
+async def _payload(request: Request) -> dict:
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return await request.json()
+    return dict(await request.form())
+
+
+@app.api_route("/bot{token}/getMe", methods=["GET", "POST"])
+async def get_me(token: str):
+    await asyncio.sleep(_state["latency_ms"] / 1000)
+    bot_id = int(token.split(":", 1)[0]) if token.split(":", 1)[0].isdigit() else 1
+    return {"ok": True, "result": {"id": bot_id, "is_bot": True, "first_name": "Fake Bot", "username": "fake_news_bot"}}
+
+
+@app.api_route("/bot{token}/sendMessage", methods=["GET", "POST"])
+async def send_message(token: str, request: Request):
+    payload = await _payload(request)
+    await asyncio.sleep(_state["latency_ms"] / 1000)
+
+    if not payload.get("chat_id") or not payload.get("text"):
+        return {"ok": False, "error_code": 400, "description": "Bad Request: chat_id and text are required"}
+    if str(payload["chat_id"]).startswith("@missing"):
+        return {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}
+    if _rng.random() < _state["flood_rate"]:
+        retry_after = _state["retry_after"]
+        return {
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        }
+
+    message_id = _state["next_id"]
+    _state["next_id"] += 1
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": payload["chat_id"], "type": "channel"},
+        "text": payload["text"],
+        "entities": payload.get("entities", []),
+        "reply_markup": payload.get("reply_markup"),
+    }
+    _messages.append(message)
+    return {"ok": True, "result": message}
+
+
+@app.get("/messages")
+async def list_messages():
+    return _messages
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=3)
+    args = parser.parse_args()
+    _state.update(latency_ms=args.latency_ms, flood_rate=args.flood_rate, retry_after=args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
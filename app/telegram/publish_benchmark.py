@@ -0,0 +1,99 @@
+"""
+Замер публикации постов: задержка на пост и память процесса (RSS) для бэкендов
+telethon и botapi.
+
+    python -m app.telegram.publish_benchmark --backend botapi --posts 30
+    python -m app.telegram.publish_benchmark --backend both --posts 30 --channel @test_channel
+
+Каждый бэкенд запускается в отдельном процессе, чтобы RSS не смешивался. Для botapi без
+сети используйте заглушку (python -m app.telegram.fake_bot_api) и TELEGRAM_BOT_API_URL;
+для telethon нужны настоящие TELEGRAM_API_ID/HASH и токен бота.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+
+def _rss_mb() -> float:
+    # Текущий RSS из /proc, на других системах — пиковый из getrusage
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _run(backend: str, posts: int, channel: str | None) -> dict:
+    from app.config import settings
+    settings.telegram_publisher_backend = backend
+
+    rss_start = _rss_mb()
+    from app.telegram.publisher import publish_to_channel, close_publisher_client
+    rss_imported = _rss_mb()
+
+    latencies = []
+    try:
+        for index in range(posts):
+            started = time.perf_counter()
+            await publish_to_channel(
+                f"**Тестовый пост #{index + 1}**\n\nЗамер публикации через {backend}.",
+                url="https://example.com/news",
+                channel_id=channel,
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        await close_publisher_client()
+
+    ordered = sorted(latencies)
+    return {
+        "backend": backend,
+        "posts": len(latencies),
+        # Первый пост включает подключение и вход, остальные — только отправку
+        "first_ms": round(latencies[0], 1) if latencies else None,
+        "p50_ms": round(statistics.median(ordered[1:] or ordered), 1) if ordered else None,
+        "p90_ms": round(ordered[int(0.9 * (len(ordered) - 1))], 1) if ordered else None,
+        "rss_start_mb": round(rss_start, 1),
+        "rss_import_mb": round(rss_imported, 1),
+        "rss_end_mb": round(_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publisher backends benchmark")
+    parser.add_argument("--backend", choices=["telethon", "botapi", "both"], default="botapi")
+    parser.add_argument("--posts", type=int, default=20)
+    parser.add_argument("--channel", default=None, help="Канал для тестовых постов (по умолчанию TELEGRAM_CHANNEL_ID)")
+    args = parser.parse_args()
+
+    if args.backend != "both":
+        print(json.dumps(asyncio.run(_run(args.backend, args.posts, args.channel)), ensure_ascii=False))
+        return
+
+    results = []
+    for backend in ("telethon", "botapi"):
+        command = [sys.executable, "-m", "app.telegram.publish_benchmark", "--backend", backend, "--posts", str(args.posts)]
+        if args.channel:
+            command += ["--channel", args.channel]
+        completed = subprocess.run(command, capture_output=True, text=True, env=os.environ.copy())
+        if completed.returncode != 0:
+            print(f"{backend}: failed\n{completed.stderr[-2000:]}", file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    columns = ["backend", "posts", "first_ms", "p50_ms", "p90_ms", "rss_import_mb", "rss_end_mb"]
+    print(" | ".join(columns))
+    for result in results:
+        print(" | ".join(str(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
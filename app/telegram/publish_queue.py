@@ -0,0 +1,477 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.schemas import Post
+from app.telegram.publisher import (
+    AlreadyPublished, PublishFloodWait, PublishOutcomeUnknown, normalize_target, publish_to_channel,
+)
+from app.lease import acquire_lease, release_lease, hold_lease
+from app.utils import get_redis_client, save_post
+
+logger = logging.getLogger(__name__)
+
+# Очередь публикаций: у каждого канала свой sorted set задач (score — время, не раньше которого
+# задачу можно отправить) и состояние с интервалом между постами. Отправка в канал идёт строго
+# по одной, FloodWait не теряет пост, а переносит очередь канала на указанное Telegram время.
+#
+# Каждая задача — запись outbox publish:outbox:<news_id>@<канал> (это же ключ идемпотентности)
+# со статусом new → generated → publishing → published / failed. Все переходы — атомарные
+# сравнения статуса в Lua, поэтому один пост берут в работу (генерация, отправка) ровно один раз.
+STATUS_NEW = "new"
+STATUS_GENERATED = "generated"
+STATUS_PUBLISHING = "publishing"
+STATUS_PUBLISHED = "published"
+STATUS_FAILED = "failed"
+
+# Создание записи outbox: кто создал — тот и генерирует пост (остальные воркеры пропускают новость)
+_CREATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', 'new', 'news_id', ARGV[1], 'channel', ARGV[2],
+    'attempts', '0', 'created_at', ARGV[3], 'updated_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return 1
+"""
+
+# new → generated и постановка в очередь: пост получает ближайший свободный слот канала
+# (не раньше последнего слота + интервал), поэтому пачка постов после простоя
+# растягивается по времени, а не уходит в Telegram одним залпом.
+_ENQUEUE_SCRIPT = """
+if redis.call('HGET', KEYS[3], 'status') ~= 'new' then
+    return false
+end
+local now = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[2], 'last_slot', 'next_at', 'interval')
+local interval = tonumber(state[3]) or tonumber(ARGV[2])
+local slot = math.max(now, (tonumber(state[1]) or 0) + interval, tonumber(state[2]) or 0)
+redis.call('HSET', KEYS[2], 'last_slot', tostring(slot))
+redis.call('HSET', KEYS[3], 'status', 'generated', 'text', ARGV[4], 'url', ARGV[5],
+    'enqueued_at', ARGV[1], 'updated_at', ARGV[1])
+redis.call('ZADD', KEYS[1], slot, ARGV[3])
+redis.call('SADD', KEYS[4], ARGV[6])
+return tostring(slot)
+"""
+
+# generated → publishing: захват отправки с токеном (второй диспетчер получит 0)
+_CLAIM_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'generated' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', 'publishing', 'claim', ARGV[1], 'claimed_at', ARGV[2], 'updated_at', ARGV[2])
+redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+return 1
+"""
+
+# publishing → published / generated / failed, только владельцем захвата; остальные ARGV — поля записи
+_FINISH_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'publishing' or redis.call('HGET', KEYS[1], 'claim') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[2], 'updated_at', ARGV[3])
+for i = 4, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# После успешной отправки интервал канала плавно возвращается к минимальному
+INTERVAL_DECAY = 0.9
+# Аренда канала одним диспетчером на время отправки (продлевается, пока отправка идёт)
+SEND_LOCK_TTL = 120
+# Сколько созревших задач канала просматривается за проход (пропуская захваченные)
+DUE_SCAN_SIZE = 10
+
+
+def channel_key(channel: str | int | None = None) -> str:
+    return str(normalize_target(channel or settings.telegram_channel_id))
+
+
+def outbox_key(news_id: str, channel: str) -> str:
+    """
+    Ключ идемпотентности публикации: одна новость — не больше одного поста в канале.
+    """
+    return f"{news_id}@{channel}"
+
+
+def _queue_key(channel: str) -> str:
+    return f"publish:queue:{channel}"
+
+
+def _state_key(channel: str) -> str:
+    return f"publish:channel:{channel}"
+
+
+def _outbox_key(job_id: str) -> str:
+    return f"publish:outbox:{job_id}"
+
+
+def create_outbox_entries(news_id: str, channels: list[str]) -> list[str]:
+    """
+    Создаёт записи outbox (status="new") для каналов, где новости ещё нет ни в работе, ни в
+    опубликованных. Возвращает каналы, для которых запись создана этим вызовом: только их
+    вызывающий генерирует и ставит в очередь, поэтому параллельные воркеры не делают одну
+    работу дважды.
+    """
+    client = get_redis_client()
+    if client is None:
+        return []
+    created = []
+    try:
+        for channel in channels:
+            channel = channel_key(channel)
+            if client.eval(
+                _CREATE_SCRIPT, 2,
+                _outbox_key(outbox_key(news_id, channel)), f"published_news:channel:{channel}",
+                news_id, channel, time.time(), settings.time_life_news,
+            ):
+                created.append(channel)
+    except RedisError as e:
+        logger.error(f"Redis error in create_outbox_entries: {e}")
+    return created
+
+
+def discard_outbox_entries(news_id: str, channels: list[str]) -> None:
+    """
+    Удаляет записи outbox в статусе new (генерация не удалась) — новость можно взять снова.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        for channel in channels:
+            key = _outbox_key(outbox_key(news_id, channel_key(channel)))
+            if client.hget(key, "status") == STATUS_NEW:
+                client.delete(key)
+    except RedisError as e:
+        logger.error(f"Redis error in discard_outbox_entries: {e}")
+
+
+def enqueue_publications(news_id: str, text: str, url: str | None, channels: list[str]) -> list[str]:
+    """
+    Ставит один и тот же пост в очереди нескольких каналов. Возвращает каналы, куда он поставлен.
+    """
+    return [channel for channel in channels if enqueue_publication(news_id, text, url, channel) is not None]
+
+
+def enqueue_publication(news_id: str, text: str, url: str | None = None, channel: str | None = None) -> float | None:
+    """
+    Переводит запись outbox new → generated и ставит пост в очередь канала. Возвращает время
+    слота (unix), на который запланирована отправка, или None, если записи в статусе new нет
+    (пост уже в очереди, опубликован или взят другим воркером) или Redis недоступен.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    channel = channel_key(channel)
+    job_id = outbox_key(news_id, channel)
+    try:
+        slot = client.eval(
+            _ENQUEUE_SCRIPT, 4,
+            _queue_key(channel), _state_key(channel), _outbox_key(job_id), "publish:channels",
+            time.time(), settings.publish_queue_min_interval, job_id,
+            text, str(url) if url else "", channel,
+        )
+        # Новость в очереди больше не выбирается из ранжированного индекса
+        client.zrem("news:ranked", news_id)
+    except RedisError as e:
+        logger.error(f"Redis error in enqueue_publication: {e}")
+        return None
+    if slot is None:
+        logger.info(f"News {news_id} is not waiting for generation in {channel} (queued, published or taken)")
+        return None
+    slot = float(slot)
+    logger.info(f"Queued news {news_id} for {channel} in {max(0.0, slot - time.time()):.0f} s")
+    return slot
+
+
+def get_outbox_entry(news_id: str, channel: str | None = None) -> dict:
+    client = get_redis_client()
+    if client is None:
+        return {}
+    try:
+        return client.hgetall(_outbox_key(outbox_key(news_id, channel_key(channel))))
+    except RedisError as e:
+        logger.error(f"Redis error in get_outbox_entry: {e}")
+        return {}
+
+
+def _finish(client, job_id: str, token: str, status: str, **fields) -> bool:
+    args = [token, status, time.time()]
+    for name, value in fields.items():
+        args += [name, "" if value is None else value]
+    return bool(client.eval(_FINISH_SCRIPT, 1, _outbox_key(job_id), *args))
+
+
+async def _dispatch_channel(channel: str, job_id: str | None = None) -> float | None:
+    """
+    Отправляет одну созревшую задачу канала (или конкретную job_id). Возвращает, через сколько
+    секунд канал готов к следующей отправке, или None, если очередь канала пуста.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    # Аренда с токеном продлевается, пока идёт отправка (FloodWait, медленный MTProto),
+    # и освобождается только своим владельцем — чужую блокировку диспетчер не снимет
+    lease = f"publish:send:{channel}"
+    token = acquire_lease(lease, SEND_LOCK_TTL)
+    if token is None:
+        # Канал сейчас обслуживает другой диспетчер
+        return settings.publish_queue_min_interval
+    try:
+        with hold_lease(lease, token, SEND_LOCK_TTL):
+            return await _send_next(client, channel, job_id)
+    except RedisError as e:
+        logger.error(f"Redis error in publish dispatcher for {channel}: {e}")
+        return None
+    finally:
+        release_lease(lease, token)
+
+
+def _claim_due_job(client, channel: str, now: float) -> tuple[str, dict, str] | None:
+    for job_id in client.zrangebyscore(_queue_key(channel), "-inf", now, start=0, num=DUE_SCAN_SIZE):
+        claimed = _claim_job(client, channel, job_id)
+        if claimed:
+            return claimed
+    return None
+
+
+def _claim_job(client, channel: str, job_id: str) -> tuple[str, dict, str] | None:
+    job = client.hgetall(_outbox_key(job_id))
+    if not job or job.get("status") in (STATUS_PUBLISHED, STATUS_FAILED):
+        # Запись истекла по TTL вместе с новостью или уже завершена
+        client.zrem(_queue_key(channel), job_id)
+        return None
+    # publishing — отправка идёт в другом процессе или зависла (её разберёт sweep_outbox)
+    token = uuid4().hex
+    if client.eval(_CLAIM_SCRIPT, 1, _outbox_key(job_id), token, time.time()):
+        job["attempts"] = int(job.get("attempts", 0)) + 1
+        return job_id, job, token
+    return None
+
+
+async def _send_next(client, channel: str, job_id: str | None = None) -> float | None:
+    now = time.time()
+    state = client.hgetall(_state_key(channel))
+    interval = float(state.get("interval") or settings.publish_queue_min_interval)
+    next_at = float(state.get("next_at") or 0)
+    if next_at > now:
+        return next_at - now
+
+    claimed = _claim_job(client, channel, job_id) if job_id else _claim_due_job(client, channel, now)
+    if claimed is None:
+        upcoming = client.zrange(_queue_key(channel), 0, 0, withscores=True)
+        return max(0.0, upcoming[0][1] - now) if upcoming else None
+    job_id, job, token = claimed
+
+    try:
+        message_id = await publish_to_channel(
+            job["text"], url=job.get("url") or None, channel_id=channel, idempotency_key=job_id,
+        )
+    except AlreadyPublished:
+        # Предыдущая попытка дошла до Telegram, но не успела записать результат
+        message_id = ""
+    except PublishFloodWait as e:
+        # Telegram назвал время ожидания: вся очередь канала сдвигается, интервал растёт.
+        # Задача остаётся первой в очереди — её держит next_at канала
+        resume_at = time.time() + e.seconds
+        _finish(client, job_id, token, STATUS_GENERATED, error=str(e))
+        pipe = client.pipeline()
+        pipe.hset(_state_key(channel), mapping={
+            "next_at": resume_at,
+            "last_slot": max(float(state.get("last_slot") or 0), resume_at),
+            "interval": min(settings.publish_queue_max_interval, interval * 2),
+        })
+        pipe.hincrby(_state_key(channel), "flood_waits", 1)
+        pipe.hincrbyfloat(_state_key(channel), "flood_wait_seconds", e.seconds)
+        pipe.execute()
+        logger.warning(f"Flood wait {e.seconds} s for {channel}, news {job['news_id']} rescheduled")
+        return float(e.seconds)
+    except Exception as e:
+        # Исход неизвестен без ключа идемпотентности (Bot API) — повтор мог бы задвоить пост
+        give_up = isinstance(e, PublishOutcomeUnknown) or job["attempts"] >= settings.publish_queue_max_attempts
+        if give_up:
+            _finish(client, job_id, token, STATUS_FAILED, error=str(e))
+            client.zrem(_queue_key(channel), job_id)
+            client.hincrby(_state_key(channel), "failed", 1)
+            logger.error(f"Giving up on news {job['news_id']} for {channel} after {job['attempts']} attempts: {e}")
+        else:
+            _finish(client, job_id, token, STATUS_GENERATED, error=str(e))
+            client.zadd(_queue_key(channel), {job_id: time.time() + settings.publish_queue_retry_delay * job["attempts"]})
+            logger.warning(f"Publication of news {job['news_id']} to {channel} failed (attempt {job['attempts']}): {e}")
+        return 0.0
+
+    sent_at = time.time()
+    published_at = datetime.now(timezone.utc)
+    if _finish(client, job_id, token, STATUS_PUBLISHED, message_id=message_id, published_at=published_at.isoformat()):
+        save_post(Post(
+            id=str(uuid4()),
+            news_id=job["news_id"],
+            generated_text=job["text"],
+            published_at=published_at,
+            channel_id=channel,
+            status=STATUS_PUBLISHED,
+        ))
+    pipe = client.pipeline()
+    pipe.zrem(_queue_key(channel), job_id)
+    pipe.hset(_state_key(channel), mapping={
+        "next_at": sent_at + interval,
+        "interval": max(settings.publish_queue_min_interval, interval * INTERVAL_DECAY),
+    })
+    pipe.hincrby(_state_key(channel), "published", 1)
+    pipe.zadd(f"publish:sent:{channel}", {job_id: sent_at})
+    pipe.zremrangebyscore(f"publish:sent:{channel}", "-inf", sent_at - 86400)
+    pipe.execute()
+    logger.info(f"Published news {job['news_id']} to {channel} (waited {sent_at - float(job.get('enqueued_at', sent_at)):.0f} s in queue)")
+    return interval
+
+
+async def publish_now(news_id: str, channel: str | None = None) -> dict:
+    """
+    Сразу отправляет пост новости, уже поставленный в очередь канала (ручная публикация),
+    не дожидаясь его слота, но соблюдая FloodWait канала. Возвращает запись outbox после попытки.
+    """
+    channel = channel_key(channel)
+    await _dispatch_channel(channel, outbox_key(news_id, channel))
+    return get_outbox_entry(news_id, channel)
+
+
+async def dispatch_publications() -> float | None:
+    """
+    Один проход диспетчера: по одной созревшей публикации в каждый канал (каналы параллельно).
+    Возвращает, через сколько секунд стоит запустить следующий проход, или None, если очереди пусты.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        channels = sorted(client.smembers("publish:channels"))
+    except RedisError as e:
+        logger.error(f"Redis error in dispatch_publications: {e}")
+        return None
+
+    waits = await asyncio.gather(*(_dispatch_channel(channel) for channel in channels))
+    waits = [wait for wait in waits if wait is not None]
+    return min(waits) if waits else None
+
+
+def sweep_outbox() -> dict:
+    """
+    Разбирает зависшие записи outbox (процесс упал посреди работы):
+    - publishing дольше PUBLISH_CLAIM_TIMEOUT: с Telethon пост возвращается в очередь — повтор
+      с тем же random_id Telegram не задвоит; с Bot API исход неизвестен, запись помечается failed;
+    - new дольше PUBLISH_CLAIM_TIMEOUT (генерация не завершилась): запись удаляется, новость
+      остаётся в ранжированном индексе и будет взята снова.
+    """
+    client = get_redis_client()
+    if client is None:
+        return {}
+    now = time.time()
+    retry_safe = settings.telegram_publisher_backend.lower() != "botapi"
+    result = {"requeued": 0, "failed": 0, "discarded": 0}
+    try:
+        for key in client.scan_iter(match="publish:outbox:*", count=500):
+            job = client.hgetall(key)
+            status = job.get("status")
+            job_id = key.split(":", 2)[2]
+            if status == STATUS_PUBLISHING and float(job.get("claimed_at") or 0) < now - settings.publish_claim_timeout:
+                channel = job.get("channel", "")
+                if retry_safe:
+                    if _finish(client, job_id, job.get("claim", ""), STATUS_GENERATED, error="claim expired"):
+                        client.zadd(_queue_key(channel), {job_id: now})
+                        result["requeued"] += 1
+                elif _finish(client, job_id, job.get("claim", ""), STATUS_FAILED, error="unknown outcome: claim expired during send"):
+                    client.zrem(_queue_key(channel), job_id)
+                    client.hincrby(_state_key(channel), "failed", 1)
+                    result["failed"] += 1
+            elif status == STATUS_NEW and float(job.get("created_at") or 0) < now - settings.publish_claim_timeout:
+                client.delete(key)
+                result["discarded"] += 1
+    except RedisError as e:
+        logger.error(f"Redis error in sweep_outbox: {e}")
+    if any(result.values()):
+        logger.warning(f"Outbox sweep: {result}")
+    return result
+
+
+def list_outbox_entries(status: str | None = None, limit: int = 100) -> list[dict]:
+    """
+    Записи outbox (без текста поста), по желанию только с указанным статусом.
+    """
+    client = get_redis_client()
+    if client is None:
+        return []
+    result = []
+    try:
+        for key in client.scan_iter(match="publish:outbox:*", count=500):
+            job = client.hgetall(key)
+            if not job or (status and job.get("status") != status):
+                continue
+            job.pop("text", None)
+            job.pop("claim", None)
+            job["key"] = key.split(":", 2)[2]
+            result.append(job)
+            if len(result) >= limit:
+                break
+    except RedisError as e:
+        logger.error(f"Redis error in list_outbox_entries: {e}")
+    return sorted(result, key=lambda job: float(job.get("updated_at") or 0), reverse=True)
+
+
+def claim_dispatch_wakeup(delay: float) -> bool:
+    """
+    Проверяет, нужно ли планировать проход диспетчера через delay секунд: если более ранний
+    проход уже запланирован, ещё один не нужен (чтобы не множить цепочки отложенных задач).
+    """
+    client = get_redis_client()
+    if client is None:
+        return False
+    wake_at = time.time() + delay
+    try:
+        scheduled = client.get("publish:dispatch:wakeup")
+        if scheduled is not None and time.time() < float(scheduled) <= wake_at + 1:
+            return False
+        client.set("publish:dispatch:wakeup", wake_at, ex=int(delay) + 60)
+        return True
+    except RedisError as e:
+        logger.error(f"Redis error in claim_dispatch_wakeup: {e}")
+        return False
+
+
+def get_publish_queue_stats() -> list[dict]:
+    """
+    Состояние очереди по каналам: размер очереди, ожидание до следующей отправки, текущий
+    интервал, опубликовано за час и сутки, FloodWait и отброшенные посты.
+    """
+    client = get_redis_client()
+    if client is None:
+        return []
+    now = time.time()
+    result = []
+    try:
+        for channel in sorted(client.smembers("publish:channels")):
+            state = client.hgetall(_state_key(channel))
+            oldest = client.zrange(_queue_key(channel), 0, 0, withscores=True)
+            sent_key = f"publish:sent:{channel}"
+            result.append({
+                "channel": channel,
+                "backlog": client.zcard(_queue_key(channel)),
+                "next_send_in": round(max(0.0, float(state.get("next_at") or 0) - now), 1),
+                "next_due_in": round(max(0.0, oldest[0][1] - now), 1) if oldest else None,
+                "interval": round(float(state.get("interval") or settings.publish_queue_min_interval), 1),
+                "published_last_hour": client.zcount(sent_key, now - 3600, "+inf"),
+                "published_last_day": client.zcount(sent_key, now - 86400, "+inf"),
+                "published_total": int(state.get("published", 0)),
+                "flood_waits": int(state.get("flood_waits", 0)),
+                "flood_wait_seconds": round(float(state.get("flood_wait_seconds", 0)), 1),
+                "failed": int(state.get("failed", 0)),
+            })
+    except RedisError as e:
+        logger.error(f"Redis error in get_publish_queue_stats: {e}")
+    return result
@@ -1,76 +1,501 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 from typing import Optional, Any
 
-from telethon import Button
-from telethon.errors import RPCError
+import httpx
+from telethon import Button, TelegramClient, helpers, types
+from telethon.errors import (
+    RPCError, FloodWaitError, ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError, RandomIdDuplicateError,
+)
+from telethon.extensions import markdown
+from telethon.tl.functions.messages import SendMessageRequest
+from telethon.sessions import StringSession
 
 from app.config import settings
-from app.telegram.bot import get_telegram_client
+from app.utils import get_publisher_state, set_publisher_state, delete_publisher_state, list_publisher_state_fields
+from app.lease import acquire_lease, release_lease, LeaseHeartbeat
 
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def publish_to_channel(text: str, url: Optional[str | Any] = None, channel_id: Optional[str] = None) -> str:
+# Долгоживущий клиент публикации: один на event loop (как пулы клиентов ИИ).
+# Клиент без обработчиков бота — он только отправляет сообщения. Авторизация хранится
+# в StringSession в Redis, поэтому повторное подключение не выполняет вход заново.
+_publishers: dict[asyncio.AbstractEventLoop, TelegramClient] = {}
+_publisher_locks: dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+# Слот сессии клиента (номер и аренда): один ключ авторизации не используется двумя клиентами сразу
+_session_slots: dict[asyncio.AbstractEventLoop, tuple[int, LeaseHeartbeat]] = {}
+
+# Сколько сессий бота хранится в Redis: не больше, чем клиентов публикации работает одновременно
+SESSION_SLOTS = 16
+# Срок аренды слота сессии в секундах: продлевается, пока клиент жив, после падения процесса освобождается сам
+SESSION_SLOT_TTL = 60
+
+# Кэш процесса: username бота и разрешённые каналы (target -> InputPeer)
+_bot_username: str | None = None
+_entities: dict[str, types.TypeInputPeer] = {}
+
+_INPUT_PEER_TYPES = {
+    "InputPeerChannel": types.InputPeerChannel,
+    "InputPeerChat": types.InputPeerChat,
+    "InputPeerUser": types.InputPeerUser,
+}
+
+
+class PublishFloodWait(RuntimeError):
+    """
+    Telegram попросил подождать перед следующей отправкой (FloodWaitError или 429 Bot API).
+    Публикацию нужно перенести на seconds секунд, а не считать неудачной.
+    """
+
+    def __init__(self, seconds: float):
+        super().__init__(f"Telegram flood wait: retry after {seconds:g} s")
+        self.seconds = seconds
+
+
+class AlreadyPublished(RuntimeError):
+    """
+    Telegram отклонил повторную отправку с тем же ключом идемпотентности: пост уже в канале.
+    """
+
+
+class PublishOutcomeUnknown(RuntimeError):
+    """
+    Запрос мог дойти до Telegram, но ответ потерян (таймаут чтения, обрыв соединения).
+    Без ключа идемпотентности на стороне Telegram (Bot API) такой пост нельзя отправлять повторно.
+    """
+
+
+def idempotency_random_id(idempotency_key: str) -> int:
+    """
+    random_id запроса MTProto из ключа идемпотентности: Telegram отвечает RANDOM_ID_DUPLICATE
+    на повторную отправку с тем же random_id, поэтому повтор не создаёт второй пост.
+    """
+    return int.from_bytes(hashlib.sha256(idempotency_key.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def _bot_id() -> str:
+    # Состояние привязано к боту: при смене токена сессия и кэш каналов не переиспользуются
+    return settings.telegram_bot_token.split(":", 1)[0] or "default"
+
+
+def _session_field(slot: int) -> str:
+    return f"session:{slot}"
+
+
+def _slot_lease(slot: int) -> str:
+    return f"publisher:session:{_bot_id()}:{slot}"
+
+
+def _claim_session_slot() -> tuple[int, LeaseHeartbeat] | None:
+    """
+    Захватывает свободный слот сессии: ключ авторизации Telethon нельзя использовать из двух
+    клиентов одновременно (сбиваются message id MTProto, и Telegram отзывает сессию).
+    Сессии слотов переживают перезапуск контейнеров и переиспользуются следующими процессами.
+    """
+    for slot in range(SESSION_SLOTS):
+        token = acquire_lease(_slot_lease(slot), SESSION_SLOT_TTL)
+        if token is not None:
+            return slot, LeaseHeartbeat(_slot_lease(slot), token, SESSION_SLOT_TTL).start()
+    return None
+
+
+def _release_session_slot(loop: asyncio.AbstractEventLoop) -> None:
+    claimed = _session_slots.pop(loop, None)
+    if claimed is not None:
+        slot, heartbeat = claimed
+        heartbeat.stop()
+        release_lease(_slot_lease(slot), heartbeat.token)
+
+
+def _prune_stale_sessions() -> None:
+    # Сессии прежней схемы (по имени хоста) и слоты сверх SESSION_SLOTS больше не используются
+    valid = {_session_field(slot) for slot in range(SESSION_SLOTS)}
+    stale = [
+        field for field in list_publisher_state_fields(_bot_id())
+        if field.startswith("session:") and field not in valid
+    ]
+    if stale:
+        delete_publisher_state(_bot_id(), *stale)
+        logger.info(f"Removed {len(stale)} stale publisher sessions")
+
+
+def normalize_target(target: str | int) -> str | int:
+    # Если target - это юзернейм без @, добавляем его
+    if isinstance(target, str) and not target.startswith('@') and not target.replace('-', '').isdigit():
+        return f"@{target}"
+    if isinstance(target, str) and target.replace('-', '').isdigit():
+        return int(target)
+    return target
+
+
+def _prune_closed_loops() -> None:
+    for loop in [loop for loop in _publishers if loop.is_closed()]:
+        _publishers.pop(loop, None)
+    for loop in [loop for loop in _publisher_locks if loop.is_closed()]:
+        _publisher_locks.pop(loop, None)
+    for loop in [loop for loop in _session_slots if loop.is_closed()]:
+        _release_session_slot(loop)
+
+
+def _slot_lost(loop: asyncio.AbstractEventLoop) -> bool:
+    claimed = _session_slots.get(loop)
+    return claimed is not None and claimed[1].lost
+
+
+async def get_publisher_client() -> TelegramClient:
+    """
+    Возвращает подключённый и авторизованный клиент публикации для текущего event loop.
+    Вход по токену бота выполняется только если сохранённой сессии нет или она отозвана.
+    """
+    if not settings.telegram_api_id or not settings.telegram_api_hash:
+        raise RuntimeError("Telegram API credentials are not configured")
+
+    loop = asyncio.get_running_loop()
+    _prune_closed_loops()
+    client = _publishers.get(loop)
+    if client is not None and client.is_connected() and not _slot_lost(loop):
+        return client
+
+    lock = _publisher_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        client = _publishers.get(loop)
+        if client is not None and _slot_lost(loop):
+            # Аренда слота истекла (процесс долго не продлевал её) — сессию мог забрать другой клиент
+            logger.warning("Publisher session slot lease lost. Reconnecting with a new slot")
+            _publishers.pop(loop, None)
+            _release_session_slot(loop)
+            await client.disconnect()
+            client = None
+        if client is not None and client.is_connected():
+            return client
+        if client is not None:
+            # Соединение разорвано — переподключаемся с той же сессией
+            await client.connect()
+            return client
+
+        # Слот от предыдущей неудачной попытки подключения освобождается
+        _release_session_slot(loop)
+        claimed = _claim_session_slot()
+        if claimed is None:
+            # Все слоты заняты: временная сессия без сохранения (вход по токену при каждом подключении)
+            logger.warning(f"All {SESSION_SLOTS} publisher session slots are busy. Using a temporary session")
+            saved_session = None
+        else:
+            _session_slots[loop] = claimed
+            _prune_stale_sessions()
+            saved_session = get_publisher_state(_bot_id(), _session_field(claimed[0]))
+        # flood_sleep_threshold=0: Telethon не спит внутри отправки, ожидание планирует очередь публикаций
+        client = TelegramClient(
+            StringSession(saved_session), settings.telegram_api_id, settings.telegram_api_hash,
+            flood_sleep_threshold=0,
+        )
+        await client.connect()
+        if await client.is_user_authorized():
+            logger.info("Publisher client connected with saved session")
+        else:
+            await client.sign_in(bot_token=settings.telegram_bot_token)
+            if claimed is not None:
+                set_publisher_state(_bot_id(), _session_field(claimed[0]), client.session.save())
+                logger.info(f"Publisher client signed in with bot token, session saved to slot {claimed[0]}")
+            else:
+                logger.info("Publisher client signed in with bot token")
+        _publishers[loop] = client
+        return client
+
+
+async def close_publisher_client() -> None:
+    """
+    Отключает клиенты публикации текущего event loop (сессия в Redis сохраняется).
+    """
+    await close_bot_api_client()
+    loop = asyncio.get_running_loop()
+    client = _publishers.pop(loop, None)
+    if client is not None:
+        try:
+            await client.disconnect()
+            logger.info("Disconnected publisher client")
+        except Exception as e:
+            logger.warning(f"Error while disconnecting publisher client: {e}")
+    # Слот освобождается после отключения: следующий клиент возьмёт сессию, когда эта уже не в сети
+    _release_session_slot(loop)
+
+
+async def _get_bot_username(client: TelegramClient) -> str:
+    global _bot_username
+    if _bot_username is None:
+        _bot_username = get_publisher_state(_bot_id(), "bot_username")
+    if _bot_username is None:
+        me = await client.get_me()
+        _bot_username = me.username
+        set_publisher_state(_bot_id(), "bot_username", _bot_username)
+    return _bot_username
+
+
+async def _resolve_target(client: TelegramClient, target: str | int) -> types.TypeInputPeer:
+    key = str(target)
+    if key in _entities:
+        return _entities[key]
+
+    raw = get_publisher_state(_bot_id(), f"entity:{key}")
+    if raw:
+        data = json.loads(raw)
+        peer = _INPUT_PEER_TYPES[data.pop("type")](**data)
+    else:
+        peer = await client.get_input_entity(target)
+        data = {name: value for name, value in peer.to_dict().items() if name != "_"}
+        set_publisher_state(_bot_id(), f"entity:{key}", json.dumps({"type": type(peer).__name__, **data}))
+        logger.info(f"Target resolved: {type(peer).__name__} ({key})")
+    _entities[key] = peer
+    return peer
+
+
+def _forget_target(target: str | int) -> None:
+    _entities.pop(str(target), None)
+    delete_publisher_state(_bot_id(), f"entity:{target}")
+
+
+def _build_buttons(url: Optional[str], bot_username: str) -> list[list[Button]]:
+    row = []
+    # 1. Кнопка перехода к источнику
+    if url:
+        row.append(Button.url("🔗 Читать в источнике", url))
+    # 2. Кнопка управления (ссылка на бота)
+    row.append(Button.url("⚙️ Настроить бота", f"https://t.me/{bot_username}"))
+    return [row]
+
+
+def _target_error(target: str | int, error: Exception) -> RuntimeError:
+    return RuntimeError(
+        f"Не удалось найти канал/чат '{target}'.\n"
+        f"1. Убедитесь, что бот добавлен в канал как администратор.\n"
+        f"2. Проверьте правильность юзернейма в .env (должен начинаться с @).\n"
+        f"3. Если канал приватный, используйте его числовой ID.\n"
+        f"Техническая ошибка: {error}"
+    )
+
+
+async def _send_via_telethon(client: TelegramClient, entity: types.TypeInputPeer, text: str, buttons, random_id: int) -> str:
+    # Тот же разбор markdown, что и в client.send_message, но со своим random_id
+    message, entities = markdown.parse(text)
+    message = helpers.strip_text(message, entities)
+    result = await client(SendMessageRequest(
+        peer=entity,
+        message=message,
+        random_id=random_id,
+        entities=entities or None,
+        reply_markup=client.build_reply_markup(buttons),
+    ))
+    for update in getattr(result, "updates", []):
+        if isinstance(update, types.UpdateMessageID) and update.random_id == random_id:
+            return str(update.id)
+    return str(getattr(result, "id", ""))
+
+
+async def _publish_via_telethon(text: str, url: Optional[str], target: str | int, idempotency_key: Optional[str]) -> str:
+    client = await get_publisher_client()
+    buttons = _build_buttons(url, await _get_bot_username(client))
+    random_id = idempotency_random_id(idempotency_key) if idempotency_key else helpers.generate_random_long()
+
+    # Получаем сущность (канал/чат) до отправки для более точной диагностики
+    try:
+        entity = await _resolve_target(client, target)
+    except Exception as e:
+        logger.error(f"Failed to resolve target '{target}': {e}")
+        raise _target_error(target, e)
+
+    try:
+        try:
+            return await _send_via_telethon(client, entity, text, buttons, random_id)
+        except (ValueError, ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError) as exc:
+            # Кэшированный канал мог устареть (бот удалён из канала, канал пересоздан) — разрешаем заново
+            logger.warning(f"Cached target '{target}' failed ({exc}), resolving again")
+            _forget_target(target)
+            entity = await _resolve_target(client, target)
+            return await _send_via_telethon(client, entity, text, buttons, random_id)
+    except RandomIdDuplicateError:
+        raise AlreadyPublished(f"Message with idempotency key {idempotency_key} is already in {target}")
+
+
+# --- Bot API (HTTP) ---
+# Для обычных постов в канал полноценный MTProto-клиент не нужен: Bot API — это один
+# HTTPS-запрос sendMessage через keep-alive пул, без криптографического рукопожатия и сессии.
+_bot_api_clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+# Разметка постов та же, что у Telethon (markdown: **жирный**, __курсив__, [текст](url)),
+# поэтому текст разбирается парсером Telethon и отправляется в Bot API готовыми entities
+_BOT_API_ENTITY_TYPES = {
+    types.MessageEntityBold: "bold",
+    types.MessageEntityItalic: "italic",
+    types.MessageEntityUnderline: "underline",
+    types.MessageEntityStrike: "strikethrough",
+    types.MessageEntitySpoiler: "spoiler",
+    types.MessageEntityCode: "code",
+    types.MessageEntityPre: "pre",
+    types.MessageEntityTextUrl: "text_link",
+    types.MessageEntityBlockquote: "blockquote",
+}
+
+
+class BotApiError(RuntimeError):
+    """
+    Ошибка Bot API: код ответа и, для 429, время ожидания из parameters.retry_after.
+    """
+
+    def __init__(self, error_code: int, description: str, retry_after: int | None = None):
+        super().__init__(f"Bot API error {error_code}: {description}")
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+
+def get_bot_api_client() -> httpx.AsyncClient:
+    """
+    Возвращает долгоживущий httpx-клиент Bot API для текущего event loop.
+    """
+    loop = asyncio.get_running_loop()
+    for closed in [closed for closed in _bot_api_clients if closed.is_closed()]:
+        _bot_api_clients.pop(closed, None)
+    client = _bot_api_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=f"{settings.telegram_bot_api_url.rstrip('/')}/bot{settings.telegram_bot_token}/",
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=60),
+            timeout=httpx.Timeout(settings.telegram_bot_api_timeout, connect=5.0),
+        )
+        _bot_api_clients[loop] = client
+        logger.info("Created pooled Bot API client")
+    return client
+
+
+async def _bot_api_call(method: str, payload: dict | None = None) -> dict:
+    try:
+        response = await get_bot_api_client().post(method, json=payload or {})
+    except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+        # Запрос не был отправлен — его можно безопасно повторить
+        raise
+    except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+        raise PublishOutcomeUnknown(f"Bot API {method}: no response ({type(e).__name__}: {e})")
+    try:
+        data = response.json()
+    except ValueError:
+        raise BotApiError(response.status_code, response.text[:200])
+    if not data.get("ok"):
+        raise BotApiError(
+            data.get("error_code", response.status_code),
+            data.get("description", ""),
+            (data.get("parameters") or {}).get("retry_after"),
+        )
+    return data["result"]
+
+
+def to_bot_api_message(text: str) -> tuple[str, list[dict]]:
+    """
+    Разбирает markdown поста так же, как Telethon, и возвращает текст и entities Bot API.
+    Смещения в обоих API считаются в UTF-16, поэтому переносятся без пересчёта.
+    """
+    plain, entities = markdown.parse(text)
+    result = []
+    for entity in entities:
+        entity_type = _BOT_API_ENTITY_TYPES.get(type(entity))
+        if entity_type is None:
+            continue
+        item = {"type": entity_type, "offset": entity.offset, "length": entity.length}
+        if entity_type == "text_link":
+            item["url"] = entity.url
+        elif entity_type == "pre" and entity.language:
+            item["language"] = entity.language
+        result.append(item)
+    return plain, result
+
+
+async def _get_bot_api_username() -> str:
+    global _bot_username
+    if _bot_username is None:
+        _bot_username = get_publisher_state(_bot_id(), "bot_username")
+    if _bot_username is None:
+        me = await _bot_api_call("getMe")
+        _bot_username = me["username"]
+        set_publisher_state(_bot_id(), "bot_username", _bot_username)
+    return _bot_username
+
+
+async def _publish_via_bot_api(text: str, url: Optional[str], target: str | int) -> str:
+    bot_username = await _get_bot_api_username()
+    keyboard = []
+    if url:
+        keyboard.append({"text": "🔗 Читать в источнике", "url": url})
+    keyboard.append({"text": "⚙️ Настроить бота", "url": f"https://t.me/{bot_username}"})
+
+    plain, entities = to_bot_api_message(text)
+    payload = {"chat_id": target, "text": plain, "reply_markup": {"inline_keyboard": [keyboard]}}
+    if entities:
+        payload["entities"] = entities
+    try:
+        message = await _bot_api_call("sendMessage", payload)
+    except BotApiError as e:
+        if e.error_code in (400, 403) and "chat" in e.description.lower():
+            logger.error(f"Failed to resolve target '{target}': {e}")
+            raise _target_error(target, e)
+        raise
+    return str(message["message_id"])
+
+
+async def close_bot_api_client() -> None:
+    """
+    Закрывает httpx-клиент Bot API текущего event loop.
+    """
+    client = _bot_api_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+        logger.info("Closed pooled Bot API client")
+
+
+async def publish_to_channel(text: str, url: Optional[str | Any] = None, channel_id: Optional[str] = None, idempotency_key: Optional[str] = None) -> str:
     """
     Публикует сообщение в канал. Если передан url, добавляет кнопку-ссылку на источник.
     Также добавляет кнопку перехода в бота для настройки.
+    Способ отправки задаёт TELEGRAM_PUBLISHER_BACKEND: постоянный клиент Telethon (username бота
+    и канал берутся из кэша) или Bot API через пул соединений. В обоих случаях публикация —
+    это один запрос sendMessage.
+    idempotency_key (Telethon) превращается в random_id сообщения: повторная отправка с тем же
+    ключом не создаёт второй пост, а поднимает AlreadyPublished.
     """
     # Преобразуем URL в строку, если передан объект (например, AnyHttpUrl от Pydantic)
     if url is not None:
         url = str(url)
-    
-    # Создаем новый клиент для каждой публикации
-    client = get_telegram_client(session_name=":memory:") 
-    
+
     target = channel_id or settings.telegram_channel_id
     if not target:
         raise RuntimeError("Telegram channel id is not configured")
-    
-    logger.info(f"Publishing to channel {target}...")
+    target = normalize_target(target)
+
+    backend = settings.telegram_publisher_backend.lower()
+    logger.info(f"Publishing to channel {target} via {backend}...")
     try:
-        await client.start(bot_token=settings.telegram_bot_token)
-        async with client:
-            # Получаем информацию о боте, чтобы сформировать ссылку на него
-            me = await client.get_me()
-            bot_username = me.username
-            
-            buttons = []
-            row = []
-            
-            # 1. Кнопка перехода к источнику
-            if url:
-                row.append(Button.url("🔗 Читать в источнике", url))
-            
-            # 2. Кнопка управления (ссылка на бота)
-            row.append(Button.url("⚙️ Настроить бота", f"https://t.me/{bot_username}"))
-            
-            if row:
-                buttons.append(row)
-
-            # Попытка получить сущность (канал/чат) перед отправкой для более точной диагностики
-            try:
-                # Если target - это юзернейм без @, добавляем его
-                if isinstance(target, str) and not target.startswith('@') and not target.replace('-', '').isdigit():
-                    target = f"@{target}"
-                
-                entity = await client.get_entity(target)
-                logger.info(f"Target resolved: {type(entity).__name__} (ID: {entity.id})")
-            except Exception as e:
-                logger.error(f"Failed to resolve target '{target}': {e}")
-                raise RuntimeError(
-                    f"Не удалось найти канал/чат '{target}'.\n"
-                    f"1. Убедитесь, что бот добавлен в канал как администратор.\n"
-                    f"2. Проверьте правильность юзернейма в .env (должен начинаться с @).\n"
-                    f"3. Если канал приватный, используйте его числовой ID.\n"
-                    f"Техническая ошибка: {e}"
-                )
-
-            message = await client.send_message(entity, text, buttons=buttons if buttons else None)
-            logger.info(f"Successfully published message {message.id}")
-            return str(message.id)
+        if backend == "botapi":
+            message_id = await _publish_via_bot_api(text, url, target)
+        else:
+            message_id = await _publish_via_telethon(text, url, target, idempotency_key)
+        logger.info(f"Successfully published message {message_id}")
+        return message_id
+    except FloodWaitError as exc:
+        logger.warning(f"Telegram flood wait for {target}: {exc.seconds} s")
+        raise PublishFloodWait(exc.seconds)
+    except AlreadyPublished as exc:
+        logger.warning(str(exc))
+        raise exc
+    except BotApiError as exc:
+        if exc.error_code == 429:
+            logger.warning(f"Bot API flood wait for {target}: {exc.retry_after} s")
+            raise PublishFloodWait(exc.retry_after or 1)
+        logger.error(f"Unexpected error during publication: {exc}")
+        raise exc
     except RPCError as exc:
         logger.error(f"Telegram RPC error: {exc}")
         raise RuntimeError(f"Failed to send message to Telegram: {exc}")
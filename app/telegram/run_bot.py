@@ -8,6 +8,7 @@ import signal
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 from app.telegram.bot import get_telegram_client, start_bot
+from app.ai.clients import close_ai_clients
 
 from app.logger import setup_logging
 
@@ -38,6 +39,7 @@ async def main():
 
 async def shutdown(client, sig):
     logger.info(f"Received exit signal {sig.name}...")
+    await close_ai_clients()
     await client.disconnect()
     tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
     [task.cancel() for task in tasks]
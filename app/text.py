@@ -0,0 +1,19 @@
+# Общая нормализация текста новостей для ранжирования и поиска дубликатов: обе части
+# должны одинаково понимать пустое описание и одинаково усекать словоформы.
+from app.schemas import NewsItem
+
+# Заглушка, которую normalize_raw_news подставляет при отсутствии описания
+EMPTY_SUMMARY = "Нет текста"
+# Усечение слов до префикса — дешёвый "стемминг" для русского языка (нейросети/нейросеть)
+STEM_LENGTH = 6
+
+
+def stem(word: str) -> str:
+    return word[:STEM_LENGTH]
+
+
+def news_summary(news: NewsItem) -> str:
+    """
+    Описание новости или пустая строка, если вместо него стоит заглушка EMPTY_SUMMARY.
+    """
+    return news.summary if news.summary and news.summary != EMPTY_SUMMARY else ""
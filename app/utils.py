@@ -3,16 +3,30 @@ from __future__ import annotations
 
 import json
 import logging
+import time
 from typing import Iterable
 
 from redis import Redis
 from redis.exceptions import RedisError
 
 from app.config import settings
+from app.dedup import find_or_index_duplicate
 from app.schemas import NewsItem, Post, Source
 
 logger = logging.getLogger("api")
 
+# Индекс новостей по времени (score — published_at) и счётчик изменений списка новостей
+NEWS_TIME_INDEX = "news:by_time"
+NEWS_INDEX_VERSION = "news:version"
+# Срок жизни новостей (score — момент истечения TTL): по нему истёкшие новости находятся без обхода списка
+NEWS_EXPIRY_INDEX = "news:expires"
+# Сколько id индекса загружается за один MGET при постраничной выдаче
+NEWS_PAGE_SCAN = 200
+# Сколько id ранжированного индекса проверяется за одну порцию при выборе лидеров очереди
+RANKED_SCAN = 50
+# Сколько id ранжированного индекса проверяется за одну порцию при подсчёте глубины очереди
+RANKED_COUNT_SCAN = 500
+
 
 def get_redis_client():
     try:
@@ -37,12 +51,21 @@ def save_news_item(news: NewsItem) -> None:
     if is_news_exists(news.id) or is_news_published(news.id):
         return
 
+    # 2. Защита от копий одной истории из разных источников: в очередь попадает
+    # только представитель кластера почти одинаковых новостей
+    if settings.dedup_enabled and find_or_index_duplicate(client, news) is not None:
+        return
+
     key = f"news:{news.id}"
     try:
-        # 2. Сохраняем новость с TTL из настроек
+        # 3. Сохраняем новость с TTL из настроек
         client.set(key, news.model_dump_json(), ex=settings.time_life_news)
-        # 3. Добавляем в множество (SADD гарантирует уникальность ID в списке)
+        # 4. Добавляем в множество (SADD гарантирует уникальность ID в списке)
         client.sadd("news:ids", news.id)
+        # 5. Индекс по времени для постраничной выдачи /news и версия для её ETag
+        client.zadd(NEWS_TIME_INDEX, {news.id: news.published_at.timestamp()})
+        client.zadd(NEWS_EXPIRY_INDEX, {news.id: time.time() + settings.time_life_news})
+        client.incr(NEWS_INDEX_VERSION)
     except RedisError as e:
         logger.error(f"Redis error in save_news_item: {e}")
         return
@@ -114,6 +137,443 @@ def list_news_items(limit: int | None = None) -> list[NewsItem]:
     return result
 
 
+def get_news_index_version() -> int:
+    """
+    Версия списка новостей: растёт при каждом добавлении, публикации или удалении истёкших записей.
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+    try:
+        return int(client.get(NEWS_INDEX_VERSION) or 0)
+    except RedisError as e:
+        logger.error(f"Redis error in get_news_index_version: {e}")
+        return 0
+
+
+def _ensure_news_time_index(client) -> None:
+    # Новости, сохранённые до появления индекса по времени, добавляются в него один раз
+    if client.exists(NEWS_TIME_INDEX) or not client.scard("news:ids"):
+        return
+    items = get_news_items_bulk(list(client.smembers("news:ids")))
+    if items:
+        client.zadd(NEWS_TIME_INDEX, {item.id: item.published_at.timestamp() for item in items})
+        client.incr(NEWS_INDEX_VERSION)
+
+
+def _ensure_news_expiry_index(client) -> None:
+    # Новости, сохранённые до появления индекса сроков, добавляются в него один раз по их TTL
+    if client.exists(NEWS_EXPIRY_INDEX) or not client.scard("news:ids"):
+        return
+    news_ids = list(client.smembers("news:ids"))
+    pipe = client.pipeline()
+    for news_id in news_ids:
+        pipe.ttl(f"news:{news_id}")
+    now = time.time()
+    expires = {}
+    for news_id, ttl in zip(news_ids, pipe.execute()):
+        # Отсутствующая новость (TTL -2) уже истекла, новость без TTL (-1) живёт весь срок
+        if ttl == -1:
+            ttl = settings.time_life_news
+        expires[news_id] = now + max(ttl, 0)
+    client.zadd(NEWS_EXPIRY_INDEX, expires)
+
+
+def _remove_expired_news(client, news_ids: list[str]) -> None:
+    # Убирает истёкшие id из индексов списка новостей и меняет его версию (ETag /news)
+    pipe = client.pipeline()
+    pipe.zrem(NEWS_TIME_INDEX, *news_ids)
+    pipe.zrem(NEWS_EXPIRY_INDEX, *news_ids)
+    pipe.srem("news:ids", *news_ids)
+    pipe.incr(NEWS_INDEX_VERSION)
+    pipe.execute()
+
+
+def prune_expired_news() -> int:
+    """
+    Удаляет из индексов новости, чей TTL уже истёк, и возвращает их число.
+    Проверка дешёвая (ZRANGEBYSCORE по сроку), поэтому выполняется перед расчётом ETag /news:
+    иначе истечение новости по TTL не меняло бы версию списка.
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+    try:
+        _ensure_news_expiry_index(client)
+        due = client.zrangebyscore(NEWS_EXPIRY_INDEX, "-inf", time.time())
+        if not due:
+            return 0
+        pipe = client.pipeline()
+        for news_id in due:
+            pipe.exists(f"news:{news_id}")
+        # Новость, сохранённая заново после истечения, уже получила новый срок
+        expired = [news_id for news_id, exists in zip(due, pipe.execute()) if not exists]
+        if expired:
+            _remove_expired_news(client, expired)
+        return len(expired)
+    except RedisError as e:
+        logger.error(f"Redis error in prune_expired_news: {e}")
+        return 0
+
+
+def list_news_page(
+    limit: int,
+    cursor: tuple[float, str] | None = None,
+    source: str | None = None,
+    since: float | None = None,
+    published: bool | None = None,
+    keyword: str | None = None,
+) -> tuple[list[NewsItem], tuple[float, str] | None]:
+    """
+    Страница новостей от новых к старым с фильтрами. cursor — (published_at, id) последней
+    новости предыдущей страницы. Возвращает новости и курсор следующей страницы (None — конец).
+    Истёкшие по TTL id попутно удаляются из индексов.
+    """
+    client = get_redis_client()
+    if client is None:
+        return [], None
+    keyword = keyword.lower() if keyword else None
+    result: list[NewsItem] = []
+    next_cursor: tuple[float, str] | None = None
+    max_score = cursor[0] if cursor else "+inf"
+    min_score = since if since is not None else "-inf"
+    # Истёкшие id удаляются после сборки страницы: удаление во время обхода сдвигало бы
+    # смещение следующей порции и пропускало живые новости
+    expired: list[str] = []
+    offset = 0
+    try:
+        _ensure_news_time_index(client)
+        while next_cursor is None:
+            entries = client.zrevrangebyscore(
+                NEWS_TIME_INDEX, max_score, min_score, start=offset, num=NEWS_PAGE_SCAN, withscores=True,
+            )
+            if not entries:
+                break
+            offset += len(entries)
+            # Новости с тем же временем, что у курсора, упорядочены по id по убыванию
+            if cursor:
+                entries = [(news_id, score) for news_id, score in entries if score < cursor[0] or news_id < cursor[1]]
+            ids = [news_id for news_id, _ in entries]
+            raws = client.mget([f"news:{news_id}" for news_id in ids]) if ids else []
+            flags = [False] * len(ids)
+            if published is not None and ids:
+                pipe = client.pipeline()
+                for news_id in ids:
+                    pipe.sismember("published_news:ids", news_id)
+                flags = pipe.execute()
+            for (news_id, score), raw, is_published in zip(entries, raws, flags):
+                if raw is None:
+                    expired.append(news_id)
+                    continue
+                item = NewsItem.model_validate(json.loads(raw))
+                if source and item.source != source:
+                    continue
+                if published is not None and bool(is_published) != published:
+                    continue
+                if keyword and keyword not in f"{item.title} {item.summary or ''}".lower():
+                    continue
+                result.append(item)
+                if len(result) >= limit:
+                    next_cursor = (score, news_id)
+                    break
+        if expired:
+            _remove_expired_news(client, expired)
+    except RedisError as e:
+        logger.error(f"Redis error in list_news_page: {e}")
+    return result, next_cursor
+
+
+def get_news_items_bulk(ids: list[str]) -> list[NewsItem]:
+    """
+    Загружает пачку новостей одним MGET (для пакетной обработки тысяч записей).
+    Отсутствующие (истёкшие по TTL) новости пропускаются.
+    """
+    client = get_redis_client()
+    if client is None or not ids:
+        return []
+    try:
+        raws = client.mget([f"news:{news_id}" for news_id in ids])
+    except RedisError as e:
+        logger.error(f"Redis error in get_news_items_bulk: {e}")
+        return []
+
+    result: list[NewsItem] = []
+    for raw in raws:
+        if raw is None:
+            continue
+        try:
+            result.append(NewsItem.model_validate(json.loads(raw)))
+        except Exception as e:
+            logger.warning(f"Ошибка валидации новости при пакетной загрузке: {e}")
+    return result
+
+
+def list_all_news_ids() -> list[str]:
+    """
+    Возвращает id всех новостей из индекса news:ids (без загрузки самих новостей).
+    """
+    client = get_redis_client()
+    if client is None:
+        return []
+    try:
+        return list(client.smembers("news:ids"))
+    except RedisError as e:
+        logger.error(f"Redis error in list_all_news_ids: {e}")
+        return []
+
+
+def save_news_scores(scores: dict[str, float]) -> None:
+    """
+    Записывает оценки релевантности в ранжированный индекс news:ranked (sorted set).
+    Индекс ограничивается RANKING_INDEX_SIZE лучшими записями.
+    """
+    client = get_redis_client()
+    if client is None or not scores:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.zadd("news:ranked", scores)
+        # Отбрасываем самые слабые записи, чтобы индекс не рос бесконечно
+        pipe.zremrangebyrank("news:ranked", 0, -settings.ranking_index_size - 1)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in save_news_scores: {e}")
+
+
+def list_top_ranked_news(limit: int) -> list[NewsItem]:
+    """
+    Возвращает до limit самых релевантных неопубликованных новостей из индекса news:ranked.
+    Индекс читается порциями до RANKED_SCAN id; опубликованные и истёкшие по TTL id
+    попутно удаляются из индекса.
+    """
+    client = get_redis_client()
+    if client is None or limit <= 0:
+        return []
+    result: list[NewsItem] = []
+    start = 0
+    try:
+        while len(result) < limit:
+            ranked_ids = client.zrevrange("news:ranked", start, start + min(RANKED_SCAN, 2 * (limit - len(result))) - 1)
+            if not ranked_ids:
+                break
+            pipe = client.pipeline()
+            for news_id in ranked_ids:
+                pipe.sismember("published_news:ids", news_id)
+            flags = pipe.execute()
+            raws = client.mget([f"news:{news_id}" for news_id in ranked_ids])
+            stale = []
+            for news_id, is_published, raw in zip(ranked_ids, flags, raws):
+                if is_published or raw is None:
+                    stale.append(news_id)
+                    continue
+                try:
+                    result.append(NewsItem.model_validate(json.loads(raw)))
+                except Exception as e:
+                    logger.warning(f"Ошибка валидации новости {news_id} в ранжированном индексе: {e}")
+                    continue
+                if len(result) >= limit:
+                    break
+            if stale:
+                client.zrem("news:ranked", *stale)
+            # Удалённые id сдвигают ранги следующих записей
+            start += len(ranked_ids) - len(stale)
+    except RedisError as e:
+        logger.error(f"Redis error in list_top_ranked_news: {e}")
+    return result
+
+
+def count_ranked_news() -> int:
+    """
+    Глубина очереди публикации: число живых записей в ранжированном индексе news:ranked.
+    Опубликованные и истёкшие по TTL id попутно удаляются из индекса, иначе очередь
+    из одних устаревших id казалась бы полной и не пополнялась.
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+    live = 0
+    try:
+        while True:
+            ranked_ids = client.zrange("news:ranked", live, live + RANKED_COUNT_SCAN - 1)
+            if not ranked_ids:
+                break
+            pipe = client.pipeline()
+            for news_id in ranked_ids:
+                pipe.exists(f"news:{news_id}")
+                pipe.sismember("published_news:ids", news_id)
+            flags = pipe.execute()
+            stale = [
+                news_id for news_id, exists, is_published in zip(ranked_ids, flags[::2], flags[1::2])
+                if not exists or is_published
+            ]
+            if stale:
+                client.zrem("news:ranked", *stale)
+            # Живые id остаются на своих местах, удалённые сдвигают следующие
+            live += len(ranked_ids) - len(stale)
+    except RedisError as e:
+        logger.error(f"Redis error in count_ranked_news: {e}")
+    return live
+
+
+def get_next_ranked_news() -> NewsItem | None:
+    """
+    Возвращает самую релевантную неопубликованную новость из индекса news:ranked.
+    """
+    top = list_top_ranked_news(limit=1)
+    return top[0] if top else None
+
+
+def save_draft_post(post: Post, fingerprint: str) -> None:
+    """
+    Сохраняет заранее сгенерированный пост (status="generated") для новости вместе с
+    отпечатком настроек генерации. Черновик живёт столько же, сколько новость.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    key = f"drafts:{post.news_id}"
+    try:
+        pipe = client.pipeline()
+        pipe.hset(key, mapping={"post": post.model_dump_json(), "fingerprint": fingerprint})
+        pipe.expire(key, settings.time_life_news)
+        pipe.sadd("drafts:all", post.news_id)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in save_draft_post: {e}")
+
+
+def get_draft_post(news_id: str, fingerprint: str) -> Post | None:
+    """
+    Возвращает черновик поста, если он сгенерирован с текущими настройками.
+    Устаревший черновик (другой отпечаток) удаляется.
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        data = client.hgetall(f"drafts:{news_id}")
+    except RedisError as e:
+        logger.error(f"Redis error in get_draft_post: {e}")
+        return None
+    if not data:
+        return None
+    if data.get("fingerprint") != fingerprint:
+        delete_draft_post(news_id)
+        return None
+    return Post.model_validate(json.loads(data["post"]))
+
+
+def delete_draft_post(news_id: str) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.delete(f"drafts:{news_id}")
+        client.srem("drafts:all", news_id)
+    except RedisError:
+        pass
+
+
+def clear_draft_posts() -> None:
+    """
+    Удаляет все черновики (например, после переключения ИИ on/off).
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        news_ids = client.smembers("drafts:all")
+        if news_ids:
+            client.delete(*[f"drafts:{news_id}" for news_id in news_ids])
+        client.delete("drafts:all")
+    except RedisError as e:
+        logger.error(f"Redis error in clear_draft_posts: {e}")
+
+
+def claim_news_generation(news_id: str, owner: str, ttl: int, force: bool = False) -> bool:
+    """
+    Захватывает генерацию поста новости (SET NX с TTL), чтобы предгенерация и публикация
+    в разных воркерах не запрашивали ИИ для одной и той же новости одновременно.
+    force перехватывает захват у владельца, который не уложился в отведённое ожидание.
+    """
+    client = get_redis_client()
+    if client is None:
+        return True
+    try:
+        return bool(client.set(f"generation:claim:{news_id}", owner, nx=not force, ex=ttl))
+    except RedisError as e:
+        logger.error(f"Redis error in claim_news_generation: {e}")
+        return True
+
+
+def release_news_generation(news_id: str, owner: str) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        if client.get(f"generation:claim:{news_id}") == owner:
+            client.delete(f"generation:claim:{news_id}")
+    except RedisError as e:
+        logger.error(f"Redis error in release_news_generation: {e}")
+
+
+def claim_scrape_request(ttl: int) -> bool:
+    """
+    Отмечает, что сбор новостей запрошен (SET NX с TTL). False — сбор уже стоит в очереди
+    или идёт, и ещё одна задача не нужна.
+    """
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        return bool(client.set("scrape:requested", "1", nx=True, ex=ttl))
+    except RedisError as e:
+        logger.error(f"Redis error in claim_scrape_request: {e}")
+        return False
+
+
+def hold_scrape_request(ttl: int) -> None:
+    """
+    Оставляет отметку о сборе ещё на ttl секунд после его завершения: пока она жива,
+    низкий уровень очереди не ставит новый внеочередной сбор. ttl <= 0 снимает отметку сразу.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        if ttl > 0:
+            client.set("scrape:requested", "1", ex=ttl)
+        else:
+            client.delete("scrape:requested")
+    except RedisError as e:
+        logger.error(f"Redis error in hold_scrape_request: {e}")
+
+
+def save_scrape_report(report: dict) -> None:
+    """
+    Сохраняет отчёт последнего сбора новостей (по источникам: число новостей, время, ошибки).
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.set("scrape:last_report", json.dumps(report, ensure_ascii=False))
+    except RedisError as e:
+        logger.error(f"Redis error in save_scrape_report: {e}")
+
+
+def get_scrape_report() -> dict:
+    client = get_redis_client()
+    if client is None:
+        return {}
+    try:
+        raw = client.get("scrape:last_report")
+    except RedisError as e:
+        logger.error(f"Redis error in get_scrape_report: {e}")
+        return {}
+    return json.loads(raw) if raw else {}
+
+
 def save_post(post: Post) -> None:
     """
     Сохраняет пост в Redis и добавляет его id в множество всех постов.
@@ -126,6 +586,13 @@ def save_post(post: Post) -> None:
         client.set(key, post.model_dump_json())
         client.sadd("posts:all", post.id)
         client.sadd("published_news:ids", post.news_id)
+        # Изменился признак "опубликована" у новости — списки /news нужно перечитать
+        client.incr(NEWS_INDEX_VERSION)
+        if post.channel_id:
+            client.sadd(f"published_news:channel:{post.channel_id}", post.news_id)
+        client.zrem("news:ranked", post.news_id)
+        client.delete(f"drafts:{post.news_id}")
+        client.srem("drafts:all", post.news_id)
     except RedisError as e:
         logger.error(f"Redis error in save_post: {e}")
         return
@@ -142,6 +609,47 @@ def is_news_published(news_id: str) -> bool:
         return False
 
 
+def is_news_published_to(news_id: str, channel: str) -> bool:
+    """
+    Опубликована ли новость в конкретный канал (при публикации в несколько каналов).
+    """
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        return client.sismember(f"published_news:channel:{channel}", news_id)
+    except RedisError as e:
+        logger.error(f"Redis error in is_news_published_to: {e}")
+        return False
+
+
+def drop_ranked_news(news_id: str) -> None:
+    """
+    Убирает новость из ранжированного индекса (например, если она не подходит ни одному каналу).
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.zrem("news:ranked", news_id)
+    except RedisError as e:
+        logger.error(f"Redis error in drop_ranked_news: {e}")
+
+
+def list_published_news_ids() -> list[str]:
+    """
+    Возвращает id всех опубликованных новостей.
+    """
+    client = get_redis_client()
+    if client is None:
+        return []
+    try:
+        return list(client.smembers("published_news:ids"))
+    except RedisError as e:
+        logger.error(f"Redis error in list_published_news_ids: {e}")
+        return []
+
+
 def get_post(post_id: str) -> Post | None:
     """
     Возвращает пост по id из Redis или None при отсутствии/ошибке.
@@ -259,6 +767,8 @@ def set_ai_setting(value: str) -> None:
     client = get_redis_client()
     if client:
         client.set("settings:ai_agent", value.lower())
+        # Черновики, сгенерированные при другом режиме ИИ, больше не актуальны
+        clear_draft_posts()
 
 
 def set_user_chat_mode(user_id: int, enabled: bool) -> None:
@@ -267,9 +777,155 @@ def set_user_chat_mode(user_id: int, enabled: bool) -> None:
     if client:
         key = f"user:{user_id}:chat_mode"
         if enabled:
-            client.set(key, "on", ex=3600)  # Режим чата активен 1 час
+            client.set(key, "on", ex=settings.chat_mode_ttl)  # Режим чата активен CHAT_MODE_TTL секунд
         else:
             client.delete(key)
+        # Новый сеанс чата начинается без истории, при выходе история удаляется
+        clear_chat_history(user_id)
+
+
+def get_chat_history(user_id: int) -> tuple[str, list[dict]]:
+    """
+    Возвращает память диалога пользователя: (сводка ранних сообщений, последние сообщения).
+    """
+    client = get_redis_client()
+    if client is None:
+        return "", []
+    try:
+        pipe = client.pipeline()
+        pipe.get(f"user:{user_id}:chat_summary")
+        pipe.lrange(f"user:{user_id}:chat_history", 0, -1)
+        summary, raw_messages = pipe.execute()
+        return summary or "", [json.loads(raw) for raw in raw_messages]
+    except (RedisError, ValueError) as e:
+        logger.error(f"Error in get_chat_history: {e}")
+        return "", []
+
+
+def save_chat_history(user_id: int, summary: str, messages: list[dict]) -> None:
+    """
+    Перезаписывает память диалога. Ключи живут столько же, сколько режим чата
+    (user:{id}:chat_mode), поэтому истекают вместе с ним.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    history_key = f"user:{user_id}:chat_history"
+    summary_key = f"user:{user_id}:chat_summary"
+    try:
+        ttl = client.ttl(f"user:{user_id}:chat_mode")
+        if ttl is None or ttl <= 0:
+            # Режим чата уже истёк — хранить историю незачем
+            client.delete(history_key, summary_key)
+            return
+        pipe = client.pipeline()
+        pipe.delete(history_key, summary_key)
+        if messages:
+            pipe.rpush(history_key, *[json.dumps(message, ensure_ascii=False) for message in messages])
+            pipe.expire(history_key, ttl)
+        if summary:
+            pipe.set(summary_key, summary, ex=ttl)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in save_chat_history: {e}")
+
+
+def clear_chat_history(user_id: int) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.delete(f"user:{user_id}:chat_history", f"user:{user_id}:chat_summary")
+    except RedisError as e:
+        logger.error(f"Redis error in clear_chat_history: {e}")
+
+
+def record_chat_queue_stats(user_id: int, depth: int, wait_ms: float | None = None, merged: int | None = None) -> None:
+    """
+    Обновляет метрики очереди чата пользователя: текущую глубину очереди, а при запуске
+    генерации — ожидание в очереди и число объединённых сообщений.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    key = f"chat:queue:{user_id}"
+    try:
+        pipe = client.pipeline()
+        pipe.hset(key, "depth", depth)
+        if wait_ms is not None:
+            pipe.hset(key, "last_wait_ms", round(wait_ms))
+            pipe.hincrbyfloat(key, "total_wait_ms", round(wait_ms, 1))
+            pipe.hincrby(key, "requests", 1)
+        if merged:
+            pipe.hincrby(key, "messages", merged)
+        pipe.expire(key, settings.chat_mode_ttl)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error in record_chat_queue_stats: {e}")
+
+
+def get_chat_queue_stats() -> list[dict]:
+    """
+    Метрики очереди чата по пользователям: глубина очереди, последнее и среднее ожидание,
+    сколько сообщений было объединено в запросы.
+    """
+    client = get_redis_client()
+    if client is None:
+        return []
+    result = []
+    try:
+        for key in client.scan_iter(match="chat:queue:*", count=500):
+            stats = client.hgetall(key)
+            requests = int(stats.get("requests", 0))
+            messages = int(stats.get("messages", 0))
+            result.append({
+                "user_id": key.rsplit(":", 1)[1],
+                "depth": int(stats.get("depth", 0)),
+                "last_wait_ms": int(stats.get("last_wait_ms", 0)),
+                "avg_wait_ms": round(float(stats.get("total_wait_ms", 0)) / requests) if requests else 0,
+                "requests": requests,
+                "merged_messages": messages - requests if messages else 0,
+            })
+    except RedisError as e:
+        logger.error(f"Redis error in get_chat_queue_stats: {e}")
+    return sorted(result, key=lambda item: item["depth"], reverse=True)
+
+
+def get_chat_memory_stats() -> dict:
+    """
+    Измеряет память диалогов: число пользователей с историей, занимаемые байты
+    (MEMORY USAGE, если команда доступна, иначе длина значений) и максимум на пользователя.
+    """
+    client = get_redis_client()
+    if client is None:
+        return {}
+    per_user: dict[str, int] = {}
+    try:
+        for key in client.scan_iter(match="user:*:chat_*", count=500):
+            if key.endswith(":chat_mode"):
+                continue
+            user_id = key.split(":")[1]
+            try:
+                size = client.memory_usage(key) or 0
+            except RedisError:
+                size = (
+                    sum(len(item.encode("utf-8")) for item in client.lrange(key, 0, -1))
+                    if key.endswith(":chat_history") else client.strlen(key)
+                )
+            per_user[user_id] = per_user.get(user_id, 0) + size
+    except RedisError as e:
+        logger.error(f"Redis error in get_chat_memory_stats: {e}")
+        return {}
+
+    total = sum(per_user.values())
+    return {
+        "active_users": len(per_user),
+        "total_bytes": total,
+        "max_bytes_per_user": max(per_user.values(), default=0),
+        "avg_bytes_per_user": round(total / len(per_user)) if per_user else 0,
+        "max_history_tokens": settings.chat_history_max_tokens,
+        "max_history_messages": settings.chat_history_max_messages,
+    }
 
 
 def is_user_in_chat_mode(user_id: int) -> bool:
@@ -355,3 +1011,49 @@ def get_source(source_id: str) -> Source | None:
         return None
     data = json.loads(raw)
     return Source.model_validate(data)
+
+
+def get_publisher_state(bot_id: str, field: str) -> str | None:
+    """
+    Сохранённое состояние клиента публикации бота: сессия Telethon, username бота
+    и разрешённые каналы (чтобы не запрашивать их у Telegram при каждой публикации).
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        return client.hget(f"telegram:publisher:{bot_id}", field)
+    except RedisError as e:
+        logger.error(f"Redis error in get_publisher_state: {e}")
+        return None
+
+
+def set_publisher_state(bot_id: str, field: str, value: str) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.hset(f"telegram:publisher:{bot_id}", field, value)
+    except RedisError as e:
+        logger.error(f"Redis error in set_publisher_state: {e}")
+
+
+def list_publisher_state_fields(bot_id: str) -> list[str]:
+    client = get_redis_client()
+    if client is None:
+        return []
+    try:
+        return client.hkeys(f"telegram:publisher:{bot_id}")
+    except RedisError as e:
+        logger.error(f"Redis error in list_publisher_state_fields: {e}")
+        return []
+
+
+def delete_publisher_state(bot_id: str, *fields: str) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.hdel(f"telegram:publisher:{bot_id}", *fields)
+    except RedisError as e:
+        logger.error(f"Redis error in delete_publisher_state: {e}")
@@ -7,6 +7,8 @@ from app.config import settings
 from app.api import api_router
 from app.utils import save_source, get_redis_client, init_app_settings
 from app.schemas import Source
+from app.ai.clients import close_ai_clients
+from app.telegram.publisher import close_publisher_client
 
 from app.logger import setup_logging
 
@@ -58,6 +60,8 @@ async def lifespan(app: FastAPI):
     
     # Код здесь выполнится при выключении (shutdown)
     logger.info("Приложение останавливается...")
+    await close_ai_clients()
+    await close_publisher_client()
     logger.info("Shutting down Newsbot API...")
 
 app = FastAPI(
@@ -0,0 +1,23 @@
+# Общие фикстуры тестов: вместо настоящего Redis — fakeredis (с Lua для скриптов).
+import os
+
+import fakeredis
+import pytest
+from redis import Redis
+
+# Настройки читаются при импорте app.config; адрес не используется — клиенты подменяются ниже
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/15")
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """
+    Подменяет Redis.from_url: get_redis_client() и прочие клиенты получают общий
+    fakeredis-сервер, свой для каждого теста.
+    """
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        Redis, "from_url",
+        staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server, decode_responses=kwargs.get("decode_responses", False))),
+    )
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
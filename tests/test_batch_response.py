@@ -0,0 +1,54 @@
+from app.ai.generator import parse_batch_response
+
+IDS = {"aaa111", "bbb222"}
+
+
+def test_parses_posts_by_id():
+    text = '{"posts": [{"id": "aaa111", "text": "Первый пост"}, {"id": "bbb222", "text": "Второй пост"}]}'
+    assert parse_batch_response(text, IDS) == {"aaa111": "Первый пост", "bbb222": "Второй пост"}
+
+
+def test_strips_markdown_fence_and_commentary():
+    text = 'Вот посты:\n```json\n{"posts": [{"id": "aaa111", "text": "  Пост  "}]}\n```\nГотово.'
+    assert parse_batch_response(text, IDS) == {"aaa111": "Пост"}
+
+
+def test_partial_response_returns_only_present_ids():
+    text = '{"posts": [{"id": "bbb222", "text": "Только второй"}]}'
+    assert parse_batch_response(text, IDS) == {"bbb222": "Только второй"}
+
+
+def test_skips_unknown_duplicate_and_empty_entries():
+    text = (
+        '{"posts": ['
+        '{"id": "zzz999", "text": "Чужой"},'
+        '{"id": "aaa111", "text": "Первый"},'
+        '{"id": "aaa111", "text": "Повтор"},'
+        '{"id": "bbb222", "text": "   "},'
+        '{"text": "Без id"},'
+        '"не объект",'
+        '{"id": "bbb222", "text": 42}'
+        ']}'
+    )
+    assert parse_batch_response(text, IDS) == {"aaa111": "Первый"}
+
+
+def test_numeric_ids_are_compared_as_strings():
+    assert parse_batch_response('{"posts": [{"id": 123, "text": "Пост"}]}', {"123"}) == {"123": "Пост"}
+
+
+def test_malformed_json_returns_empty():
+    assert parse_batch_response('{"posts": [{"id": "aaa111", "text": "обрыв', IDS) == {}
+    assert parse_batch_response('{"posts": [{"id": "aaa111", "text": "x"},]}', IDS) == {}
+    assert parse_batch_response("Извините, не могу ответить", IDS) == {}
+
+
+def test_wrong_shape_returns_empty():
+    assert parse_batch_response('{"items": []}', IDS) == {}
+    assert parse_batch_response('{"posts": {"id": "aaa111"}}', IDS) == {}
+    assert parse_batch_response('[{"id": "aaa111", "text": "x"}]', IDS) == {}
+
+
+def test_empty_response():
+    assert parse_batch_response(None, IDS) == {}
+    assert parse_batch_response("", IDS) == {}
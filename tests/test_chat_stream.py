@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from app.ai.generator import CHAT_UNAVAILABLE_MESSAGE
+from app.telegram import ai_in_bot
+from app.telegram.ai_in_bot import stream_chat_reply, TELEGRAM_MESSAGE_LIMIT, STREAM_CURSOR
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+    async def edit(self, text: str):
+        self.text = text
+
+
+class FakeEvent:
+    def __init__(self):
+        self.messages: list[FakeMessage] = []
+
+    async def reply(self, text: str) -> FakeMessage:
+        self.messages.append(FakeMessage(text))
+        return self.messages[-1]
+
+    respond = reply
+
+
+def stream(monkeypatch, chunks: list[str]) -> tuple[FakeEvent, str | None]:
+    async def fake_stream(user_message, history):
+        for chunk in chunks:
+            yield chunk
+
+    monkeypatch.setattr(ai_in_bot, "stream_ai_chat_response", fake_stream)
+    event = FakeEvent()
+    answer = asyncio.run(stream_chat_reply(event, "вопрос"))
+    return event, answer
+
+
+def test_short_answer_fills_placeholder(monkeypatch):
+    event, answer = stream(monkeypatch, ["Привет", ", мир"])
+    assert answer == "Привет, мир"
+    assert [message.text for message in event.messages] == ["Привет, мир"]
+
+
+def test_empty_answer_shows_fallback(monkeypatch):
+    event, answer = stream(monkeypatch, ["  "])
+    assert answer is None
+    assert [message.text for message in event.messages] == [CHAT_UNAVAILABLE_MESSAGE]
+
+
+def test_long_answer_continues_in_new_message(monkeypatch):
+    words = ["слово"] * 1000
+    event, answer = stream(monkeypatch, [word + " " for word in words])
+    texts = [message.text for message in event.messages]
+    assert len(texts) == 2
+    assert all(len(text) <= TELEGRAM_MESSAGE_LIMIT for text in texts)
+    assert " ".join(texts).split() == words
+    assert not any(text.endswith(STREAM_CURSOR) for text in texts)
+
+
+def test_answer_ending_at_split_opens_no_empty_message(monkeypatch):
+    # Первое сообщение заполняется целиком, остаток после переноса — одни пробелы
+    first = "а" * (TELEGRAM_MESSAGE_LIMIT - len(STREAM_CURSOR) - 10)
+    event, answer = stream(monkeypatch, [first, " " * 20])
+    assert answer == first
+    assert [message.text for message in event.messages] == [first]
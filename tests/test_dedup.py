@@ -0,0 +1,135 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+from redis import Redis
+
+import app.dedup as dedup
+from app.config import settings
+from app.dedup import (
+    normalize_words, build_shingles, compute_simhash, hamming_distance, split_bands, news_signature,
+    find_or_index_duplicate, SIGNATURE_BITS,
+)
+from app.schemas import NewsItem
+from app.text import EMPTY_SUMMARY
+
+
+def make_news(news_id: str, title: str, summary: str | None = None, source: str = "habr") -> NewsItem:
+    return NewsItem(
+        id=news_id, title=title, summary=summary, url=f"https://example.com/{news_id}",
+        source=source, published_at=datetime(2026, 1, 15, tzinfo=timezone.utc),
+    )
+
+
+def test_normalize_words_stems_title_and_skips_placeholder():
+    news = make_news("a", "OpenAI выпустила новые нейросети!", EMPTY_SUMMARY)
+    assert normalize_words(news) == ["openai", "выпуст", "новые", "нейрос"]
+
+
+def test_normalize_words_adds_summary_to_short_titles_without_repeating_title():
+    news = make_news("a", "Вышел Python", "Вышел Python 3.14 со свободными потоками")
+    assert normalize_words(news) == ["вышел", "python", "14", "со", "свобод", "потока"]
+
+
+def test_build_shingles():
+    assert build_shingles(["a", "b", "c"]) == {"a b", "b c"}
+    assert build_shingles(["a"]) == {"a"}
+    assert build_shingles([]) == set()
+
+
+def test_simhash_is_deterministic_and_order_independent():
+    shingles = {"новый релиз", "релиз python", "python 3"}
+    assert compute_simhash(shingles) == compute_simhash(set(sorted(shingles, reverse=True)))
+    assert 0 <= compute_simhash(shingles) < 2 ** SIGNATURE_BITS
+    assert compute_simhash(set()) == 0
+
+
+def test_word_forms_and_punctuation_give_same_signature():
+    base = news_signature(make_news("a", "Apple представила нейросети для обработки фотографий"))
+    reworded = news_signature(make_news("b", "Apple представила нейросеть для обработки фотографии!"))
+    unrelated = news_signature(make_news("c", "Центробанк сохранил ключевую ставку на прежнем уровне до весны"))
+    assert base == reworded
+    assert hamming_distance(base, unrelated) > settings.dedup_max_distance
+
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b0001) == 2
+    assert hamming_distance(5, 5) == 0
+
+
+def test_split_bands_covers_signature(monkeypatch):
+    monkeypatch.setattr(settings, "dedup_lsh_bands", 4)
+    signature = 0x0123456789ABCDEF
+    bands = split_bands(signature)
+    assert bands == [0xCDEF, 0x89AB, 0x4567, 0x0123]
+    assert sum(band << (i * 16) for i, band in enumerate(bands)) == signature
+
+
+def test_close_signatures_share_a_band(monkeypatch):
+    # Расстояние меньше числа полос — хотя бы одна полоса совпадает целиком
+    monkeypatch.setattr(settings, "dedup_lsh_bands", 4)
+    rng = random.Random(42)
+    for _ in range(200):
+        signature = rng.getrandbits(SIGNATURE_BITS)
+        flipped = signature
+        for bit in rng.sample(range(SIGNATURE_BITS), 3):
+            flipped ^= 1 << bit
+        assert any(a == b for a, b in zip(split_bands(signature), split_bands(flipped)))
+
+
+@pytest.fixture
+def signatures(monkeypatch):
+    """
+    Подменяет сигнатуру новости значением из словаря, чтобы задавать расстояния точно.
+    """
+    values: dict[str, int] = {}
+    monkeypatch.setattr(dedup, "news_signature", lambda news: values[news.id])
+    monkeypatch.setattr(settings, "dedup_lsh_bands", 4)
+    monkeypatch.setattr(settings, "dedup_max_distance", 3)
+    return values
+
+
+def test_first_news_starts_cluster(redis_client, signatures):
+    signatures["a"] = 0xF0F0F0F0F0F0F0F0
+    client = Redis.from_url("redis://test", decode_responses=True)
+    assert find_or_index_duplicate(client, make_news("a", "A")) is None
+    assert redis_client.get("dup:cluster:a") == "a"
+    assert redis_client.get("simhash:a") == "f0f0f0f0f0f0f0f0"
+
+
+def test_duplicate_within_distance_joins_cluster(redis_client, signatures):
+    signatures["a"] = 0xF0F0F0F0F0F0F0F0
+    signatures["b"] = 0xF0F0F0F0F0F0F0F0 ^ 0b111  # расстояние 3
+    client = Redis.from_url("redis://test", decode_responses=True)
+    find_or_index_duplicate(client, make_news("a", "A"))
+    assert find_or_index_duplicate(client, make_news("b", "B", source="vc")) == "a"
+    assert redis_client.smembers("dup:members:a") == {"b"}
+    # Дубликат не становится представителем и не индексируется
+    assert redis_client.get("simhash:b") is None
+
+
+def test_news_beyond_distance_starts_own_cluster(redis_client, signatures):
+    signatures["a"] = 0xF0F0F0F0F0F0F0F0
+    signatures["b"] = 0xF0F0F0F0F0F0F0F0 ^ 0b1111  # расстояние 4, одна полоса общая
+    client = Redis.from_url("redis://test", decode_responses=True)
+    find_or_index_duplicate(client, make_news("a", "A"))
+    assert find_or_index_duplicate(client, make_news("b", "B")) is None
+    assert redis_client.get("dup:cluster:b") == "b"
+
+
+def test_duplicate_of_member_joins_representative(redis_client, signatures):
+    signatures["a"] = 0xF0F0F0F0F0F0F0F0
+    signatures["b"] = signatures["a"] ^ 0b1
+    client = Redis.from_url("redis://test", decode_responses=True)
+    find_or_index_duplicate(client, make_news("a", "A"))
+    find_or_index_duplicate(client, make_news("b", "B"))
+    redis_client.set("dup:cluster:a", "root")
+    signatures["c"] = signatures["a"] ^ 0b10
+    assert find_or_index_duplicate(client, make_news("c", "C")) == "root"
+
+
+def test_empty_signature_is_never_a_duplicate(redis_client, signatures):
+    signatures["a"] = 0
+    client = Redis.from_url("redis://test", decode_responses=True)
+    assert find_or_index_duplicate(client, make_news("a", "!")) is None
+    assert redis_client.get("dup:cluster:a") is None
@@ -0,0 +1,194 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app import api as api_module
+from app.api import api_router, _encode_cursor, _decode_cursor, _etag_matches
+from app.config import settings
+from app.lease import current_lease
+from app.schemas import NewsItem, Post
+from app.tasks import SCRAPE_LEASE
+from app.utils import save_news_item, save_post
+
+BASE = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def api(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "dedup_enabled", False)
+    monkeypatch.setattr(settings, "max_news_items", 50)
+    app = FastAPI()
+    app.include_router(api_router)
+    return TestClient(app)
+
+
+def add_news(news_id: str, minutes_ago: int = 0, source: str = "habr", title: str | None = None) -> NewsItem:
+    news = NewsItem(
+        id=news_id, title=title or f"Новость {news_id}", url=f"https://example.com/{news_id}",
+        source=source, published_at=BASE - timedelta(minutes=minutes_ago),
+    )
+    save_news_item(news)
+    return news
+
+
+def ids(response) -> list[str]:
+    return [item["id"] for item in response.json()]
+
+
+def test_cursor_round_trip():
+    cursor = (1768478400.5, "abc:def")
+    assert _decode_cursor(_encode_cursor(cursor)) == cursor
+
+
+@pytest.mark.parametrize("cursor", ["@@bad", "bm90IGpzb24", "WzFd"])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_etag_matching():
+    etag = 'W/"5-0000abcd"'
+    assert _etag_matches(etag, etag)
+    assert _etag_matches('"5-0000abcd"', etag)
+    assert _etag_matches('W/"4-0000abcd", W/"5-0000abcd"', etag)
+    assert _etag_matches("*", etag)
+    assert not _etag_matches('W/"4-0000abcd"', etag)
+    assert not _etag_matches(None, etag)
+
+
+def test_pages_cover_all_news_once_with_ties(api):
+    # По три новости с одинаковым временем публикации
+    for i in range(10):
+        add_news(f"n{i:02d}", minutes_ago=i // 3)
+    seen, cursor = [], None
+    while True:
+        response = api.get("/news", params={"limit": 4, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        seen += ids(response)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ["n02", "n01", "n00", "n05", "n04", "n03", "n08", "n07", "n06", "n09"]
+
+
+def test_filters(api):
+    add_news("a", minutes_ago=1, source="habr", title="Релиз Python 3.14")
+    add_news("b", minutes_ago=2, source="vc", title="Python в вебе")
+    add_news("c", minutes_ago=90, source="vc", title="Новый iPhone")
+    save_post(Post(id=str(uuid4()), news_id="b", generated_text="Пост", status="published"))
+
+    assert ids(api.get("/news", params={"source": "vc"})) == ["b", "c"]
+    assert ids(api.get("/news", params={"keyword": "PYTHON"})) == ["a", "b"]
+    assert ids(api.get("/news", params={"published": True})) == ["b"]
+    assert ids(api.get("/news", params={"published": False})) == ["a", "c"]
+    assert ids(api.get("/news", params={"since": (BASE - timedelta(hours=1)).isoformat()})) == ["a", "b"]
+
+
+def test_naive_since_is_utc(api):
+    add_news("a", minutes_ago=1)
+    add_news("b", minutes_ago=90)
+    since = (BASE - timedelta(hours=1)).replace(tzinfo=None).isoformat()
+    assert ids(api.get("/news", params={"since": since})) == ["a"]
+
+
+def test_not_modified_until_news_change(api):
+    add_news("a")
+    first = api.get("/news")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    cached = api.get("/news", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    # Другой запрос — другой ETag
+    assert api.get("/news", params={"limit": 1}).headers["ETag"] != etag
+
+    add_news("b")
+    changed = api.get("/news", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert sorted(ids(changed)) == ["a", "b"]
+    assert changed.headers["ETag"] != etag
+
+
+def test_publication_changes_etag(api):
+    add_news("a")
+    etag = api.get("/news").headers["ETag"]
+    save_post(Post(id=str(uuid4()), news_id="a", generated_text="Пост", status="published"))
+    assert api.get("/news", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_expired_news_changes_etag(api, redis_client, monkeypatch):
+    add_news("a")
+    monkeypatch.setattr(settings, "time_life_news", 1)
+    add_news("b")
+    etag = api.get("/news").headers["ETag"]
+    assert api.get("/news", headers={"If-None-Match": etag}).status_code == 304
+
+    time.sleep(1.1)
+    changed = api.get("/news", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert ids(changed) == ["a"]
+    assert redis_client.smembers("news:ids") == {"a"}
+    # ETag ответа описывает список уже без истёкшей новости
+    assert api.get("/news", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 304
+
+
+def test_expiry_index_is_backfilled(api, redis_client):
+    add_news("a")
+    add_news("b")
+    etag = api.get("/news").headers["ETag"]
+    # Новости сохранены до появления индекса сроков, одна из них уже истекла
+    redis_client.delete("news:expires", "news:b")
+    changed = api.get("/news", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert ids(changed) == ["a"]
+    assert redis_client.zrange("news:expires", 0, -1) == ["a"]
+
+
+def test_invalid_cursor_returns_400(api):
+    assert api.get("/news", params={"cursor": "@@bad"}).status_code == 400
+
+
+def test_scrape_waiter_gets_owner_list(api, monkeypatch):
+    # Собранные новости владелец не сохраняет — присоединившийся вызов должен получить их из результата
+    scraped = [
+        NewsItem(id=f"s{i}", title=f"Свежая {i}", url=f"https://example.com/s{i}", source="habr", published_at=BASE)
+        for i in range(3)
+    ]
+    release = threading.Event()
+    calls = []
+
+    def collect():
+        calls.append(1)
+        release.wait(5)
+        return scraped
+
+    monkeypatch.setattr(api_module, "collect_from_all_sources", collect)
+    responses = {}
+
+    def call(name):
+        responses[name] = api.get("/news/scrape")
+
+    owner = threading.Thread(target=call, args=("owner",))
+    owner.start()
+    while current_lease(SCRAPE_LEASE) is None:
+        time.sleep(0.01)
+    waiter = threading.Thread(target=call, args=("waiter",))
+    waiter.start()
+    time.sleep(0.3)
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert len(calls) == 1
+    assert [item["id"] for item in responses["owner"].json()] == ["s0", "s1", "s2"]
+    assert responses["waiter"].json() == responses["owner"].json()
@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import pytest
+
+import app.telegram.publish_queue as publish_queue
+from app.config import settings
+from app.telegram.publish_queue import (
+    create_outbox_entries, discard_outbox_entries, enqueue_publication, get_outbox_entry, publish_now,
+    dispatch_publications, sweep_outbox, outbox_key,
+    STATUS_NEW, STATUS_GENERATED, STATUS_PUBLISHING, STATUS_PUBLISHED, STATUS_FAILED,
+)
+from app.telegram.publisher import AlreadyPublished, PublishOutcomeUnknown
+
+CHANNEL = "@channel"
+
+
+@pytest.fixture
+def sent(redis_client, monkeypatch):
+    """
+    Подменяет отправку в Telegram: записывает ключи идемпотентности отправленных постов.
+    """
+    calls: list[str] = []
+
+    async def fake_publish(text, url=None, channel_id=None, idempotency_key=None):
+        calls.append(idempotency_key)
+        await asyncio.sleep(0.01)
+        return str(len(calls))
+
+    monkeypatch.setattr(publish_queue, "publish_to_channel", fake_publish)
+    monkeypatch.setattr(settings, "publish_queue_min_interval", 20.0)
+    return calls
+
+
+def queue_post(news_id: str = "n1") -> None:
+    assert create_outbox_entries(news_id, [CHANNEL]) == [CHANNEL]
+    assert enqueue_publication(news_id, "Текст поста", "https://example.com", CHANNEL) is not None
+
+
+def test_outbox_entry_is_created_once(redis_client):
+    assert create_outbox_entries("n1", [CHANNEL]) == [CHANNEL]
+    assert create_outbox_entries("n1", [CHANNEL]) == []
+    assert get_outbox_entry("n1", CHANNEL)["status"] == STATUS_NEW
+
+
+def test_no_outbox_entry_for_already_published_channel(redis_client):
+    redis_client.sadd(f"published_news:channel:{CHANNEL}", "n1")
+    assert create_outbox_entries("n1", [CHANNEL, "@other"]) == ["@other"]
+
+
+def test_enqueue_moves_new_to_generated_once(redis_client):
+    create_outbox_entries("n1", [CHANNEL])
+    assert enqueue_publication("n1", "Текст", None, CHANNEL) is not None
+    assert enqueue_publication("n1", "Другой текст", None, CHANNEL) is None
+    entry = get_outbox_entry("n1", CHANNEL)
+    assert entry["status"] == STATUS_GENERATED
+    assert entry["text"] == "Текст"
+
+
+def test_enqueue_requires_outbox_entry(redis_client):
+    assert enqueue_publication("n1", "Текст", None, CHANNEL) is None
+
+
+def test_discard_only_removes_new_entries(redis_client):
+    create_outbox_entries("n1", [CHANNEL])
+    queue_post("n2")
+    discard_outbox_entries("n1", [CHANNEL])
+    discard_outbox_entries("n2", [CHANNEL])
+    assert get_outbox_entry("n1", CHANNEL) == {}
+    assert get_outbox_entry("n2", CHANNEL)["status"] == STATUS_GENERATED
+
+
+def test_claim_is_exclusive_and_finish_checks_token(redis_client):
+    queue_post()
+    client = publish_queue.get_redis_client()
+    job_id = outbox_key("n1", CHANNEL)
+    claimed = publish_queue._claim_job(client, CHANNEL, job_id)
+    assert claimed is not None
+    assert publish_queue._claim_job(client, CHANNEL, job_id) is None
+    assert not publish_queue._finish(client, job_id, "foreign-token", STATUS_PUBLISHED)
+    assert publish_queue._finish(client, job_id, claimed[2], STATUS_PUBLISHED)
+    # Завершённую запись нельзя ни захватить, ни завершить повторно
+    assert publish_queue._claim_job(client, CHANNEL, job_id) is None
+    assert not publish_queue._finish(client, job_id, claimed[2], STATUS_PUBLISHED)
+
+
+def test_concurrent_dispatchers_publish_once(sent):
+    queue_post()
+
+    async def race():
+        await asyncio.gather(
+            publish_now("n1", CHANNEL), publish_now("n1", CHANNEL), dispatch_publications(), dispatch_publications(),
+        )
+
+    asyncio.run(race())
+    assert sent == [outbox_key("n1", CHANNEL)]
+    assert get_outbox_entry("n1", CHANNEL)["status"] == STATUS_PUBLISHED
+
+
+def test_published_entry_is_not_sent_again(sent, redis_client):
+    queue_post()
+    asyncio.run(publish_now("n1", CHANNEL))
+    redis_client.hdel(f"publish:channel:{CHANNEL}", "next_at")
+    asyncio.run(publish_now("n1", CHANNEL))
+    asyncio.run(dispatch_publications())
+    assert len(sent) == 1
+    assert create_outbox_entries("n1", [CHANNEL]) == []
+
+
+def test_already_published_is_recorded_without_resend(sent, monkeypatch):
+    queue_post()
+
+    async def already(*args, **kwargs):
+        raise AlreadyPublished("duplicate random_id")
+
+    monkeypatch.setattr(publish_queue, "publish_to_channel", already)
+    assert asyncio.run(publish_now("n1", CHANNEL))["status"] == STATUS_PUBLISHED
+
+
+def test_unknown_outcome_is_never_retried(sent, redis_client, monkeypatch):
+    queue_post()
+
+    async def unknown(*args, **kwargs):
+        raise PublishOutcomeUnknown("timeout after request was sent")
+
+    monkeypatch.setattr(publish_queue, "publish_to_channel", unknown)
+    assert asyncio.run(publish_now("n1", CHANNEL))["status"] == STATUS_FAILED
+    assert redis_client.zcard(f"publish:queue:{CHANNEL}") == 0
+
+
+def stale_claim(redis_client) -> None:
+    client = publish_queue.get_redis_client()
+    assert publish_queue._claim_job(client, CHANNEL, outbox_key("n1", CHANNEL))
+    redis_client.hset(f"publish:outbox:{outbox_key('n1', CHANNEL)}", "claimed_at", time.time() - 3600)
+
+
+def test_sweep_requeues_stale_send_with_telethon(sent, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "telegram_publisher_backend", "telethon")
+    queue_post()
+    stale_claim(redis_client)
+    assert sweep_outbox()["requeued"] == 1
+    assert get_outbox_entry("n1", CHANNEL)["status"] == STATUS_GENERATED
+    asyncio.run(dispatch_publications())
+    assert len(sent) == 1
+
+
+def test_sweep_fails_stale_send_with_bot_api(sent, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "telegram_publisher_backend", "botapi")
+    queue_post()
+    stale_claim(redis_client)
+    assert sweep_outbox()["failed"] == 1
+    assert get_outbox_entry("n1", CHANNEL)["status"] == STATUS_FAILED
+    asyncio.run(dispatch_publications())
+    assert sent == []
+
+
+def test_sweep_keeps_fresh_claims(sent, redis_client):
+    queue_post()
+    client = publish_queue.get_redis_client()
+    publish_queue._claim_job(client, CHANNEL, outbox_key("n1", CHANNEL))
+    assert sweep_outbox() == {"requeued": 0, "failed": 0, "discarded": 0}
+    assert get_outbox_entry("n1", CHANNEL)["status"] == STATUS_PUBLISHING
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import tasks
+from app.config import settings
+from app.lease import acquire_lease
+from app.publish_schedule import parse_active_hours, get_publish_plan, record_publication, get_publish_state
+from app.schemas import NewsItem
+
+# 12:00 по времени канала (UTC+3)
+NOON = datetime(2026, 1, 15, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def schedule(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "utc_offset", 3)
+    monkeypatch.setattr(settings, "publish_active_hours", "08:00-23:00")
+    monkeypatch.setattr(settings, "news_time", 60)
+    monkeypatch.setattr(settings, "publish_cadence_min_interval", 5)
+    monkeypatch.setattr(settings, "publish_cadence_max_interval", 0)
+    monkeypatch.setattr(settings, "publish_daily_budget", 0)
+    monkeypatch.setattr(settings, "time_life_news", 172800)
+    return redis_client
+
+
+def fill_queue(client, count: int, age: timedelta = timedelta(hours=1)) -> None:
+    for i in range(count):
+        news = NewsItem(
+            id=f"n{i}", title=f"Новость {i}", url=f"https://example.com/{i}", source="habr",
+            published_at=NOON - age,
+        )
+        client.set(f"news:{news.id}", news.model_dump_json())
+        client.zadd("news:ranked", {news.id: float(count - i)})
+
+
+def test_parse_active_hours():
+    assert parse_active_hours("09:00-12:30, 18:00-23:00") == [(32400, 45000), (64800, 82800)]
+    assert parse_active_hours("8-10") == [(28800, 36000)]
+
+
+def test_parse_active_hours_splits_overnight_window():
+    assert parse_active_hours("22:00-02:00") == [(0, 7200), (79200, 86400)]
+
+
+def test_parse_active_hours_defaults_to_whole_day():
+    assert parse_active_hours("") == [(0, 86400)]
+    assert parse_active_hours("bad, 25:00-26:00, 10:00-10:00") == [(0, 86400)]
+    assert parse_active_hours("bad, 10:00-11:00") == [(36000, 39600)]
+
+
+def test_empty_queue_uses_max_interval(schedule):
+    plan = get_publish_plan(NOON)
+    assert plan["interval_seconds"] == 3600
+    assert plan["reason"] == "queue is empty"
+    # С пустой очередью задача срабатывает только в первую минуту интервала
+    assert plan["due"] is True
+    assert get_publish_plan(NOON + timedelta(minutes=5))["due"] is False
+
+
+def test_queue_is_spread_over_remaining_active_hours(schedule):
+    fill_queue(schedule, 100)
+    plan = get_publish_plan(NOON)
+    # 11 часов активного времени на 100 новостей
+    assert plan["active_seconds_left"] == 11 * 3600
+    assert plan["interval_seconds"] == pytest.approx(11 * 3600 / 100, abs=0.1)
+    assert plan["due"] is True
+
+
+def test_interval_is_clamped(schedule):
+    fill_queue(schedule, 3)
+    assert get_publish_plan(NOON)["interval_seconds"] == 3600
+    schedule.delete("news:ranked")
+    fill_queue(schedule, 1000)
+    assert get_publish_plan(NOON)["interval_seconds"] == 5 * 60
+
+
+def test_expiring_news_shorten_interval(schedule, monkeypatch):
+    monkeypatch.setattr(settings, "time_life_news", 3 * 3600)
+    fill_queue(schedule, 10, age=timedelta(hours=1))
+    plan = get_publish_plan(NOON)
+    # Десятая новость истекает через 2 часа — до неё 10 слотов
+    assert plan["interval_seconds"] == pytest.approx(2 * 3600 / 10, abs=0.1)
+    assert plan["reason"] == "queue depth 10, news expire soon"
+
+
+def test_next_slot_counts_from_last_publication(schedule):
+    fill_queue(schedule, 100)
+    record_publication(NOON)
+    assert get_publish_state("2026-01-15") == (NOON.timestamp(), 1)
+    assert get_publish_plan(NOON + timedelta(minutes=2))["due"] is False
+    assert get_publish_plan(NOON + timedelta(minutes=7))["due"] is True
+
+
+def test_outside_active_hours_waits_for_next_window(schedule):
+    fill_queue(schedule, 10)
+    night = datetime(2026, 1, 15, 21, 0, tzinfo=timezone.utc)  # 00:00 по времени канала
+    plan = get_publish_plan(night)
+    assert plan["due"] is False
+    assert plan["reason"] == "outside active hours"
+    assert datetime.fromisoformat(plan["next_at"]) == datetime(2026, 1, 16, 5, 0, tzinfo=timezone.utc)
+
+
+def test_daily_budget_defers_to_next_day(schedule, monkeypatch):
+    monkeypatch.setattr(settings, "publish_daily_budget", 2)
+    fill_queue(schedule, 10)
+    record_publication(NOON - timedelta(hours=2))
+    record_publication(NOON - timedelta(hours=1))
+    plan = get_publish_plan(NOON)
+    assert plan["due"] is False
+    assert plan["budget_left"] == 0
+    assert datetime.fromisoformat(plan["next_at"]) == datetime(2026, 1, 16, 5, 0, tzinfo=timezone.utc)
+
+
+def test_budget_limits_queue_to_spread(schedule, monkeypatch):
+    monkeypatch.setattr(settings, "publish_daily_budget", 11)
+    fill_queue(schedule, 100)
+    # Лимит 11 постов на 11 часов — не чаще раза в час
+    assert get_publish_plan(NOON)["interval_seconds"] == 3600
+
+
+@pytest.fixture
+def scrapes(schedule, monkeypatch):
+    requested = []
+    monkeypatch.setattr(tasks.fetch_and_store_news_task, "delay", lambda: requested.append(1))
+    return requested
+
+
+def test_empty_queue_requests_one_scrape_per_cooldown(schedule, scrapes, monkeypatch):
+    monkeypatch.setattr(settings, "scrape_refill_cooldown", 600)
+    tasks.publish_next_news()
+    # Сбор завершился между тиками — отметка о нём держится всю паузу
+    tasks.finish_scrape_run(acquire_lease(tasks.SCRAPE_LEASE, settings.scrape_lock_ttl))
+    tasks.publish_next_news()
+    assert len(scrapes) == 1
+    assert 0 < schedule.ttl("scrape:requested") <= 600
+    # Пауза истекла — следующий тик снова пополняет очередь
+    schedule.delete("scrape:requested")
+    tasks.publish_next_news()
+    assert len(scrapes) == 2
+
+
+def test_stale_ids_do_not_count_as_queue(schedule, scrapes):
+    fill_queue(schedule, 10)
+    # Семь новостей истекли по TTL, одна опубликована — в очереди остаются две
+    schedule.delete(*[f"news:n{i}" for i in range(7)])
+    schedule.sadd("published_news:ids", "n7")
+    plan = get_publish_plan(NOON)
+    assert plan["queue_depth"] == 2
+    assert schedule.zcard("news:ranked") == 2
+    # Слот ещё не подошёл: тик только пополняет очередь
+    record_publication()
+    assert tasks.publish_next_news().startswith("Next publication")
+    assert len(scrapes) == 1
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.telegram import publisher
+
+
+class FakeSession:
+    def __init__(self, saved: str | None):
+        self.saved = saved
+
+    def save(self) -> str:
+        return self.saved
+
+
+class FakeTelegramClient:
+    created: list["FakeTelegramClient"] = []
+
+    def __init__(self, session, api_id, api_hash, **kwargs):
+        self.session = FakeSession(session)
+        self.connected = False
+        self.signed_in = False
+        FakeTelegramClient.created.append(self)
+
+    async def connect(self):
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def disconnect(self):
+        self.connected = False
+
+    async def is_user_authorized(self) -> bool:
+        return self.session.saved is not None
+
+    async def sign_in(self, bot_token: str):
+        self.signed_in = True
+        self.session.saved = f"auth-{len(FakeTelegramClient.created)}"
+
+
+@pytest.fixture
+def sessions(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "telegram_api_id", 1)
+    monkeypatch.setattr(settings, "telegram_api_hash", "hash")
+    monkeypatch.setattr(settings, "telegram_bot_token", "42:token")
+    monkeypatch.setattr(publisher, "TelegramClient", FakeTelegramClient)
+    monkeypatch.setattr(publisher, "StringSession", lambda saved: saved)
+    FakeTelegramClient.created = []
+    return redis_client
+
+
+def test_concurrent_clients_get_distinct_slots(sessions):
+    first = publisher._claim_session_slot()
+    second = publisher._claim_session_slot()
+    try:
+        assert first[0] == 0 and second[0] == 1
+    finally:
+        for slot, heartbeat in (first, second):
+            heartbeat.stop()
+            publisher.release_lease(publisher._slot_lease(slot), heartbeat.token)
+    # Освобождённый слот достаётся следующему клиенту
+    third = publisher._claim_session_slot()
+    third[1].stop()
+    assert third[0] == 0
+
+
+def test_session_is_saved_per_slot_and_reused(sessions):
+    sessions.hset("telegram:publisher:42", mapping={"session:old-container": "x", "bot_username": "bot"})
+
+    async def connect_and_close():
+        client = await publisher.get_publisher_client()
+        await publisher.close_publisher_client()
+        return client
+
+    first = asyncio.run(connect_and_close())
+    assert first.signed_in
+    state = sessions.hgetall("telegram:publisher:42")
+    # Сессия прежней схемы (по имени хоста) удалена, остальное состояние сохранено
+    assert state == {"session:0": first.session.saved, "bot_username": "bot"}
+    assert not sessions.exists("lease:publisher:session:42:0")
+
+    # Следующий процесс берёт свободный слот и подключается без входа по токену
+    second = asyncio.run(connect_and_close())
+    assert not second.signed_in
+    assert second.session.saved == first.session.saved
+
+
+def test_busy_slot_is_not_shared(sessions):
+    # Два живых цикла — как два процесса пула воркера публикации
+    loops = [asyncio.new_event_loop() for _ in range(2)]
+    try:
+        first, second = (loop.run_until_complete(publisher.get_publisher_client()) for loop in loops)
+        state = sessions.hgetall("telegram:publisher:42")
+        assert set(state) == {"session:0", "session:1"}
+        assert first.session.saved != second.session.saved
+    finally:
+        for loop in loops:
+            loop.run_until_complete(publisher.close_publisher_client())
+            loop.close()
+    assert not sessions.exists("lease:publisher:session:42:0", "lease:publisher:session:42:1")
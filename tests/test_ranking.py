@@ -0,0 +1,106 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.config import settings
+from app.ranking import tokenize, hash_token, news_text, score_news_items, rank_news_queue
+from app.text import STEM_LENGTH, EMPTY_SUMMARY
+from app.schemas import NewsItem
+from app.utils import save_news_item
+
+NOW = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def make_news(news_id: str, title: str, summary: str | None = None, source: str = "habr", hours_ago: float = 0.0) -> NewsItem:
+    return NewsItem(
+        id=news_id, title=title, summary=summary, url=f"https://example.com/{news_id}",
+        source=source, published_at=NOW - timedelta(hours=hours_ago),
+    )
+
+
+def test_tokenize_lowercases_stems_and_drops_single_chars():
+    assert tokenize("Нейросети и НЕЙРОСЕТЬ в C# / Python3") == ["нейрос", "нейрос", "c#", "python"]
+    assert all(len(token) <= STEM_LENGTH for token in tokenize("Программирование интерпретаторов"))
+
+
+def test_hash_token_is_stable_and_within_dim():
+    assert hash_token("нейрос", 4096) == hash_token("нейрос", 4096)
+    assert 0 <= hash_token("python", 16) < 16
+
+
+def test_news_text_ignores_empty_summary_placeholder():
+    assert news_text(make_news("a", "Заголовок", EMPTY_SUMMARY)) == "Заголовок "
+    assert news_text(make_news("a", "Заголовок", "Описание")) == "Заголовок Описание"
+
+
+def test_score_empty_batch():
+    assert score_news_items([], ["python"], now=NOW).shape == (0,)
+
+
+def test_keyword_match_ranks_higher():
+    items = [
+        make_news("plain", "Погода на выходные в Москве"),
+        make_news("match", "Вышел Python 3.14 с новым сборщиком мусора"),
+    ]
+    scores = score_news_items(items, ["python"], now=NOW)
+    assert scores[1] > scores[0]
+
+
+def test_stemming_matches_word_forms():
+    items = [make_news("a", "Новые нейросети для кода"), make_news("b", "Новые библиотеки для кода")]
+    scores = score_news_items(items, ["нейросеть"], now=NOW)
+    assert scores[0] > scores[1]
+
+
+def test_without_keywords_only_freshness_matters():
+    items = [make_news("old", "Одинаковый текст", hours_ago=5), make_news("new", "Одинаковый текст")]
+    scores = score_news_items(items, [], now=NOW)
+    assert scores[1] > scores[0]
+
+
+def test_freshness_decays_by_half_life(monkeypatch):
+    monkeypatch.setattr(settings, "ranking_half_life_hours", 6.0)
+    items = [make_news("new", "Одинаковый текст"), make_news("old", "Одинаковый текст", hours_ago=6)]
+    scores = score_news_items(items, ["текст"], now=NOW)
+    # Ключ в лог-шкале: за один период полураспада релевантность падает вдвое
+    assert scores[0] - scores[1] == pytest.approx(math.log(2.0))
+
+
+def test_future_dates_are_clamped_to_now():
+    items = [make_news("future", "Одинаковый текст", hours_ago=-3), make_news("now", "Одинаковый текст")]
+    scores = score_news_items(items, [], now=NOW)
+    assert scores[0] == pytest.approx(scores[1])
+
+
+def test_scores_do_not_depend_on_scoring_time():
+    items = [make_news("a", "Python и Rust", hours_ago=1), make_news("b", "Новости Rust", hours_ago=3)]
+    early = score_news_items(items, ["python"], now=NOW)
+    late = score_news_items(items, ["python"], now=NOW + timedelta(days=1))
+    assert early == pytest.approx(late)
+
+
+def test_source_weight_scales_relevance(monkeypatch):
+    monkeypatch.setattr(settings, "source_weights", "habr:2.0,tg:news:0.5")
+    items = [
+        make_news("a", "Одинаковый текст", source="habr"),
+        make_news("b", "Одинаковый текст", source="tg:news"),
+        make_news("c", "Одинаковый текст", source="vc"),
+    ]
+    scores = score_news_items(items, ["текст"], now=NOW)
+    assert scores[0] - scores[2] == pytest.approx(math.log(2.0))
+    assert scores[2] - scores[1] == pytest.approx(math.log(2.0))
+
+
+def test_rebuild_ranks_only_news_passing_keyword_filter(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "news_keywords", "python")
+    monkeypatch.setattr(settings, "dedup_enabled", False)
+
+    # В хранилище лежат все собранные новости, в том числе отклонённые фильтром
+    save_news_item(make_news("a", "Вышел Python 3.14"))
+    save_news_item(make_news("b", "Новый смартфон"))
+    save_news_item(make_news("c", "Python и Rust"))
+    redis_client.sadd("published_news:ids", "c")
+
+    assert rank_news_queue() == 1
+    assert redis_client.zrange("news:ranked", 0, -1) == ["a"]
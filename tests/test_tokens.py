@@ -0,0 +1,74 @@
+import pytest
+
+from app.ai.tokens import (
+    estimate_tokens, estimate_messages_tokens, output_tokens_for_chars, truncate_to_tokens, fit_output_tokens,
+    reserved_tokens, get_min_context_tokens, CHARS_PER_TOKEN, COMPLETION_TOKENS_ESTIMATE, MIN_OUTPUT_TOKENS,
+)
+from app.config import settings
+
+
+@pytest.fixture
+def groq_budget(monkeypatch):
+    monkeypatch.setattr(settings, "groq_context_tokens", 1000)
+    monkeypatch.setattr(settings, "groq_max_output_tokens", 300)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 30) == int(30 / CHARS_PER_TOKEN) + 1
+    assert estimate_messages_tokens([{"content": "a" * 30}, {"content": None}]) == (11 + 4) + (0 + 4)
+
+
+def test_output_tokens_for_chars_has_margin():
+    assert output_tokens_for_chars(300) == 200
+    assert output_tokens_for_chars(0) == 0
+
+
+def test_truncate_keeps_short_text():
+    assert truncate_to_tokens("Короткий текст.", 100) == "Короткий текст."
+    assert truncate_to_tokens("", 5) == ""
+
+
+def test_truncate_cuts_at_sentence_boundary():
+    text = "Первое предложение. Второе предложение! Третье предложение?"
+    result = truncate_to_tokens(text, 14)  # до 42 символов
+    assert result == "Первое предложение. Второе предложение!"
+    assert estimate_tokens(result) <= 14
+
+
+def test_truncate_cuts_long_sentence_at_word_boundary():
+    text = "Очень длинное предложение без точек которое не помещается в бюджет целиком"
+    result = truncate_to_tokens(text, 5)  # до 15 символов
+    assert result == "Очень длинное…"
+
+
+def test_truncate_single_long_word():
+    assert truncate_to_tokens("а" * 100, 3) == "а" * 9 + "…"
+
+
+def test_fit_output_tokens_uses_provider_budget(groq_budget):
+    assert fit_output_tokens("groq", prompt_tokens=100) == 300
+    assert fit_output_tokens("groq", prompt_tokens=100, requested=200) == 200
+    assert fit_output_tokens("groq", prompt_tokens=100, requested=5000) == 300
+
+
+def test_fit_output_tokens_shrinks_to_remaining_context(groq_budget):
+    assert fit_output_tokens("groq", prompt_tokens=800) == 200
+    # Даже переполненный контекст оставляет минимальный ответ
+    assert fit_output_tokens("groq", prompt_tokens=990) == MIN_OUTPUT_TOKENS
+    assert fit_output_tokens("groq", prompt_tokens=5000) == MIN_OUTPUT_TOKENS
+
+
+def test_unknown_provider_has_default_budget():
+    assert fit_output_tokens("unknown", prompt_tokens=0) == 2048
+
+
+def test_reserved_tokens_counts_expected_answer():
+    assert reserved_tokens(100, 50) == 150
+    assert reserved_tokens(100, 4096) == 100 + COMPLETION_TOKENS_ESTIMATE
+
+
+def test_min_context_tokens(groq_budget, monkeypatch):
+    monkeypatch.setattr(settings, "openai_context_tokens", 4000)
+    assert get_min_context_tokens(["openai", "groq"]) == 1000
+    assert get_min_context_tokens([]) == 8192